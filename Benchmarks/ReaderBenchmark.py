@@ -0,0 +1,205 @@
+"""Throughput benchmark of the time series readers
+
+Writes synthetic native, segmented and continuous sequences (see
+PhoenixGeoPy.Reader.Synthetic) and measures, for each reader call, the MB/s of
+file data and samples/s it gets through a whole sequence, crossing every file
+boundary, plus the peak memory allocated while doing so.
+
+    python ReaderBenchmark.py --size-mb 200 --files 4 --json results.json
+    python ReaderBenchmark.py --compare results.json --tolerance 0.15
+
+With --compare the run fails (exit status 1) if any benchmark is slower than
+the saved results by more than the tolerance.
+
+Every run also times the cold start of the phoenixgeopy command (a new
+interpreter running phoenixgeopy info --field sample_rate on one file, best of
+--repeat), and fails if it takes longer than --cold-start-budget seconds or
+imports NumPy.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PhoenixGeoPy.Reader.Synthetic import write_native, write_segmented, write_continuous
+from PhoenixGeoPy.Reader.TimeSeries import NativeReader, DecimatedSegmentedReader, DecimatedContinuousReader
+
+FRAMES_PER_SECOND = 1200   # Native frames in one second at 24 kSps
+
+
+def native_read_frames(paths):
+    reader = NativeReader(paths[0], num_files=len(paths))
+    samples = 0
+    out = None
+    while True:
+        data = reader.read_frames(FRAMES_PER_SECOND, out=out)
+        if len(data) == 0:
+            break
+        out = data
+        samples += len(data)
+    reader.close()
+    return samples
+
+
+def native_skip_frames(paths):
+    reader = NativeReader(paths[0], num_files=len(paths))
+    frames = 0
+    while reader.skip_frames(FRAMES_PER_SECOND):
+        frames += FRAMES_PER_SECOND
+    reader.close()
+    return frames * 20
+
+
+def segmented_read_record(paths):
+    reader = DecimatedSegmentedReader(paths[0], num_files=len(paths))
+    samples = 0
+    while True:
+        data = reader.read_record()
+        if len(data) == 0:
+            break
+        samples += len(data)
+    reader.close()
+    return samples
+
+
+def continuous_read_data(paths):
+    reader = DecimatedContinuousReader(paths[0], num_files=len(paths))
+    samples = 0
+    out = None
+    while True:
+        data = reader.read_data(150 * 60, out=out)
+        if len(data) == 0:
+            break
+        out = data
+        samples += len(data)
+    reader.close()
+    return samples
+
+
+BENCHMARKS = [('read_frames', 'bin', native_read_frames),
+              ('skip_frames', 'bin', native_skip_frames),
+              ('read_record', 'td_24k', segmented_read_record),
+              ('read_data', 'td_150', continuous_read_data)]
+
+
+def generate(work_dir, size_mb, num_files):
+    """Write one sequence per format, of about size_mb MB in total each"""
+    file_bytes = size_mb * 2 ** 20 // num_files
+    return {'bin': write_native(os.path.join(work_dir, 'bin'), num_files, file_bytes // 64,
+                                first_frame=(1 << 28) - file_bytes // 64 // 2),
+            'td_24k': write_segmented(os.path.join(work_dir, 'td_24k'), num_files,
+                                      max(1, file_bytes // (32 + 48000 * 4))),
+            'td_150': write_continuous(os.path.join(work_dir, 'td_150'), num_files, file_bytes // 4)}
+
+
+def run(function, paths, repeat):
+    """Best time of repeat runs, then one traced run for the peak memory"""
+    best = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            samples = function(paths)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        function(paths)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    data_bytes = sum(os.path.getsize(path) - 128 for path in paths)
+    return {'seconds': best, 'MB/s': data_bytes / 2 ** 20 / best, 'Msamples/s': samples / 1e6 / best,
+            'peak_MB': peak / 2 ** 20, 'files': len(paths), 'samples': samples}
+
+
+# Run in a new interpreter, exits with status 3 if the command imported NumPy
+COLD_START_SCRIPT = ("import sys\n"
+                     "from PhoenixGeoPy.Reader.Info import main\n"
+                     "status = main(sys.argv[1:])\n"
+                     "sys.exit(3 if 'numpy' in sys.modules else status)\n")
+
+
+def cold_start(path, repeat):
+    """Best wall time of a new interpreter running phoenixgeopy info on path,
+    next to that of a bare interpreter"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'),
+                                                       os.environ.get('PYTHONPATH', '')]))
+    times = {'bare': None, 'info': None}
+    commands = {'bare': [sys.executable, '-c', 'pass'],
+                'info': [sys.executable, '-c', COLD_START_SCRIPT, 'info', '--field', 'sample_rate', path]}
+    status = 0
+    for _ in range(repeat):
+        for name, command in commands.items():
+            start = time.perf_counter()
+            status = max(status, subprocess.run(command, env=env, stdout=subprocess.DEVNULL).returncode)
+            elapsed = time.perf_counter() - start
+            times[name] = elapsed if times[name] is None else min(times[name], elapsed)
+    return {'seconds': times['info'], 'bare_seconds': times['bare'], 'numpy_imported': status == 3,
+            'status': status}
+
+
+def compare(results, baseline, tolerance):
+    """Names of the benchmarks slower than baseline by more than tolerance"""
+    slower = []
+    for name, result in results.items():
+        if name in baseline and result['MB/s'] < baseline[name]['MB/s'] * (1 - tolerance):
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the PhoenixGeoPy readers")
+    parser.add_argument("--size-mb", type=int, default=100, help="size of each synthetic sequence")
+    parser.add_argument("--files", type=int, default=4, help="number of files per sequence")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--work-dir", help="where to write the data, a temporary directory by default")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="results saved by a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--cold-start-budget", type=float, default=0.15,
+                        help="seconds allowed for a phoenixgeopy info run in a new interpreter")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="phoenix_bench_")
+    try:
+        paths = generate(work_dir, args.size_mb, args.files)
+        results = {}
+        print("%-12s %8s %10s %12s %9s" % ("benchmark", "seconds", "MB/s", "Msamples/s", "peak MB"))
+        for name, extension, function in BENCHMARKS:
+            results[name] = run(function, paths[extension], args.repeat)
+            print("%-12s %8.3f %10.1f %12.2f %9.1f" % (name, results[name]['seconds'], results[name]['MB/s'],
+                                                      results[name]['Msamples/s'], results[name]['peak_MB']))
+        startup = cold_start(paths['bin'][0], args.repeat)
+        print("%-12s %8.3f   (bare interpreter %.3f, budget %.3f)" % ("cold_start", startup['seconds'],
+                                                                       startup['bare_seconds'],
+                                                                       args.cold_start_budget))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(dict(results, cold_start=startup), json_file, indent=2)
+    if startup['status']:
+        print("phoenixgeopy info failed" + (" by importing NumPy" if startup['numpy_imported'] else ""))
+        return 1
+    if startup['seconds'] > args.cold_start_budget:
+        print("Cold start over budget: %.3f s > %.3f s" % (startup['seconds'], args.cold_start_budget))
+        return 1
+    if args.compare:
+        with open(args.compare) as json_file:
+            slower = compare(results, json.load(json_file), args.tolerance)
+        if slower:
+            print("Slower than %s: %s" % (args.compare, ", ".join(slower)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Streaming sensor and board response correction of time series of the MTU-5C
+Family
+
+A tabulated frequency response (i.e. of an induction coil, from its
+calibration file, or of the board) is turned into an FIR kernel of its inverse,
+and applied with overlap-save FFT block convolution. The filter keeps its input
+history between calls, so a series can be fed chunk by chunk, across file
+boundaries, and gives the same output as convolving the whole series at once.
+The delay of the kernel is removed: output sample n lines up with input sample
+n, and flush() returns the last ones at the end of the series. Several
+channels, each with its own kernel, are filtered with one batched FFT by
+passing (channels, samples) arrays.
+
+The kernel has num_taps taps, so the response is only followed down to about
+sample_rate / num_taps Hz; correct low frequencies on decimated products.
+
+With the readers scaling to instrument input volts (see DataScaling),
+channel_calibrations gives, from recmeta.json, E channels in mV/km (divided by
+their dipole length) and H channels in nT (divided by the response of their
+coil, taken to be in V/nT).
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import glob
+import json
+from numpy import (angle, asarray, atleast_2d, concatenate, empty, exp, float64, hanning, interp, log, ones,
+                   pi, roll, zeros)
+from numpy.fft import irfft, rfft, rfftfreq
+from numpy.lib.stride_tricks import as_strided
+from PhoenixGeoPy.Reader.Files import recmeta_channels
+from PhoenixGeoPy.Reader.Recording import Recording
+
+_frequency_keys = ('freq_Hz', 'frequency', 'frequencies', 'freq')
+_amplitude_keys = ('magnitude', 'amplitude', 'mag')
+_phase_keys = ('phs_deg', 'phase_deg', 'phase', 'phs')
+
+
+class ResponseTable(object):
+    """Tabulated complex frequency response, interpolated log-log in
+    amplitude and linearly (in log frequency) in phase. Frequencies outside
+    the table take the values at its ends"""
+
+    def __init__(self, freqs, amplitude, phase_deg=None):
+        order = asarray(freqs, dtype=float64).argsort()
+        self.freqs = asarray(freqs, dtype=float64)[order]
+        self.amplitude = asarray(amplitude, dtype=float64)[order]
+        self.phase_deg = zeros(len(order)) if phase_deg is None else asarray(phase_deg, dtype=float64)[order]
+        if (self.freqs <= 0).any() or (self.amplitude <= 0).any():
+            raise ValueError("Response tables need positive frequencies and amplitudes")
+
+    def __call__(self, freqs):
+        log_freqs = log(asarray(freqs, dtype=float64).clip(self.freqs[0], None))
+        amplitude = exp(interp(log_freqs, log(self.freqs), log(self.amplitude)))
+        phase = interp(log_freqs, log(self.freqs), self.phase_deg) * (pi / 180)
+        return amplitude * exp(1j * phase)
+
+
+def _find_columns(value):
+    """First dictionary in a JSON document holding a frequency and an
+    amplitude column"""
+    if isinstance(value, dict):
+        names = [[key for key in keys if key in value] for keys in (_frequency_keys, _amplitude_keys, _phase_keys)]
+        if names[0] and names[1]:
+            return value[names[0][0]], value[names[1][0]], value[names[2][0]] if names[2] else None
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            columns = _find_columns(item)
+            if columns is not None:
+                return columns
+    return None
+
+
+def load_response_table(path):
+    """Read a calibration file: JSON (i.e. Phoenix sensor calibrations, with
+    freq_Hz, magnitude and phs_deg lists) or text with a frequency (Hz),
+    amplitude and optional phase (degrees) per line. Lines that are not
+    numbers, i.e. comments and column titles, are skipped"""
+    with open(path) as cal_file:
+        text = cal_file.read()
+    if text.lstrip().startswith(('{', '[')):
+        columns = _find_columns(json.loads(text))
+        if columns is None:
+            raise ValueError("No frequency/amplitude columns found in %s" % path)
+        return ResponseTable(*columns)
+    rows = []
+    for line in text.splitlines():
+        try:
+            rows.append([float(field) for field in line.replace(',', ' ').split()])
+        except ValueError:
+            continue
+    rows = [row for row in rows if len(row) >= 2]
+    if not rows:
+        raise ValueError("No frequency/amplitude rows found in %s" % path)
+    return ResponseTable([row[0] for row in rows], [row[1] for row in rows],
+                         [row[2] if len(row) > 2 else 0.0 for row in rows])
+
+
+def chain(*responses):
+    """Response of several stages in series (i.e. sensor and board)"""
+    responses = [response for response in responses if response is not None]
+
+    def response(freqs):
+        total = ones(len(freqs), dtype=complex)
+        for stage in responses:
+            total = total * stage(freqs)
+        return total
+    return response
+
+
+def inverse_kernel(response, sample_rate, num_taps=4097, scale=1.0, water_level=1e-3):
+    """Hann windowed FIR kernel of num_taps (odd) taps approximating
+    scale / response, delayed by num_taps // 2 samples. The response is
+    held at water_level times its peak where it is smaller, so that its
+    zeros (i.e. the DC of a coil) are not amplified without bound. A response
+    of None gives a delayed, scaled impulse"""
+    if num_taps % 2 == 0:
+        raise ValueError("The kernel needs an odd number of taps")
+    kernel = zeros(num_taps)
+    if response is None:
+        kernel[num_taps // 2] = scale
+        return kernel
+    values = asarray(response(rfftfreq(num_taps, 1.0 / sample_rate)), dtype=complex)
+    floor = water_level * abs(values).max()
+    small = abs(values) < floor
+    values[small] = floor * exp(1j * angle(values[small]))
+    inverse = scale / values
+    inverse[0] = inverse[0].real
+    kernel = roll(irfft(inverse, num_taps), num_taps // 2)
+    return kernel * hanning(num_taps + 2)[1:-1]
+
+
+class OverlapSave(object):
+    """Stateful FIR filter by overlap-save FFT block convolution
+
+    kernels is (taps,) or (channels, taps), one kernel per row of the
+    (channels, samples) chunks. Each FFT block of nfft samples yields
+    nfft - taps + 1 outputs, all the blocks completed by a chunk are
+    transformed with one batched FFT. The first delay outputs are dropped
+    so that the output lines up with the input, the filter starts from a
+    zero state."""
+
+    def __init__(self, kernels, delay=0, nfft=None):
+        kernels = asarray(kernels, dtype=float64)
+        self.num_taps = kernels.shape[-1]
+        if nfft is None:
+            nfft = 1 << (4 * self.num_taps - 1).bit_length()
+        if nfft < self.num_taps:
+            raise ValueError("The FFT size must be at least the number of taps")
+        self.nfft = nfft
+        self.block = nfft - self.num_taps + 1
+        self.delay = delay
+        self._spectrum = rfft(kernels, nfft)[..., None, :]
+        self.reset()
+
+    def reset(self):
+        self._buffer = None     # Last num_taps - 1 inputs, then the inputs of the next block
+        self._skip = self.delay
+        self._num_in = 0
+        self._num_out = 0
+
+    def process(self, x):
+        """Filter the next chunk, (samples,) or (channels, samples). Returns
+        the output samples completed by it, which lag it by up to one block
+        plus the delay"""
+        x = asarray(x, dtype=float64)
+        if self._buffer is None:
+            self._buffer = zeros(x.shape[:-1] + (self.num_taps - 1,))
+        buf = concatenate([self._buffer, x], axis=-1)
+        self._num_in += x.shape[-1]
+        num_blocks = (buf.shape[-1] - self.num_taps + 1) // self.block
+        out = empty(buf.shape[:-1] + (0,))
+        if num_blocks:
+            strides = buf.strides[:-1] + (buf.strides[-1] * self.block, buf.strides[-1])
+            blocks = as_strided(buf, buf.shape[:-1] + (num_blocks, self.nfft), strides, writeable=False)
+            filtered = irfft(rfft(blocks, axis=-1) * self._spectrum, self.nfft, axis=-1)
+            out = filtered[..., self.num_taps - 1:].reshape(buf.shape[:-1] + (num_blocks * self.block,))
+        self._buffer = buf[..., num_blocks * self.block:].copy()
+        if self._skip:
+            skipped = min(self._skip, out.shape[-1])
+            out = out[..., skipped:]
+            self._skip -= skipped
+        self._num_out += out.shape[-1]
+        return out
+
+    def flush(self):
+        """The outputs still held back, up to the last input sample, and
+        reset the filter for a new series"""
+        missing = self._num_in - self._num_out
+        if self._buffer is None or missing <= 0:
+            self.reset()
+            return empty([0])
+        out = self.process(zeros(self._buffer.shape[:-1] + (missing + self.block,)))[..., :missing]
+        self.reset()
+        return out
+
+
+class ResponseCorrector(OverlapSave):
+    """OverlapSave filter removing a frequency response per channel
+
+    responses is one response (a callable of the frequencies, such as a
+    ResponseTable) for every channel, or a single one for all of them, None
+    for channels that are only scaled. scales multiplies the output of each
+    channel (i.e. to change units)"""
+
+    def __init__(self, sample_rate, responses, scales=1.0, num_taps=4097, nfft=None, water_level=1e-3):
+        single = callable(responses) or responses is None
+        responses = [responses] if single else list(responses)
+        scales = asarray(scales, dtype=float64) * ones(len(responses))
+        kernels = [inverse_kernel(response, sample_rate, num_taps, scale, water_level)
+                   for response, scale in zip(responses, scales)]
+        OverlapSave.__init__(self, kernels[0] if single else kernels, num_taps // 2, nfft)
+
+
+def calibrated_chunks(reader, corrector, chunk_samples=240000):
+    """Generator over the rest of a reader's series, corrected chunk by chunk,
+    ending with what the corrector held back"""
+    chunk_samples -= chunk_samples % 20
+    for chunk in reader.iter_chunks(chunk_samples):
+        out = corrector.process(chunk)
+        if out.shape[-1]:
+            yield out
+    out = corrector.flush()
+    if out.shape[-1]:
+        yield out
+
+
+def find_calibration_file(cal_dir, chan):
+    """Calibration file of the sensor of a recmeta.json channel entry in
+    cal_dir, looked up by serial number, then by type name"""
+    patterns = []
+    if chan.get('serial'):
+        patterns += ['%s_%s.*' % (chan.get('type_name', ''), chan['serial']), '%s.*' % chan['serial'],
+                     '%s[A-Za-z]*.*' % chan['serial']]
+    if chan.get('type_name'):
+        patterns.append('%s.*' % chan['type_name'])
+    for pattern in patterns:
+        found = sorted(glob.glob(os.path.join(cal_dir, pattern)))
+        if found:
+            return found[0]
+    return None
+
+
+def channel_calibrations(rec_dir, tags, cal_dir=None, board=None):
+    """(response, scale, units) of the channels with the given tags of a
+    recording, from its recmeta.json. E channels are scaled from V to mV/km
+    by their dipole length (length1 + length2, in m). H channels are divided
+    by the response of their coil, found in cal_dir, to give nT. board is an
+    optional response applied to every channel. Channels that cannot be
+    calibrated are left in V"""
+    chans = recmeta_channels(rec_dir)
+    calibrations = []
+    for tag in tags:
+        chan = chans.get(tag, {})
+        response, scale, units = board, 1.0, 'V'
+        if chan.get('ty') == 'E' and chan.get('length1', 0) + chan.get('length2', 0) > 0:
+            scale, units = 1e6 / (chan['length1'] + chan['length2']), 'mV/km'
+        elif chan.get('ty') == 'M' and cal_dir is not None:
+            cal_path = find_calibration_file(cal_dir, chan)
+            if cal_path is not None:
+                response, units = chain(load_response_table(cal_path), board), 'nT'
+        calibrations.append((response, scale, units))
+    return calibrations
+
+
+def calibrate_recording(rec_dir, extension='bin', cal_dir=None, board=None, num_files=1, chunk_samples=240000,
+                        num_taps=4097):
+    """Generator over the calibrated (channels, samples) blocks of a whole
+    recording (see Recording), all the channels corrected together. The
+    first item is the list of (tag, units) of the rows"""
+    recording = Recording(rec_dir, extension, num_files)
+    try:
+        tags = recording.channel_names
+        calibrations = channel_calibrations(rec_dir, tags, cal_dir, board)
+        corrector = ResponseCorrector(recording.sample_rate, [response for response, _, _ in calibrations],
+                                      [scale for _, scale, _ in calibrations], num_taps)
+        yield [(tag, units) for tag, (_, _, units) in zip(tags, calibrations)]
+        chunk_samples -= chunk_samples % 20
+        while True:
+            if extension == 'bin':
+                block = recording.read_frames(chunk_samples // 20)
+            else:
+                block = recording.read_data(chunk_samples)
+            if not block.shape[-1]:
+                break
+            out = corrector.process(block)
+            if out.shape[-1]:
+                yield out
+        out = corrector.flush()
+        if out.shape[-1]:
+            yield atleast_2d(out)
+    finally:
+        recording.close()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Streaming FIR decimation of time series of the MTU-5C Family
+
+The decimators keep their filter state between calls, so a series can be fed
+chunk by chunk (i.e. from NativeReader.iter_chunks, across file boundaries) and
+produce exactly the same output as processing the whole series in one call.
+Several channels can be decimated together by passing (channels, samples)
+arrays.
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+from numpy import arange, asarray, concatenate, empty, float64, kaiser, sinc, zeros
+
+
+def design_lowpass(factor, num_taps=None, cutoff=0.8, beta=8.0):
+    """Kaiser windowed-sinc anti-alias filter for decimation by factor
+
+    cutoff is the -6 dB point as a fraction of the output Nyquist frequency.
+    The taps are normalised to unit DC gain."""
+    if num_taps is None:
+        num_taps = 20 * factor + 1
+    n = arange(num_taps) - (num_taps - 1) / 2.0
+    fc = cutoff / factor
+    taps = fc * sinc(fc * n) * kaiser(num_taps, beta)
+    return taps / taps.sum()
+
+
+class PolyphaseDecimator(object):
+    """Stateful FIR filter and downsampler by an integer factor
+
+    Only the output samples that are kept are evaluated, each tap of the
+    filter being applied to the strided input phase it sees (the polyphase
+    form). The filter starts from a zero state, output sample k is
+    sum_j taps[j] * x[k * factor - j].
+    """
+
+    def __init__(self, factor, taps=None):
+        self.factor = int(factor)
+        self.taps = asarray(design_lowpass(self.factor) if taps is None else taps, dtype=float64)
+        self.reset()
+
+    def reset(self):
+        self._history = None   # Last len(taps) - 1 input samples per channel
+        self._offset = 0       # Position in the next chunk of the next output sample
+
+    def _start(self, shape):
+        self._history = zeros(shape[:-1] + (len(self.taps) - 1,))
+
+    def process(self, x):
+        """Filter and decimate the next chunk, x is (samples,) or
+        (channels, samples). Returns the output samples completed by it"""
+        x = asarray(x)
+        if self._history is None:
+            self._start(x.shape)
+        num_history = self._history.shape[-1]
+        buf = concatenate([self._history, x], axis=-1)
+        num_out = 0
+        if x.shape[-1] > self._offset:
+            num_out = (x.shape[-1] - 1 - self._offset) // self.factor + 1
+        out = zeros(x.shape[:-1] + (num_out,))
+        if num_out:
+            first = num_history + self._offset
+            last = first + (num_out - 1) * self.factor + 1
+            for j, tap in enumerate(self.taps):
+                out += tap * buf[..., first - j:last - j:self.factor]
+        self._offset += num_out * self.factor - x.shape[-1]
+        if num_history:
+            self._history = buf[..., buf.shape[-1] - num_history:].copy()
+        return out
+
+
+class DecimationCascade(object):
+    """Several decimators applied one after the other, i.e.
+    DecimationCascade([PolyphaseDecimator(8), PolyphaseDecimator(20)])
+    takes 24 kSps down to 150 Sps"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.factor = 1
+        for stage in self.stages:
+            self.factor *= stage.factor
+
+    @classmethod
+    def for_factors(cls, factors):
+        return cls([PolyphaseDecimator(factor) for factor in factors])
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, x):
+        for stage in self.stages:
+            x = stage.process(x)
+        return x
+
+
+def decimate_stream(chunks, decimator):
+    """Generator applying decimator to every chunk of an iterable (i.e.
+    reader.iter_chunks(n), or a series of (channels, samples) blocks), yielding
+    the decimated chunks that are not empty"""
+    for chunk in chunks:
+        out = decimator.process(chunk)
+        if out.shape[-1]:
+            yield out
+
+
+def decimate(x, decimator):
+    """Decimate a whole array at once, the reference for the streaming result"""
+    decimator.reset()
+    out = decimator.process(x)
+    decimator.reset()
+    return out
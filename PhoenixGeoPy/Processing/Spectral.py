@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Streaming power spectra of time series of the MTU-5C Family
+
+WelchAccumulator consumes a series chunk by chunk, cuts it into overlapping
+windowed segments, transforms all the segments of a chunk with one batched
+FFT, and keeps only the running sum of their power. Memory use depends on the
+segment length, not on the length of the recording. Optional spectrogram tiles
+average a fixed number of consecutive segments each.
+
+The spectra are in the units of the samples squared per Hz, i.e. V^2/Hz for
+readers scaling to volts (see DataScaling).
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+from concurrent.futures import ProcessPoolExecutor
+from numpy import asarray, concatenate, empty, hanning, ones, zeros
+from numpy.fft import rfft, rfftfreq
+from numpy.lib.stride_tricks import as_strided
+from PhoenixGeoPy.Reader.DataScaling import DataScaling
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedSegmentedReader, NativeReader, open_reader
+
+
+def _window(window, nperseg):
+    if window == 'hann':
+        # Periodic Hann window, as used for spectral estimation
+        return hanning(nperseg + 1)[:-1]
+    if window == 'boxcar':
+        return ones(nperseg)
+    window = asarray(window, dtype=float)
+    if window.shape != (nperseg,):
+        raise ValueError("Window must have nperseg samples")
+    return window
+
+
+class WelchAccumulator(object):
+    """Running Welch power spectral density estimate
+
+    nperseg samples per segment, segments advanced by nperseg - noverlap
+    samples (half a segment by default), each detrended by its mean when
+    detrend is True. With tile_segments set, every tile_segments consecutive
+    segments are also averaged into one spectrogram tile, kept in self.tiles
+    or handed to tile_callback(start_segment, psd) instead.
+    """
+
+    def __init__(self, sample_rate, nperseg=4096, noverlap=None, window='hann', detrend=True,
+                 tile_segments=None, tile_callback=None):
+        self.sample_rate = float(sample_rate)
+        self.nperseg = int(nperseg)
+        self.noverlap = self.nperseg // 2 if noverlap is None else int(noverlap)
+        self.step = self.nperseg - self.noverlap
+        if self.step <= 0:
+            raise ValueError("noverlap must be smaller than nperseg")
+        self.window = _window(window, self.nperseg)
+        self.detrend = detrend
+        # One-sided density scaling, doubling all bins but DC and Nyquist
+        self._scale = ones(self.nperseg // 2 + 1) / (self.sample_rate * (self.window ** 2).sum())
+        self._scale[1:(self.nperseg + 1) // 2] *= 2
+        self.tile_segments = tile_segments
+        self.tile_callback = tile_callback
+        self.tiles = []
+        self.freqs = rfftfreq(self.nperseg, 1.0 / self.sample_rate)
+        self._pending = None    # Samples not yet part of a complete segment
+        self._power = None      # Sum of the scaled power of all segments
+        self.num_segments = 0
+        self._tile_power = None
+        self._tile_count = 0
+
+    def break_stream(self):
+        """Forget the samples waiting for a segment, i.e. before a
+        discontinuity such as the start of the next segment of a .td_24k"""
+        self._pending = None
+
+    def update(self, chunk):
+        """Add the next chunk of (samples,) or (channels, samples)"""
+        chunk = asarray(chunk, dtype=float)
+        if self._pending is None:
+            self._pending = empty(chunk.shape[:-1] + (0,))
+        buf = concatenate([self._pending, chunk], axis=-1)
+        num_segments = 0
+        if buf.shape[-1] >= self.nperseg:
+            num_segments = (buf.shape[-1] - self.nperseg) // self.step + 1
+        if num_segments:
+            strides = buf.strides[:-1] + (buf.strides[-1] * self.step, buf.strides[-1])
+            segments = as_strided(buf, buf.shape[:-1] + (num_segments, self.nperseg), strides, writeable=False)
+            self._accumulate(segments)
+        self._pending = buf[..., num_segments * self.step:].copy()
+
+    def _accumulate(self, segments):
+        if self.detrend:
+            segments = segments - segments.mean(axis=-1, keepdims=True)
+        power = abs(rfft(segments * self.window, axis=-1)) ** 2 * self._scale
+        if self._power is None:
+            self._power = zeros(power.shape[:-2] + power.shape[-1:])
+        self._power += power.sum(axis=-2)
+        if self.tile_segments:
+            self._accumulate_tiles(power)
+        self.num_segments += power.shape[-2]
+
+    def _accumulate_tiles(self, power):
+        first = 0
+        while first < power.shape[-2]:
+            count = min(self.tile_segments - self._tile_count, power.shape[-2] - first)
+            tile_sum = power[..., first:first + count, :].sum(axis=-2)
+            self._tile_power = tile_sum if self._tile_power is None else self._tile_power + tile_sum
+            self._tile_count += count
+            first += count
+            if self._tile_count == self.tile_segments:
+                start_segment = self.num_segments + first - self.tile_segments
+                tile = self._tile_power / self.tile_segments
+                if self.tile_callback is not None:
+                    self.tile_callback(start_segment, tile)
+                else:
+                    self.tiles.append(tile)
+                self._tile_power = None
+                self._tile_count = 0
+
+    def result(self):
+        """(frequencies, averaged power spectral density) so far"""
+        if not self.num_segments:
+            raise ValueError("Not enough samples for a single segment")
+        return self.freqs, self._power / self.num_segments
+
+
+def psd_units(reader):
+    """Units of the spectra computed from the samples of a reader"""
+    if isinstance(reader, NativeReader) and reader.data_scaling == DataScaling.AD_in_ADunits:
+        return "AD units^2/Hz"
+    return "V^2/Hz"
+
+
+def welch_reader(reader, nperseg=4096, chunk_samples=None, **welch_args):
+    """Welch PSD of the rest of a reader's series, read chunk by chunk.
+    Segments of a DecimatedSegmentedReader are never joined across segments.
+    Returns (frequencies, psd, accumulator)"""
+    welch = WelchAccumulator(reader.header_info['sample_rate'], nperseg, **welch_args)
+    if isinstance(reader, DecimatedSegmentedReader):
+        while True:
+            data = reader.read_record()
+            if len(data) == 0:
+                break
+            welch.break_stream()
+            welch.update(data)
+    else:
+        if chunk_samples is None:
+            chunk_samples = max(nperseg, 20 * 1024)
+        chunk_samples -= chunk_samples % 20
+        for chunk in reader.iter_chunks(chunk_samples):
+            welch.update(chunk)
+    freqs, psd = welch.result()
+    return freqs, psd, welch
+
+
+def _welch_job(job):
+    job = dict(job)
+    nperseg = job.pop('nperseg', 4096)
+    welch_args = job.pop('welch_args', {})
+    reader = open_reader(job['reader'], job['path'], job.get('num_files', 1))
+    try:
+        freqs, psd, welch = welch_reader(reader, nperseg, **welch_args)
+    finally:
+        reader.close()
+    return freqs, psd, welch.num_segments, psd_units(reader)
+
+
+def welch_runs(runs, nperseg=4096, processes=None, **welch_args):
+    """Welch PSD of several channel sequences in parallel, one process per
+    sequence. runs are dicts with 'reader', 'path' and 'num_files' (such as
+    those returned by Catalog.find). Returns one
+    (frequencies, psd, num_segments, units) tuple per run"""
+    jobs = [{'reader': run['reader'], 'path': run['path'], 'num_files': run.get('num_files', 1),
+             'nperseg': nperseg, 'welch_args': welch_args} for run in runs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_welch_job, jobs))
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Single pass channel statistics and quick-look reports of recordings of the
+MTU-5C Family
+
+Every channel sequence (.bin, .td_24k or .td_150) is streamed once through its
+reader while running accumulators keep the count, min, max, mean and spread of
+the samples, together with the saturated and missing frames found on the way.
+Sequences are processed in parallel on a process pool.
+
+The report of a recording holds, per channel and product, the statistics, the
+values the file headers claim for the same files (min_signal, max_signal,
+saturated_frames, missing_frames) and their differences, plus the channel
+entry of recmeta.json to check them against.
+
+The header min_signal/max_signal are twice the A/D input voltage, so the
+statistics, in instrument input volts, are multiplied by
+2 * total_circuitry_gain to compare them.
+
+A report per recording below a survey root can be written from the command line:
+python -m PhoenixGeoPy.Processing.Statistics <root> [--products bin td_150] [--output-dir DIR]
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from numpy import asarray, float64, maximum, minimum, sqrt
+from PhoenixGeoPy.Reader.Headers import scan_headers
+from PhoenixGeoPy.Reader.Files import channel_files, channel_tags, recmeta_channels, sequence_length
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedSegmentedReader, NativeReader, open_reader, reader_class_name
+
+PRODUCTS = ('bin', 'td_24k', 'td_150')
+
+
+class RunningStatistics(object):
+    """Count, min, max, mean and variance of a stream of (samples,) or
+    (channels, samples) chunks
+
+    Each chunk is reduced with vectorized NumPy calls and combined with the
+    running values using the pairwise update of Chan et al., which keeps the
+    variance accurate over billions of samples."""
+
+    def __init__(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self._m2 = None     # Sum of the squared differences from the mean
+
+    def update(self, chunk):
+        chunk = asarray(chunk)
+        if chunk.shape[-1] == 0:
+            return
+        mean = chunk.mean(axis=-1, dtype=float64)
+        centred = chunk - (mean[..., None] if chunk.ndim > 1 else mean)
+        m2 = (centred * centred).sum(axis=-1, dtype=float64)
+        self._combine(chunk.shape[-1], chunk.min(axis=-1), chunk.max(axis=-1), mean, m2)
+
+    def merge(self, other):
+        """Add the samples accumulated by another RunningStatistics"""
+        if other.count:
+            self._combine(other.count, other.min, other.max, other.mean, other._m2)
+
+    def _combine(self, count, chunk_min, chunk_max, mean, m2):
+        if not self.count:
+            self.count, self.min, self.max, self.mean, self._m2 = count, chunk_min, chunk_max, mean, m2
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / float(total))
+        self._m2 = self._m2 + m2 + delta * delta * (self.count * count / float(total))
+        self.min = minimum(self.min, chunk_min)
+        self.max = maximum(self.max, chunk_max)
+        self.count = total
+
+    @property
+    def variance(self):
+        return self._m2 / self.count
+
+    @property
+    def rms(self):
+        return sqrt(self.mean * self.mean + self.variance)
+
+    def result(self):
+        """Dictionary of count, min, max, mean, std and rms, floats for a
+        single series or lists for several channels"""
+        values = {'count': self.count}
+        if self.count:
+            for name, value in (('min', self.min), ('max', self.max), ('mean', self.mean),
+                                ('std', sqrt(self.variance)), ('rms', self.rms)):
+                values[name] = asarray(value, dtype=float64).tolist()
+        return values
+
+
+def sequence_statistics(reader, chunk_samples=240000):
+    """Stream the rest of a reader's series once. Returns a dictionary with
+    the sample statistics and the saturation/missing counts found: frames for
+    native series, the sums of the segment subheader counts for segmented
+    ones, nothing for continuous ones"""
+    stats = RunningStatistics()
+    counts = {}
+    if isinstance(reader, NativeReader):
+        counts = {'saturated_frames': 0, 'missing_frames': 0}
+
+        def count_events(_, events):
+            counts['saturated_frames'] += int((events['sat_count'] != 0).sum())
+            counts['missing_frames'] += int(events['gap'][events['gap'] > 0].sum())
+        reader.report_hw_sat = True
+        reader.event_callback = count_events
+        for chunk in reader.iter_chunks(chunk_samples - chunk_samples % 20):
+            stats.update(chunk)
+    elif isinstance(reader, DecimatedSegmentedReader):
+        counts = {'segments': 0, 'segment_sat_count': 0, 'segment_miss_count': 0}
+        while True:
+            data = reader.read_record()
+            if len(data) == 0:
+                break
+            stats.update(data)
+            counts['segments'] += 1
+            counts['segment_sat_count'] += reader.subheader['satCount']
+            counts['segment_miss_count'] += reader.subheader['missCount']
+    else:
+        for chunk in reader.iter_chunks(chunk_samples):
+            stats.update(chunk)
+    result = stats.result()
+    result.update(counts)
+    return result
+
+
+def _header_summary(paths):
+    headers = scan_headers(paths)
+    return {'min_signal': float(headers.min_signal.min()),
+            'max_signal': float(headers.max_signal.max()),
+            'saturated_frames': int(headers.saturated_frames.sum()),
+            'missing_frames': int(headers.missing_frames.sum())}
+
+
+def _drift(stats, header, signal_scale):
+    """Differences between the streamed statistics and the header values"""
+    drift = {}
+    if stats['count']:
+        drift['min_signal'] = stats['min'] * signal_scale - header['min_signal']
+        drift['max_signal'] = stats['max'] * signal_scale - header['max_signal']
+    for name in ('saturated_frames', 'missing_frames'):
+        if name in stats:
+            drift[name] = stats[name] - header[name]
+    return drift
+
+
+def _statistics_job(job):
+    reader = open_reader(job['reader'], job['path'], job['num_files'])
+    try:
+        stats = sequence_statistics(reader, job.get('chunk_samples', 240000))
+        paths = reader.sequence_paths()
+        header = _header_summary(paths)
+        signal_scale = 2 * reader.total_circuitry_gain
+        result = {'path': job['path'], 'num_files': len(paths), 'sample_rate': reader.header_info['sample_rate'],
+                  'channel_type': reader.channel_type, 'stats': stats, 'header': header,
+                  'drift': _drift(stats, header, signal_scale)}
+        if isinstance(reader, NativeReader) and stats['count']:
+            # Extremes in A/D counts, as in the chans of recmeta.json
+            ad_scale = 1.0 / (reader._scale_factor * 256)
+            result['ad_min'] = int(round(stats['min'] * ad_scale))
+            result['ad_max'] = int(round(stats['max'] * ad_scale))
+    finally:
+        reader.close()
+    return result
+
+
+def recording_jobs(rec_dir, products=PRODUCTS, chunk_samples=240000):
+    """One job per channel and product found in a recording directory"""
+    jobs = []
+    tags = channel_tags(rec_dir)
+    # By channel, then in the order of products
+    found = sorted((ch_id, product, extension, path) for product, extension in enumerate(products)
+                   for ch_id, path in channel_files(rec_dir, extension))
+    for ch_id, _, extension, path in found:
+        jobs.append({'rec_dir': rec_dir, 'ch_id': ch_id, 'tag': tags.get(ch_id, str(ch_id)),
+                     'extension': extension, 'reader': reader_class_name(extension), 'path': path,
+                     'num_files': sequence_length(path), 'chunk_samples': chunk_samples})
+    return jobs
+
+
+def _report(rec_dir, jobs, results):
+    recmeta = recmeta_channels(rec_dir)
+    channels = []
+    for job, result in zip(jobs, results):
+        entry = {'ch_id': job['ch_id'], 'tag': job['tag'], 'extension': job['extension']}
+        entry.update(result)
+        chan = recmeta.get(job['tag'])
+        if chan is not None:
+            entry['recmeta'] = dict((key, chan[key]) for key in ('min', 'max', 'frameSat', 'frameDrop', 'sampleRate')
+                                    if key in chan)
+        channels.append(entry)
+    return {'rec_dir': rec_dir, 'channels': channels}
+
+
+def survey_reports(root, products=PRODUCTS, processes=None, chunk_samples=240000):
+    """Reports of every recording below root, with the sequences of all of
+    them spread over one process pool. Returns a list of report dictionaries"""
+    recordings = []
+    for dir_path, dir_names, _ in os.walk(root):
+        dir_names.sort()
+        if any(name.isdigit() for name in dir_names):
+            jobs = recording_jobs(dir_path, products, chunk_samples)
+            if jobs:
+                recordings.append((dir_path, jobs))
+    all_jobs = [job for _, jobs in recordings for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = iter(list(pool.map(_statistics_job, all_jobs)))
+    return [_report(rec_dir, jobs, [next(results) for _ in jobs]) for rec_dir, jobs in recordings]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Channel statistics report of every recording below a root")
+    parser.add_argument("root", help="survey or recording directory")
+    parser.add_argument("--products", nargs='+', default=list(PRODUCTS))
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--output-dir", default='.', help="where to write <recording>_stats.json")
+    args = parser.parse_args(argv)
+    for report in survey_reports(args.root, args.products, args.processes):
+        name = os.path.basename(os.path.normpath(report['rec_dir']))
+        with open(os.path.join(args.output_dir, name + '_stats.json'), 'w') as report_file:
+            json.dump(report, report_file, indent=1)
+        print("%s: %d sequences" % (name, len(report['channels'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+__all__ = ["Decimation", "Spectral", "Statistics", "Calibration"]
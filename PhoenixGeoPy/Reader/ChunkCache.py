@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Process-wide cache of decoded chunks of the time series files of the MTU-5C
+Family
+
+Random access reads (NativeReader.read_frames_at and everything built on it,
+i.e. read_samples_at, read_time_range and Recording.RecordingArray, and
+DecimatedSegmentedReader.read_segment) keep what they decode here, so that
+looking at the same part of a recording again is served from memory instead
+of decoding the 24 bit frames or reading the float32 segment again.
+
+Chunks are keyed by (file, chunk, scaling) and evicted least recently used
+first once the byte budget is exceeded. Every lookup checks the size and mtime
+of the file, and the chunks of a file that changed (i.e. one still being
+recorded) are dropped. Cached chunks are read-only arrays shared by every
+reader of the process.
+
+i.e.
+    CACHE.resize(1024 * 2 ** 20)
+    ...
+    print(CACHE.stats())
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class ChunkCache(object):
+    """Least recently used cache of decoded chunks with a byte budget"""
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self._chunks = OrderedDict()    # key -> read-only array
+        self._files = {}                # path -> (size, mtime_ns) of the cached chunks
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def get(self, key, loader):
+        """Chunk key = (path, ...), calling loader() to decode it on a miss.
+        Chunks larger than the whole budget are returned without caching"""
+        path = key[0]
+        stat = os.stat(path)
+        version = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if self._files.get(path, version) != version:
+                self._purge(path)
+                self.invalidations += 1
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return chunk
+            self.misses += 1
+        # Decoded outside of the lock, so that other threads are not held up
+        chunk = loader()
+        chunk.setflags(write=False)
+        if chunk.nbytes > self.max_bytes:
+            return chunk
+        with self._lock:
+            if key not in self._chunks:
+                self._chunks[key] = chunk
+                self._files[path] = version
+                self.bytes += chunk.nbytes
+                self._evict(self.max_bytes)
+        return chunk
+
+    def _purge(self, path):
+        for key in [key for key in self._chunks if key[0] == path]:
+            self.bytes -= self._chunks.pop(key).nbytes
+        self._files.pop(path, None)
+
+    def _evict(self, max_bytes):
+        while self.bytes > max_bytes and self._chunks:
+            _, chunk = self._chunks.popitem(last=False)
+            self.bytes -= chunk.nbytes
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        """Change the byte budget, evicting chunks if it shrinks"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict(max_bytes)
+
+    def clear(self, path=None):
+        """Drop every chunk, or only those of one file"""
+        with self._lock:
+            if path is None:
+                self._chunks.clear()
+                self._files.clear()
+                self.bytes = 0
+            else:
+                self._purge(path)
+
+    def stats(self):
+        """Hits, misses, evictions, invalidations, size and hit ratio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'chunks': len(self._chunks),
+                    'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hit_ratio': self.hits / lookups if lookups else None}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+
+# Shared by every reader unless given their own (reader.cache), or None to disable
+CACHE = ChunkCache()
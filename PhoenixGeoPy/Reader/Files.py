@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Naming and directory layout of the time series files and recordings of the
+MTU-5C Family
+
+A recording directory (i.e. 10128_2021-04-27-025909/) holds a recmeta.json and
+one subdirectory per channel, named after the channel id, with the files of
+every product of the channel named <inst>_<rec>_<ch>_<seq>.<ext>. These helpers
+only use the standard library, so that metadata tools (see Info) can find
+their way around a recording without importing NumPy. TimeSeries and Recording
+re-export them.
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import json
+
+# Decimated products stored as bursts of segments, each with its own subheader
+SEGMENTED_EXTENSIONS = ('td_24k',)
+
+
+def parse_file_name(path):
+    """Split a time series file name <inst>_<rec>_<ch>_<seq>.<ext> into its
+    parts, returns (inst_id, rec_id, ch_id, seq, extension) with the sequence
+    number as an integer and the other parts as strings"""
+    file_name_base, file_extension = os.path.basename(path).split(".", 2)
+    file_parts = file_name_base.split("_")
+    return file_parts[0], file_parts[1], file_parts[2], int(file_parts[3], base=16), file_extension
+
+
+def is_series_file(name):
+    """True for names of time series files, False for sidecars and others"""
+    base, _, extension = name.partition('.')
+    parts = base.split('_')
+    if not extension or '.' in extension or len(parts) != 4:
+        return False
+    try:
+        int(parts[3], 16)
+    except ValueError:
+        return False
+    return True
+
+
+def read_recmeta(rec_dir):
+    """Contents of the recmeta.json of a recording, None if it is missing or
+    not valid JSON"""
+    try:
+        with open(os.path.join(rec_dir, 'recmeta.json')) as recmeta_file:
+            return json.load(recmeta_file)
+    except (OSError, ValueError):
+        return None
+
+
+def channel_tags(rec_dir):
+    """Map of channel id to channel tag (i.e. {0: 'H2', 1: 'E1'}) read from the
+    recmeta.json of a recording, empty if it is not available"""
+    tags = {}
+    try:
+        for mapping in read_recmeta(rec_dir)['channel_map']['mapping']:
+            tags[int(mapping['idx'])] = mapping['tag']
+    except (TypeError, ValueError, KeyError):
+        pass
+    return tags
+
+
+def recmeta_channels(rec_dir):
+    """Channel entries (chconfig chans) of the recmeta.json of a recording by
+    tag, empty if it is not available"""
+    try:
+        return dict((chan['tag'], chan) for chan in read_recmeta(rec_dir)['chconfig']['chans'])
+    except (TypeError, KeyError):
+        return {}
+
+
+def first_file(ch_dir, extension):
+    """Path of the file with the lowest sequence number and the given
+    extension in a channel directory, or None"""
+    candidates = [name for name in os.listdir(ch_dir)
+                  if name.endswith('.' + extension) and name.split('.')[0].count('_') == 3]
+    if not candidates:
+        return None
+    return os.path.join(ch_dir, min(candidates, key=lambda name: int(name.split('.')[0].split('_')[3], 16)))
+
+
+def sequence_length(path):
+    """Number of consecutive files of the sequence starting at path"""
+    inst_id, rec_id, ch_id, seq, extension = parse_file_name(path)
+    ch_dir = os.path.dirname(path)
+    num_files = 0
+    while os.path.exists(os.path.join(ch_dir, "%s_%s_%s_%08X.%s" % (inst_id, rec_id, ch_id, seq + num_files,
+                                                                    extension))):
+        num_files += 1
+    return num_files
+
+
+def channel_files(rec_dir, extension, channels=None):
+    """(channel id, first file) of every channel directory of a recording
+    holding files with the given extension, optionally restricted to the
+    channel ids in channels"""
+    found = []
+    for name in sorted(os.listdir(rec_dir)):
+        ch_dir = os.path.join(rec_dir, name)
+        if not name.isdigit() or not os.path.isdir(ch_dir):
+            continue
+        if channels is not None and int(name) not in channels:
+            continue
+        path = first_file(ch_dir, extension)
+        if path is not None:
+            found.append((int(name), path))
+    return found
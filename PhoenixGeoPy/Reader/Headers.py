@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""Layout of the 128 byte file header and the 32 byte segment subheader of the
+time series formats of the MTU-5C Family
+
+The layouts are defined once and turned into a precompiled struct, used to
+parse one header with a single call, and into NumPy structured dtypes, used to
+parse many headers or subheaders at once (see scan_headers).
+
+NumPy is only imported when one of the dtypes (HEADER_DTYPE, SUBHEADER_DTYPE,
+SCAN_DTYPE) or a function working on arrays is first used, so that tools that
+only parse single headers (see Info) start without it.
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import string
+from struct import Struct
+
+# name, struct format, byte offset
+_header_layout = [('file_type', 'B', 0),
+                  ('file_version', 'B', 1),
+                  ('length', 'H', 2),
+                  ('inst_type', '8s', 4),
+                  ('inst_serial', '8s', 12),
+                  ('rec_id', 'I', 20),
+                  ('ch_id', 'B', 24),
+                  ('file_sequence', 'I', 25),
+                  ('frag_period', 'H', 29),
+                  ('ch_hwv', '8s', 31),
+                  ('ch_ser', '8s', 39),
+                  ('ch_fir', 'I', 47),
+                  ('conf_fp', '8B', 51),
+                  ('sample_rate_base', 'H', 59),
+                  ('sample_rate_exp', 'b', 61),
+                  ('bytes_per_sample', 'B', 62),
+                  ('frame_size', 'I', 63),
+                  ('decimation_node_id', 'H', 67),
+                  ('frame_rollover_count', 'H', 69),
+                  ('gps_long', 'f', 71),
+                  ('gps_lat', 'f', 75),
+                  ('gps_height', 'f', 79),
+                  ('gps_hacc', 'I', 83),
+                  ('gps_vacc', 'I', 87),
+                  ('timing_flags', 'B', 91),
+                  ('timing_sat_count', 'B', 92),
+                  ('timing_stability', 'H', 93),
+                  ('future1', 'b', 95),
+                  ('future2', 'i', 97),
+                  ('saturated_frames', 'H', 101),
+                  ('missing_frames', 'H', 103),
+                  ('battery_voltage_mV', 'H', 105),
+                  ('min_signal', 'f', 107),
+                  ('max_signal', 'f', 111)]
+HEADER_SIZE = 128
+# Names of the header fields in the order of the layout (and of HEADER_STRUCT values)
+HEADER_FIELDS = tuple(name for name, _, _ in _header_layout)
+
+_subheader_layout = [('timestamp', 'I', 0),
+                     ('samplesInRecord', 'I', 4),
+                     ('satCount', 'H', 8),
+                     ('missCount', 'H', 10),
+                     ('minVal', 'f', 12),
+                     ('maxVal', 'f', 16),
+                     ('avgVal', 'f', 20)]
+SUBHEADER_SIZE = 32
+
+_numpy_formats = {'B': 'u1', 'b': 'i1', 'H': '<u2', 'I': '<u4', 'i': '<i4', 'f': '<f4', '8s': 'S8', '8B': ('u1', 8)}
+
+
+def _layout_struct(layout, size):
+    fmt = '<'
+    position = 0
+    for _, field_fmt, offset in layout:
+        fmt += 'x' * (offset - position) + field_fmt
+        position = offset + Struct('<' + field_fmt).size
+    return Struct(fmt + 'x' * (size - position))
+
+
+def _layout_dtype(layout, size):
+    from numpy import dtype
+    return dtype({'names': [name for name, _, _ in layout],
+                  'formats': [_numpy_formats[field_fmt] for _, field_fmt, _ in layout],
+                  'offsets': [offset for _, _, offset in layout],
+                  'itemsize': size})
+
+
+HEADER_STRUCT = _layout_struct(_header_layout, HEADER_SIZE)
+SUBHEADER_STRUCT = _layout_struct(_subheader_layout, SUBHEADER_SIZE)
+
+# Attributes of ChannelConfig that the readers copy when unpacking a header
+CONFIG_ATTRIBUTES = ('board_model_main', 'board_model_revision', 'channel_type', 'detected_channel_type',
+                     'preamp_gain', 'lpf_Hz', 'channel_main_gain', 'intrinsic_circuitry_gain', 'attenuator_gain',
+                     'total_selectable_gain', 'total_circuitry_gain')
+
+
+class ChannelConfig(object):
+    """Board configuration decoded from the configuration fingerprint and the
+    hardware version of a channel"""
+
+    def __init__(self, config_fp, ch_hwv):
+        self.ch_hwv = ch_hwv
+        self.board_model_main = ch_hwv[0:5]
+        self.board_model_revision = ch_hwv[6:1]
+        self.channel_type = "?"           # "E" or "H"
+        self.channel_main_gain = None     # The value of the main gain of the board
+        self.intrinsic_circuitry_gain = None  # Circuitry Gain not directly configurable by the user
+        self.lpf_Hz = None                   # Nominal cutoff freq of the configured LPF of the channel
+        self.preamp_gain = 1.0
+        self.attenuator_gain = 1.0
+        # Channel type
+        self._populate_channel_type(config_fp)
+        # Electric channel Preamp
+        self._popuate_peamp_gain(config_fp)
+        # LPF
+        self._populate_lpf(config_fp)
+        # Main Gain Stage
+        self._populate_main_gain(config_fp)
+        # Sensor range
+        self._handle_sensor_range(config_fp)
+        # Electric channel attenuator
+        self._populate_attenuator_gain(config_fp)
+        # Board-wide gains
+        self.total_selectable_gain = self.channel_main_gain * self.preamp_gain * self.attenuator_gain
+        self.total_circuitry_gain = self.total_selectable_gain * self.intrinsic_circuitry_gain
+
+    def _populate_channel_type(self, config_fp):
+        if config_fp[1] & 0x08 == 0x08:
+            self.channel_type = "E"
+        else:
+            self.channel_type = "H"
+        # Channel type detected by electronics
+        # this normally matches self.channel_type, but used in electronics design and testing
+        if config_fp[1] & 0x20 == 0x20:
+            self.detected_channel_type = 'E'
+        else:
+            self.detected_channel_type = 'H'
+
+    def _populate_lpf(self, config_fp):
+        if config_fp[0] & 0x80 == 0x80:            # LPF on
+            if config_fp[0] & 0x03 == 0x03:
+                self.lpf_Hz = 10
+            elif config_fp[0] & 0x03 == 0x02:
+                if (self.board_model_main == "BCM03" or self.board_model_main == "BCM06"):
+                    self.lpf_Hz = 1000
+                else:
+                    self.lpf_Hz = 100
+            elif config_fp[0] & 0x03 == 0x01:
+                if (self.board_model_main == "BCM03" or self.board_model_main == "BCM06"):
+                    self.lpf_Hz = 10000
+                else:
+                    self.lpf_Hz = 1000
+        else:                                      # LPF off
+            if (self.board_model_main == "BCM03" or self.board_model_main == "BCM06"):
+                self.lpf_Hz = 17800
+            else:
+                self.lpf_Hz = 10000
+
+    def _popuate_peamp_gain(self, config_fp):
+        if self.channel_type == "?":
+            raise Exception("Channel type must be set before attemting to calculate preamp gain")
+        preamp_on = bool(config_fp[0] & 0x10)
+        self.preamp_gain = 1.0
+        if self.channel_type == "E":
+            if preamp_on is True:
+                if self.board_model_main == "BCM01" or self.board_model_main == "BCM03":
+                    self.preamp_gain = 4.0
+                    if (self.board_model_revision == "L"):
+                        #Account for BCM01-L experimental prototype
+                        self.preamp_gain = 8.0
+                else:
+                    self.preamp_gain = 8.0
+                    # Acount for experimental prototype BCM05-A
+                    if self.ch_hwv[0:7] == "BCM05-A":
+                        self.preamp_gain = 4.0
+    
+    def _populate_main_gain(self, config_fp):
+        # BCM05-B and BCM06 introduced different selectable gains
+        new_gains = True   # we asume any newer board will have the new gain banks
+        if self.board_model_main == "BCM01" or self.board_model_main == "BCM03":
+            # Original style 24 KSps boards and original 96 KSps boards
+            new_gains = False
+        if self.ch_hwv[0:7] == "BCM05-A":
+            # Acount for experimental prototype BCM05-A, which also had original gain banks
+            new_gains = False
+        if config_fp[0] & 0x0C == 0x00:
+            self.channel_main_gain = 1.0
+        elif config_fp[0] & 0x0C == 0x04:
+            self.channel_main_gain = 4.0
+        elif config_fp[0] & 0x0C == 0x08:
+            self.channel_main_gain = 6.0
+            if not new_gains:
+                self.channel_main_gain = 16.0
+        elif config_fp[0] & 0x0C == 0x0C:
+            self.channel_main_gain = 8.0
+            if not new_gains:
+                self.channel_main_gain = 32.0
+
+    def _handle_sensor_range(self, config_fp):
+        """This function will adjust the intrinsic circuitry gain based on the
+           sensor range configuration in the configuration fingerprint
+           
+           For this, we consider that for the Electric channel, calibration path, or H-legacy
+           sensors all go through a 1/4 gain stage, and then they get a virtial x2 gain from
+           Single-ended-diff before the A/D. In the case of newer sensors (differential)
+           instead of a 1/4 gain stage, there is only a 1/2 gain stage
+           
+           Therefore, in the E,cal and legacy sensor case the circuitry gain is 1/2, while for
+           newer sensors it is 1
+           """
+        if self.channel_type == "?":
+            raise Exception("Channel type must be set before attemting to calculate preamp gain")
+        self.intrinsic_circuitry_gain = 0.5   
+        if self.channel_type == "H":
+            if config_fp[1] & 0x01 == 0x01:
+                self.intrinsic_circuitry_gain = 1.0
+
+    def _populate_attenuator_gain(self, config_fp):
+        self.attenuator_gain = 1.0    # Asume attenuator off
+        if self.channel_type == "?":
+            raise Exception("Channel type must be set before attemting to calculate preamp gain")
+        attenuator_on = bool(config_fp[4] & 0x01)
+        if attenuator_on and self.channel_type == "E":
+            new_attenuator = True  # By default assume that we are dealing with a newer types of boards
+            if self.board_model_main == "BCM01" or self.board_model_main == "BCM03":
+                # Original style 24 KSps boards and original 96 KSps boards
+                new_attenuator = False
+            if self.ch_hwv[0:7] == "BCM05-A":
+                # Acount for experimental prototype BCM05-A, which also had original gain banks
+                new_attenuator = False
+
+            if new_attenuator:
+                self.attenuator_gain = 523.0 / 5223.0
+            else:
+                self.attenuator_gain = 0.1
+
+
+
+def parse_header(data):
+    """Parse a 128 byte file header into the header_info dictionary used by
+    the readers, with a single struct call"""
+    fields = dict(zip(HEADER_FIELDS, _unpack_conf_fp(HEADER_STRUCT.unpack_from(data))))
+    header_info = {}
+    header_info['file_type'] = fields['file_type']
+    header_info['file_version'] = fields['file_version']
+    header_info['length'] = fields['length']
+    header_info['inst_type'] = fields['inst_type'].decode("utf-8").strip(' ').strip('\x00')
+    header_info['inst_serial'] = fields['inst_serial'].strip(b'\x00')
+    header_info['rec_id'] = fields['rec_id']
+    header_info['ch_id'] = fields['ch_id']
+    header_info['file_sequence'] = fields['file_sequence']
+    header_info['frag_period'] = fields['frag_period']
+    header_info['ch_hwv'] = fields['ch_hwv'].decode("utf-8").strip(' ')
+    header_info['ch_ser'] = fields['ch_ser'].decode("utf-8").strip('\x00')
+    # handle the case of backend < v0.14, which puts '--------' in ch_ser
+    if all(chars in string.hexdigits for chars in header_info['ch_ser']):
+        header_info['ch_ser'] = int(header_info['ch_ser'], 16)
+    else:
+        header_info['ch_ser'] = 0
+    header_info['ch_fir'] = hex(fields['ch_fir'])
+    header_info['conf_fp'] = fields['conf_fp']
+    header_info['sample_rate_base'] = fields['sample_rate_base']
+    header_info['sample_rate_exp'] = fields['sample_rate_exp']
+    header_info['sample_rate'] = header_info['sample_rate_base']
+    if header_info['sample_rate_exp'] != 0:
+        header_info['sample_rate'] *= pow(10, header_info['sample_rate_exp'])
+    for name in ('bytes_per_sample', 'frame_size', 'decimation_node_id', 'frame_rollover_count',
+                 'gps_long', 'gps_lat', 'gps_height', 'gps_hacc', 'gps_vacc'):
+        header_info[name] = fields[name]
+    header_info['timing_status'] = (fields['timing_flags'], fields['timing_sat_count'], fields['timing_stability'])
+    header_info['timing_flags'] = fields['timing_flags']
+    header_info['timing_sat_count'] = fields['timing_sat_count']
+    header_info['timing_stability'] = fields['timing_stability']
+    header_info['future1'] = fields['future1']
+    header_info['future2'] = fields['future2']
+    header_info['saturated_frames'] = _saturated_frames(fields['saturated_frames'])
+    for name in ('missing_frames', 'battery_voltage_mV', 'min_signal', 'max_signal'):
+        header_info[name] = fields[name]
+    return header_info
+
+
+def json_header(header_info):
+    """Copy of a header_info dictionary that json can write, with the bytes
+    fields decoded and the tuples turned into lists"""
+    converted = {}
+    for name, value in header_info.items():
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", "replace")
+        elif isinstance(value, tuple):
+            value = list(value)
+        converted[name] = value
+    return converted
+
+
+def _unpack_conf_fp(values):
+    """Group the 8 configuration fingerprint bytes of a flat header tuple"""
+    conf_fp_start = HEADER_FIELDS.index('conf_fp')
+    return (values[:conf_fp_start] + (values[conf_fp_start:conf_fp_start + 8],) +
+            values[conf_fp_start + 8:])
+
+
+def _saturated_frames(value):
+    # Large counts are stored as a multiple of 16, flagged by bit 7
+    if value & 0x80 == 0x80:
+        value &= 0x7F
+        value <<= 4
+    return value
+
+
+def update_header(data, **fields):
+    """Copy of a 128 byte file header with the given raw fields replaced.
+    saturated_frames is given as a count, and stored as a multiple of 16
+    (rounded up) when it does not fit in 7 bits"""
+    from numpy import frombuffer
+    header = frombuffer(bytearray(data[:HEADER_SIZE]), dtype=_dtypes()['HEADER_DTYPE'])
+    for name, value in fields.items():
+        if name == 'saturated_frames' and value > 0x7F:
+            value = 0x80 | min((value + 15) >> 4, 0x7F)
+        header[name] = value
+    return header.tobytes()
+
+
+def parse_subheader(data):
+    """Parse a 32 byte segment subheader into the subheader dictionary used by
+    DecimatedSegmentedReader"""
+    return dict(zip([name for name, _, _ in _subheader_layout], SUBHEADER_STRUCT.unpack_from(data)))
+
+
+# Fields derived from each header, on top of the raw ones in HEADER_DTYPE
+_derived_fields = [('path', 'O'),
+                   ('sample_rate', 'f8'),
+                   ('frame_bytes', 'u4'),
+                   ('channel_type', 'U1'),
+                   ('lpf_Hz', 'f8'),
+                   ('channel_main_gain', 'f8'),
+                   ('preamp_gain', 'f8'),
+                   ('attenuator_gain', 'f8'),
+                   ('intrinsic_circuitry_gain', 'f8'),
+                   ('total_selectable_gain', 'f8'),
+                   ('total_circuitry_gain', 'f8')]
+
+_built_dtypes = {}
+
+
+def _dtypes():
+    """HEADER_DTYPE, SUBHEADER_DTYPE and SCAN_DTYPE by name, built on first use"""
+    if not _built_dtypes:
+        from numpy import dtype
+        header_dtype = _layout_dtype(_header_layout, HEADER_SIZE)
+        _built_dtypes['HEADER_DTYPE'] = header_dtype
+        _built_dtypes['SUBHEADER_DTYPE'] = _layout_dtype(_subheader_layout, SUBHEADER_SIZE)
+        _built_dtypes['SCAN_DTYPE'] = dtype([(name, header_dtype.fields[name][0]) for name, _, _ in _header_layout]
+                                            + _derived_fields)
+    return _built_dtypes
+
+
+def __getattr__(name):
+    # The dtypes are module attributes as far as importers are concerned
+    if name in ('HEADER_DTYPE', 'SUBHEADER_DTYPE', 'SCAN_DTYPE'):
+        return _dtypes()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def scan_headers(paths):
+    """Read only the 128 byte header of every file in paths and return them
+    all as a single record array (SCAN_DTYPE), with the raw header fields plus
+    the derived sample rate, frame size, channel type, LPF and gains.
+    Files shorter than a header are skipped."""
+    from numpy import concatenate, empty, frombuffer, nan, recarray, uint8, where
+    header_dtype, scan_dtype = _dtypes()['HEADER_DTYPE'], _dtypes()['SCAN_DTYPE']
+    paths = list(paths)
+    raw = bytearray(len(paths) * HEADER_SIZE)
+    view = memoryview(raw)
+    good_paths = []
+    for path in paths:
+        with open(path, 'rb') as stream:
+            start = len(good_paths) * HEADER_SIZE
+            if stream.readinto(view[start:start + HEADER_SIZE]) == HEADER_SIZE:
+                good_paths.append(path)
+    headers = frombuffer(raw, dtype=header_dtype, count=len(good_paths))
+
+    scanned = empty(len(good_paths), dtype=scan_dtype)
+    for name, _, _ in _header_layout:
+        scanned[name] = headers[name]
+    scanned['path'] = good_paths
+    saturated_frames = headers['saturated_frames']
+    scanned['saturated_frames'] = where(saturated_frames & 0x80, (saturated_frames & 0x7F) << 4, saturated_frames)
+    scanned['sample_rate'] = headers['sample_rate_base'] * 10.0 ** headers['sample_rate_exp']
+    scanned['frame_bytes'] = headers['frame_size'] & 0x0ffffff
+    # Only a handful of board configurations exist in a survey, decode each once
+    header_bytes = frombuffer(raw, dtype=uint8, count=len(good_paths) * HEADER_SIZE).reshape(-1, HEADER_SIZE)
+    board_keys = concatenate([header_bytes[:, 51:59], header_bytes[:, 31:39]], axis=1).tobytes()
+    key_size = 8 + 8
+    configs = {}
+    for idx in range(len(good_paths)):
+        configs.setdefault(board_keys[idx * key_size:(idx + 1) * key_size], []).append(idx)
+    for rows in configs.values():
+        header = headers[rows[0]]
+        config = ChannelConfig(tuple(header['conf_fp']), header['ch_hwv'].decode("utf-8").strip(' '))
+        scanned['channel_type'][rows] = config.channel_type
+        for name, _ in _derived_fields[4:]:
+            value = getattr(config, name)
+            scanned[name][rows] = nan if value is None else value
+    return scanned.view(recarray)
+
+
+def frame_time(header_info, frame_count):
+    """Epoch time of the first sample of the native frame with the given 28
+    bit frame counter, in a file with this header_info"""
+    frame_count += header_info['frame_rollover_count'] << 28
+    return header_info['rec_id'] + frame_count * 20 / float(header_info['sample_rate'])
+
+
+def fragment_start(header_info):
+    """Nominal start of the fragment period covered by a file, in epoch
+    seconds. Decimated files are assumed to start there"""
+    return header_info['rec_id'] + (header_info['file_sequence'] - 1) * header_info['frag_period']
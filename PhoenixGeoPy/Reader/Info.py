@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Metadata of the time series files of the MTU-5C Family, from their headers
+alone
+
+Only the 128 byte header of each file (plus its first frame or segment
+subheader, for the start time) is read, parsed with the same parse_header and
+ChannelConfig the readers unpack their headers with. No reader is opened and
+neither NumPy nor the rest of the package is imported, so that the short lived
+processes of an ingest pipeline start in a few tens of milliseconds.
+
+Installed as the phoenixgeopy command:
+phoenixgeopy info <file> [<file> ...] [--field sample_rate --field channel_type]
+phoenixgeopy ls <recording or survey dir>
+phoenixgeopy headers <file> [<file> ...] [--json]
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+from struct import Struct
+from PhoenixGeoPy.Reader.Files import SEGMENTED_EXTENSIONS, channel_tags, is_series_file, parse_file_name
+from PhoenixGeoPy.Reader.Headers import (CONFIG_ATTRIBUTES, HEADER_SIZE, ChannelConfig, SUBHEADER_STRUCT, frame_time,
+                                         fragment_start, json_header, parse_header)
+
+# Fields printed by info unless others are asked for
+INFO_FIELDS = ('inst_type', 'inst_serial', 'rec_id', 'ch_id', 'file_sequence', 'channel_type', 'sample_rate',
+               'start_time', 'samples', 'duration', 'lpf_Hz', 'total_circuitry_gain', 'gps_lat', 'gps_long',
+               'gps_height', 'timing_flags', 'saturated_frames', 'missing_frames', 'battery_voltage_mV',
+               'min_signal', 'max_signal')
+
+_FOOTER = Struct('<I')
+
+
+def file_info(path):
+    """header_info of a file plus the channel configuration the readers
+    unpack from it and a few derived fields: extension, samples and duration
+    (None for segmented files), and start_time (epoch of the first sample,
+    None for files without data)"""
+    with open(path, 'rb') as stream:
+        data = stream.read(HEADER_SIZE + 64)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("%s is shorter than a file header" % path)
+    info = parse_header(data)
+    config = ChannelConfig(info['conf_fp'], info['ch_hwv'])
+    for name in CONFIG_ATTRIBUTES:
+        info[name] = getattr(config, name)
+    extension = parse_file_name(path)[4]
+    data_bytes = os.path.getsize(path) - HEADER_SIZE
+    info['path'] = path
+    info['extension'] = extension
+    info['samples'] = None
+    info['start_time'] = None
+    if extension == 'bin':
+        info['samples'] = data_bytes // 64 * 20
+        if len(data) == HEADER_SIZE + 64:
+            info['start_time'] = frame_time(info, _FOOTER.unpack_from(data, HEADER_SIZE + 60)[0] & 0x0fffffff)
+    elif extension in SEGMENTED_EXTENSIONS:
+        if len(data) >= HEADER_SIZE + SUBHEADER_STRUCT.size:
+            info['start_time'] = SUBHEADER_STRUCT.unpack_from(data, HEADER_SIZE)[0]
+    else:
+        info['samples'] = data_bytes // 4
+        if data_bytes >= 4:
+            info['start_time'] = fragment_start(info)
+    info['duration'] = None
+    if info['samples'] is not None and info['sample_rate']:
+        info['duration'] = info['samples'] / float(info['sample_rate'])
+    return info
+
+
+def _text(name, value):
+    if value is None:
+        return '-'
+    if name in ('rec_id', 'start_time'):
+        return datetime.fromtimestamp(value, timezone.utc).isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, float):
+        return '%g' % value
+    return str(value)
+
+
+def sequences(root):
+    """(channel dir, [paths in sequence order]) of every sequence of files below
+    root, a recording, a survey or a single channel directory"""
+    found = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        groups = {}
+        for name in file_names:
+            if is_series_file(name):
+                inst_id, rec_id, ch_id, seq, extension = parse_file_name(name)
+                groups.setdefault((inst_id, rec_id, ch_id, extension), []).append((seq, name))
+        for key in sorted(groups):
+            names = [name for _, name in sorted(groups[key])]
+            found.append((dir_path, [os.path.join(dir_path, name) for name in names]))
+    return found
+
+
+def _info(args, out):
+    status = 0
+    for path in args.files:
+        try:
+            info = file_info(path)
+        except (OSError, ValueError) as error:
+            print("phoenixgeopy: %s" % error, file=sys.stderr)
+            status = 1
+            continue
+        if args.field:
+            values = "\t".join(_text(name, info.get(name)) for name in args.field)
+            out.write(("%s\t%s\n" % (path, values)) if len(args.files) > 1 else values + "\n")
+        else:
+            out.write(path + "\n")
+            for name in INFO_FIELDS:
+                out.write("  %-22s %s\n" % (name, _text(name, info[name])))
+    return status
+
+
+def _ls(args, out):
+    status = 0
+    tags = {}
+    out.write("%-60s %-4s %-7s %5s %10s %4s %12s %10s\n" % ('first file', 'tag', 'product', 'files', 'rate',
+                                                             'type', 'seconds', 'MB'))
+    for root in args.dirs:
+        for ch_dir, paths in sequences(root):
+            try:
+                info = file_info(paths[0])
+            except (OSError, ValueError) as error:
+                print("phoenixgeopy: %s" % error, file=sys.stderr)
+                status = 1
+                continue
+            rec_dir = os.path.dirname(ch_dir)
+            if rec_dir not in tags:
+                tags[rec_dir] = channel_tags(rec_dir)
+            sizes = [os.path.getsize(path) for path in paths]
+            seconds = '-'
+            if info['samples'] is not None and info['sample_rate']:
+                samples_per_byte = 20 / 64.0 if info['extension'] == 'bin' else 1 / 4.0
+                seconds = '%.1f' % (sum(size - HEADER_SIZE for size in sizes) * samples_per_byte
+                                    / float(info['sample_rate']))
+            out.write("%-60s %-4s %-7s %5d %10g %4s %12s %10.1f\n" % (
+                os.path.relpath(paths[0], root), tags[rec_dir].get(info['ch_id'], '-'), info['extension'],
+                len(paths), info['sample_rate'], info['channel_type'], seconds, sum(sizes) / 2 ** 20))
+    return status
+
+
+def _headers(args, out):
+    status = 0
+    for path in args.files:
+        try:
+            info = file_info(path)
+        except (OSError, ValueError) as error:
+            print("phoenixgeopy: %s" % error, file=sys.stderr)
+            status = 1
+            continue
+        if args.json:
+            # One JSON object per line and file
+            out.write(json.dumps(json_header(info)) + "\n")
+        else:
+            out.write(path + "\n")
+            for name, value in json_header(info).items():
+                out.write("  %-26s %s\n" % (name, value))
+    return status
+
+
+def main(argv=None, out=None):
+    parser = argparse.ArgumentParser(prog='phoenixgeopy', description="Metadata of MTU-5C time series files, "
+                                                                      "read from their headers only")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    info = commands.add_parser('info', help="summary of each file")
+    info.add_argument('files', nargs='+')
+    info.add_argument('--field', action='append', help="print only this field (repeatable), tab separated")
+    info.set_defaults(function=_info)
+    ls = commands.add_parser('ls', help="sequences of files below directories")
+    ls.add_argument('dirs', nargs='*', default=['.'])
+    ls.set_defaults(function=_ls)
+    headers = commands.add_parser('headers', help="every header field of each file")
+    headers.add_argument('files', nargs='+')
+    headers.add_argument('--json', action='store_true', help="one JSON object per line and file")
+    headers.set_defaults(function=_headers)
+    args = parser.parse_args(argv)
+    try:
+        return args.function(args, out or sys.stdout)
+    except BrokenPipeError:
+        # i.e. piped into head, stop quietly
+        sys.stderr.close()
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Opt-in counters and timers for the time series readers of the MTU-5C Family
+
+instrument(reader) replaces, on that reader instance only, the methods where
+time goes (opening files, raw reads and seeks on the stream, frame decoding and
+scaling) by wrappers that count and time them. Readers that are not
+instrumented run the plain class methods, so disabled instrumentation costs
+nothing. uninstrument(reader) restores them.
+
+The metrics are logged to the 'PhoenixGeoPy.Reader' logger and handed to an
+optional callback(reader, metrics) every time a new file is opened, when the
+reader is closed, and whenever ReaderMetrics.emit() is called. Files opened
+before instrumenting the reader (i.e. the first one, opened by the
+constructor) are not counted.
+
+i.e.
+    metrics = reader.enable_metrics(callback=send_to_telemetry)
+    ...
+    print(metrics.snapshot())
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import logging
+from time import perf_counter
+
+LOGGER = logging.getLogger('PhoenixGeoPy.Reader')
+
+_counters = ('files_opened', 'bytes_read', 'read_calls', 'seeks', 'seek_distance',
+             'frames_decoded', 'frames_scaled', 'segments_read')
+_timers = ('open_time', 'read_time', 'decode_time', 'scale_time')
+
+
+class ReaderMetrics(object):
+    """Counters and timers (in seconds) of one reader"""
+
+    def __init__(self, reader, callback=None, logger=None):
+        self.reader = reader
+        self.callback = callback
+        self.logger = LOGGER if logger is None else logger
+        self.reset()
+
+    def reset(self):
+        for name in _counters + _timers:
+            setattr(self, name, 0)
+
+    def snapshot(self):
+        """All the counters and timers as a dictionary, plus the read rate
+        and the share of the time spent in I/O"""
+        values = dict((name, getattr(self, name)) for name in _counters + _timers)
+        io_time = self.open_time + self.read_time
+        busy_time = io_time + self.decode_time + self.scale_time
+        values['read_MBps'] = self.bytes_read / 2 ** 20 / self.read_time if self.read_time else None
+        values['io_fraction'] = io_time / busy_time if busy_time else None
+        values['path'] = self.reader.base_path
+        return values
+
+    def emit(self):
+        values = self.snapshot()
+        self.logger.info("%s: %d files, %d bytes in %.3f s, decode %.3f s, scale %.3f s",
+                         values['path'], values['files_opened'], values['bytes_read'], values['read_time'],
+                         values['decode_time'], values['scale_time'])
+        if self.callback is not None:
+            self.callback(self.reader, values)
+        return values
+
+
+class _CountingStream(object):
+    """File object proxy counting and timing the reads and seeks made on it"""
+
+    def __init__(self, stream, metrics):
+        self._stream = stream
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def readinto(self, buf):
+        start = perf_counter()
+        count = self._stream.readinto(buf)
+        self._metrics.read_time += perf_counter() - start
+        self._metrics.read_calls += 1
+        self._metrics.bytes_read += count or 0
+        return count
+
+    def read(self, size=-1):
+        start = perf_counter()
+        data = self._stream.read(size)
+        self._metrics.read_time += perf_counter() - start
+        self._metrics.read_calls += 1
+        self._metrics.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        previous = self._stream.tell()
+        position = self._stream.seek(offset, whence)
+        self._metrics.seeks += 1
+        self._metrics.seek_distance += abs(position - previous)
+        return position
+
+
+def _wrap_open_stream(reader, metrics, open_stream):
+    def _open_stream(path, prepared=None):
+        start = perf_counter()
+        open_stream(path, prepared)
+        metrics.open_time += perf_counter() - start
+        metrics.files_opened += 1
+        reader.stream = _CountingStream(reader.stream, metrics)
+        metrics.logger.debug("opened %s in %.1f ms", path, 1000 * (perf_counter() - start))
+        metrics.emit()
+    return _open_stream
+
+
+def _wrap_decode_frames(metrics, decode_frames):
+    def _decode_frames(raw):
+        start = perf_counter()
+        result = decode_frames(raw)
+        metrics.decode_time += perf_counter() - start
+        metrics.frames_decoded += len(raw) // 64
+        return result
+    return _decode_frames
+
+
+def _wrap_scale(metrics, scale):
+    def _scale(samples, out):
+        start = perf_counter()
+        result = scale(samples, out)
+        metrics.scale_time += perf_counter() - start
+        metrics.frames_scaled += samples.shape[0]
+        return result
+    return _scale
+
+
+def _wrap_read_subheader(reader, metrics, read_subheader):
+    def counted_read_subheader():
+        read_subheader()
+        if reader.subheader.get('samplesInRecord'):
+            metrics.segments_read += 1
+    return counted_read_subheader
+
+
+def _wrap_read_segment_bytes(metrics, read_segment_bytes):
+    def counted_read_segment_bytes(max_segments):
+        result = read_segment_bytes(max_segments)
+        metrics.segments_read += len(result[1])
+        return result
+    return counted_read_segment_bytes
+
+
+def _wrap_close(reader, metrics, close):
+    def close_reader():
+        close()
+        metrics.emit()
+    return close_reader
+
+
+def instrument(reader, callback=None, logger=None):
+    """Start counting and timing the work done by reader, returns its
+    ReaderMetrics (also kept in reader.metrics)"""
+    if getattr(reader, 'metrics', None) is not None:
+        uninstrument(reader)
+    metrics = ReaderMetrics(reader, callback, logger)
+    reader.metrics = metrics
+    reader._open_stream = _wrap_open_stream(reader, metrics, reader._open_stream)
+    reader.close = _wrap_close(reader, metrics, reader.close)
+    if hasattr(reader, '_decode_frames'):
+        reader._decode_frames = _wrap_decode_frames(metrics, reader._decode_frames)
+        reader._scale = _wrap_scale(metrics, reader._scale)
+    if hasattr(reader, 'read_subheader'):
+        reader.read_subheader = _wrap_read_subheader(reader, metrics, reader.read_subheader)
+        reader._read_segment_bytes = _wrap_read_segment_bytes(metrics, reader._read_segment_bytes)
+    if reader.stream is not None:
+        reader.stream = _CountingStream(reader.stream, metrics)
+    return metrics
+
+
+def uninstrument(reader):
+    """Restore the plain methods of an instrumented reader"""
+    for name in ('_open_stream', 'close', '_decode_frames', '_scale', 'read_subheader', '_read_segment_bytes'):
+        reader.__dict__.pop(name, None)
+    if isinstance(reader.stream, _CountingStream):
+        reader.stream = reader.stream._stream
+    reader.metrics = None
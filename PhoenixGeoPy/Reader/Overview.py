@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Multi-resolution min/max/mean overview of a time series sequence of the
+MTU-5C Family, for plotting long recordings
+
+The samples of the sequence are reduced in one pass to the min, max and mean
+of blocks of base_block samples (level 0), and each following level reduces
+the previous one by factor, until a single block covers the whole sequence.
+The pyramid is stored next to the first file of the sequence (a memory mapped
+.overview.npy with the levels and a .overview.npz with what they were built
+from), and is rebuilt automatically when any of the files change.
+
+query(t0, t1, width) returns the envelope of [t0, t1) from the coarsest level
+that still has width points in that range, so that drawing a week of data
+reads a few thousand values. Only when even level 0 is too coarse are the raw
+samples read, through the random access methods of the reader.
+
+Sample index i of the pyramid is at start_time + i / sample_rate. Native
+frames and decimated segments are taken back to back, so for sequences with
+missing frames or segmented bursts the times are those of a gapless series.
+
+i.e.
+    overview = reader.overview()
+    times, low, high, mean = overview.query(t0, t1, width=1600)
+    axes.fill_between(times, low, high)
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+from math import ceil, floor
+from numpy import (add, arange, array, asarray, concatenate, empty, float64, full, int64, load, maximum, minimum, save,
+                   savez)
+from PhoenixGeoPy.Reader.SegmentIndex import file_stats
+
+OVERVIEW_DTYPE = [('min', 'f4'), ('max', 'f4'), ('mean', 'f4')]
+
+
+def _series_chunks(reader, chunk_samples):
+    """Scaled samples of the whole sequence in chunks, read from the memory
+    maps (or the segment index) so that the reader's stream is not moved"""
+    if hasattr(reader, 'map_frames'):
+        mapped = reader.map_frames()
+        num_frames = max(1, chunk_samples // 20)
+        out = empty([num_frames, 20])
+        for start in range(0, len(mapped), num_frames):
+            raw = mapped.records(start, num_frames)
+            samples, _ = reader._decode_frames(raw)
+            yield reader._scale(samples, out[:len(raw)]).reshape(-1)
+    elif hasattr(reader, 'map_samples'):
+        mapped = reader.map_samples()
+        for start in range(0, len(mapped), chunk_samples):
+            yield mapped.records(start, chunk_samples)
+    else:
+        index = reader.segment_index()
+        for segment in range(len(index)):
+            yield index.read(segment)
+
+
+def _start_time(reader):
+    """Epoch time of the first sample of the sequence"""
+    sample_rate = float(reader.header_info['sample_rate'])
+    if hasattr(reader, 'absolute_frames'):
+        if not reader.frame_count():
+            return float(reader.header_info['rec_id'])
+        return reader.header_info['rec_id'] + int(reader.absolute_frames(0, 1)[0]) * 20 / sample_rate
+    if hasattr(reader, 'file_start_times'):
+        starts = reader.file_start_times()
+        return float(starts[0]) if len(starts) else float(reader.header_info['rec_id'])
+    segments = reader.segment_index().segments
+    return float(segments['timestamp'][0]) if len(segments) else float(reader.header_info['rec_id'])
+
+
+def _raw_samples(reader, start, count):
+    """Samples [start, start + count) by random access, None for segmented
+    sequences"""
+    if hasattr(reader, 'read_samples_at'):
+        return reader.read_samples_at(start, count)
+    if hasattr(reader, 'samples'):
+        return asarray(reader.samples(start, count))
+    return None
+
+
+class Overview(object):
+    """Min/max/mean pyramid of a reader's sequence"""
+
+    sidecar_suffix = '.overview'
+
+    def __init__(self, reader, factor=4, base_block=64, path=None, chunk_samples=240000):
+        if factor < 2 or base_block < 1:
+            raise ValueError("The overview needs factor >= 2 and base_block >= 1")
+        self.reader = reader
+        self.paths = reader.sequence_paths()
+        self.factor = factor
+        self.base_block = base_block
+        if path is None and self.paths:
+            path = self.paths[0] + self.sidecar_suffix
+        self.path = path
+        self.sample_rate = float(reader.header_info['sample_rate'])
+        self.scale = float(getattr(reader, '_scale_factor', 1.0))
+        self.start_time = None
+        self.num_samples = 0
+        self.levels = []
+        if not self.load():
+            self.build(chunk_samples)
+            self.save()
+
+    def build(self, chunk_samples=240000):
+        """Reduce every sample of the sequence to level 0 in one pass, and
+        level 0 to the coarser levels"""
+        block = self.base_block
+        mins, maxs, sums = [], [], []
+        carry = empty([0])
+        self.num_samples = 0
+        for chunk in _series_chunks(self.reader, chunk_samples):
+            self.num_samples += len(chunk)
+            if len(carry):
+                chunk = concatenate((carry, chunk))
+            whole = len(chunk) - len(chunk) % block
+            blocks = chunk[:whole].reshape(-1, block)
+            mins.append(blocks.min(axis=1))
+            maxs.append(blocks.max(axis=1))
+            sums.append(blocks.sum(axis=1, dtype=float64))
+            # Chunks may be views of a buffer reused by the next one
+            carry = array(chunk[whole:])
+        if len(carry):
+            mins.append(carry.min(keepdims=True))
+            maxs.append(carry.max(keepdims=True))
+            sums.append(carry.sum(keepdims=True, dtype=float64))
+        self.start_time = _start_time(self.reader)
+        self.levels = []
+        if not self.num_samples:
+            return
+        low, high, total = concatenate(mins), concatenate(maxs), concatenate(sums)
+        counts = full([len(total)], block, dtype=int64)
+        counts[-1] = self.num_samples - (len(total) - 1) * block
+        while True:
+            level = empty([len(total)], dtype=OVERVIEW_DTYPE)
+            level['min'], level['max'], level['mean'] = low, high, total / counts
+            self.levels.append(level)
+            if len(total) == 1:
+                break
+            groups = arange(0, len(total), self.factor)
+            low, high = minimum.reduceat(low, groups), maximum.reduceat(high, groups)
+            total, counts = add.reduceat(total, groups), add.reduceat(counts, groups)
+
+    def load(self):
+        """Load the sidecar, returns False if it is missing or stale"""
+        if self.path is None or not os.path.exists(self.path + '.npz') or not os.path.exists(self.path + '.npy'):
+            return False
+        try:
+            with load(self.path + '.npz', allow_pickle=False) as sidecar:
+                if list(sidecar['files']) != [os.path.basename(path) for path in self.paths]:
+                    return False
+                sizes, mtimes = file_stats(self.paths)
+                if (sidecar['sizes'] != sizes).any() or (sidecar['mtimes'] != mtimes).any():
+                    return False
+                if (int(sidecar['factor']) != self.factor or int(sidecar['base_block']) != self.base_block
+                        or float(sidecar['scale']) != self.scale):
+                    return False
+                offsets = sidecar['offsets']
+                self.start_time = float(sidecar['start_time'])
+                self.num_samples = int(sidecar['num_samples'])
+            levels = load(self.path + '.npy', mmap_mode='r', allow_pickle=False)
+            self.levels = [levels[offsets[idx]:offsets[idx + 1]] for idx in range(len(offsets) - 1)]
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def save(self):
+        """Write the sidecar, silently keeping the pyramid in memory only when
+        the data directory is not writable"""
+        if self.path is None:
+            return False
+        sizes, mtimes = file_stats(self.paths)
+        offsets = [0]
+        for level in self.levels:
+            offsets.append(offsets[-1] + len(level))
+        try:
+            with open(self.path + '.npy', 'wb') as sidecar:
+                save(sidecar, concatenate(self.levels) if self.levels else empty([0], dtype=OVERVIEW_DTYPE))
+            with open(self.path + '.npz', 'wb') as sidecar:
+                savez(sidecar, offsets=array(offsets, dtype=int64), sizes=sizes, mtimes=mtimes,
+                      files=array([os.path.basename(path) for path in self.paths]),
+                      factor=self.factor, base_block=self.base_block, scale=self.scale,
+                      start_time=self.start_time, num_samples=self.num_samples)
+        except OSError:
+            return False
+        return True
+
+    def block_samples(self, level):
+        """Number of samples reduced into each value of a level"""
+        return self.base_block * self.factor ** level
+
+    def query_samples(self, start, stop, width, raw=True):
+        """Envelope of the samples [start, stop) with at least width points,
+        from the coarsest level that has them. With raw=True the samples
+        themselves are read when level 0 is too coarse (min, max and mean are
+        then the same array). Returns (first sample index of each point, min,
+        max, mean)"""
+        start, stop = max(0, start), min(stop, self.num_samples)
+        if stop <= start or not self.levels:
+            nothing = empty([0], dtype='f4')
+            return empty([0], dtype=int64), nothing, nothing, nothing
+        level = None
+        for idx in reversed(range(len(self.levels))):
+            if (stop - start) / float(self.block_samples(idx)) >= width:
+                level = idx
+                break
+        if level is None and raw:
+            data = _raw_samples(self.reader, start, stop - start)
+            if data is not None:
+                return arange(start, start + len(data)), data, data, data
+        block = self.block_samples(level or 0)
+        first, last = start // block, (stop + block - 1) // block
+        entries = self.levels[level or 0][first:last]
+        return arange(first, first + len(entries)) * block, entries['min'], entries['max'], entries['mean']
+
+    def query(self, t0, t1, width, raw=True):
+        """Envelope of the epoch time range [t0, t1) with at least width
+        points (i.e. the pixel width of the plot), see query_samples.
+        Returns (time of each point, min, max, mean)"""
+        start = int(floor((t0 - self.start_time) * self.sample_rate))
+        stop = int(ceil((t1 - self.start_time) * self.sample_rate))
+        indices, low, high, mean = self.query_samples(start, stop, width, raw)
+        return self.start_time + indices / self.sample_rate, low, high, mean
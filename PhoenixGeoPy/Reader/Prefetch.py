@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Background file prefetch and read-ahead for the time series readers of the
+MTU-5C Family
+
+FilePrefetcher scans the channel directory once into a map of the files of the
+sequence, so that holes in the numbering are skipped rather than ending the
+sequence, and opens the next file of the map and reads its header on a worker
+thread while the current one is being read. The reader swaps to it at the
+file boundary without waiting on the file system.
+
+read_ahead(reader, chunk) reads the next chunks of raw data on a worker thread
+into a bounded set of buffers (two by default, a double buffer), so that the
+I/O for chunk k + 1 overlaps the decoding and processing of chunk k.
+
+i.e.
+    for chunk in reader.read_ahead(24000):
+        process(chunk)
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import logging
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from numpy import empty, float32
+from PhoenixGeoPy.Reader.Headers import parse_header
+
+LOGGER = logging.getLogger('PhoenixGeoPy.Reader')
+
+
+def scan_sequence(path):
+    """(seq, path) of every file in the directory of path that belongs to
+    the same sequence (instrument, recording, channel and extension), sorted
+    by sequence number, holes included"""
+    ch_dir, name = os.path.split(path)
+    stem, extension = name.split('.', 1)
+    prefix = stem.rsplit('_', 1)[0] + '_'
+    sequence = []
+    for entry in os.scandir(ch_dir or '.'):
+        entry_stem, _, entry_extension = entry.name.partition('.')
+        if entry_extension != extension or not entry_stem.startswith(prefix):
+            continue
+        try:
+            seq = int(entry_stem[len(prefix):], 16)
+        except ValueError:
+            continue
+        sequence.append((seq, entry.path))
+    sequence.sort()
+    return sequence
+
+
+class FilePrefetcher(object):
+    """Opens the next file of a reader's sequence in the background
+
+    The header of each prefetched file is checked against the reader's
+    (recording, channel and sample rate) before the reader switches to it."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None    # (seq, future of (stream, header))
+        self.rescan()
+
+    def rescan(self):
+        """Scan the channel directory again, i.e. for files added since"""
+        self.sequence = [(seq, path) for seq, path in scan_sequence(self.reader.base_path)
+                         if self.reader.first_seq <= seq < self.reader.last_seq]
+        self._seqs = [seq for seq, _ in self.sequence]
+        self.prepare(self.reader.seq)
+
+    def prepare(self, seq):
+        """Start opening the first file of the map after seq"""
+        self.discard()
+        idx = bisect_right(self._seqs, seq)
+        if idx < len(self.sequence):
+            next_seq, path = self.sequence[idx]
+            self._pending = (next_seq, self._executor.submit(self._open, path))
+
+    def _open(self, path):
+        stream = open(path, 'rb')
+        header = stream.read(self.reader.header_size) if self.reader.header_size > 0 else None
+        return path, stream, header
+
+    def _check(self, path, header):
+        if header is None or not self.reader.header_info:
+            return
+        if len(header) < self.reader.header_size:
+            raise ValueError("Incomplete header in %s" % path)
+        header_info = parse_header(header)
+        for key in ('rec_id', 'ch_id', 'sample_rate'):
+            if header_info[key] != self.reader.header_info[key]:
+                raise ValueError("%s does not belong to the sequence of %s (%s %s != %s)" %
+                                 (path, self.reader.base_path, key, header_info[key], self.reader.header_info[key]))
+
+    def open_next(self):
+        """Switch the reader to the prefetched file, returns False at the end
+        of the sequence"""
+        reader = self.reader
+        if reader.stream is not None:
+            reader.stream.close()
+        if self._pending is None:
+            # The map may be out of date, i.e. while the recording is running
+            self.rescan()
+            if self._pending is None:
+                reader.seq += 1
+                return False
+        seq, future = self._pending
+        self._pending = None
+        path, stream, header = future.result()
+        self._check(path, header)
+        reader.seq = seq
+        reader._open_stream(path, (stream, header))
+        self.prepare(seq)
+        return True
+
+    def discard(self):
+        """Close a prefetched file that will not be used"""
+        if self._pending is not None:
+            self._pending[1].add_done_callback(_close_discarded)
+            self._pending = None
+
+    def close(self):
+        self.discard()
+        self._executor.shutdown()
+
+
+def _close_discarded(future):
+    """Done callback of a discarded prefetch: close its file, or drop the error
+    opening it since nothing will read it"""
+    error = future.exception()
+    if error is not None:
+        LOGGER.debug("discarded prefetch failed: %s", error)
+        return
+    future.result()[1].close()
+
+
+def _fill(reader, buffers, free, filled, record_size, stop):
+    """Worker loop: fill free buffers in turn until the end of the sequence"""
+    try:
+        while not stop.is_set():
+            idx = free.get()
+            if idx is None:
+                break
+            num_bytes = reader.read_into(buffers[idx], record_size)
+            filled.put((idx, num_bytes))
+            if num_bytes < len(memoryview(buffers[idx]).cast('B')):
+                break
+    except Exception as error:      # Raised again in the consumer
+        filled.put((None, error))
+        return
+    filled.put((None, None))
+
+
+def _raw_chunks(reader, buffers, record_size):
+    """Generator of (buffer index, bytes) filled ahead on a worker thread.
+    The buffer of a chunk is only refilled once the next chunk is requested"""
+    free = Queue()
+    filled = Queue()
+    stop = threading.Event()
+    for idx in range(len(buffers)):
+        free.put(idx)
+    worker = threading.Thread(target=_fill, args=(reader, buffers, free, filled, record_size, stop), daemon=True)
+    worker.start()
+    try:
+        while True:
+            idx, num_bytes = filled.get()
+            if idx is None:
+                if num_bytes is not None:
+                    raise num_bytes
+                return
+            if num_bytes:
+                yield idx, num_bytes
+            free.put(idx)
+    finally:
+        stop.set()
+        free.put(None)
+        worker.join()
+
+
+def read_ahead(reader, chunk_samples, depth=2, prefetch_files=True):
+    """Generator over the rest of a reader's series like iter_chunks, with
+    the raw data read ahead by up to depth chunks on a worker thread.
+
+    Native chunks are decoded on the calling thread while the next raw chunk
+    is read, continuous chunks are views of the read buffers. Segmented
+    series are iterated on the worker thread and copied into the buffers.
+    Each chunk is only valid until the next one is requested. With
+    prefetch_files the next file of the sequence is also opened in the
+    background (see FilePrefetcher), only while the chunks are read if the
+    reader did not prefetch already."""
+    enabled_here = prefetch_files and reader.prefetcher is None
+    if enabled_here:
+        reader.enable_prefetch()
+    try:
+        for chunk in _chunks_ahead(reader, chunk_samples, max(2, depth)):
+            yield chunk
+    finally:
+        if enabled_here:
+            reader.disable_prefetch()
+
+
+def _chunks_ahead(reader, chunk_samples, depth):
+    if hasattr(reader, '_decode_into'):
+        if chunk_samples % 20:
+            raise ValueError("Native chunks must hold whole frames (a multiple of 20 samples)")
+        buffers = [bytearray(chunk_samples // 20 * 64) for _ in range(depth)]
+        out = empty([chunk_samples])
+        for idx, num_bytes in _raw_chunks(reader, buffers, 64):
+            yield reader._decode_into(memoryview(buffers[idx])[:num_bytes], out)
+    elif hasattr(reader, 'read_data'):
+        buffers = [empty([chunk_samples], dtype=float32) for _ in range(depth)]
+        for idx, num_bytes in _raw_chunks(reader, buffers, 4):
+            yield buffers[idx][:num_bytes // 4]
+    else:
+        for chunk in _copied_chunks(reader, chunk_samples, depth):
+            yield chunk
+
+
+def _copied_chunks(reader, chunk_samples, depth):
+    buffers = [empty([chunk_samples], dtype=float32) for _ in range(depth)]
+    free = Queue()
+    filled = Queue()
+    stop = threading.Event()
+    for idx in range(depth):
+        free.put(idx)
+
+    def produce():
+        try:
+            for chunk in reader.iter_chunks(chunk_samples):
+                idx = free.get()
+                if idx is None or stop.is_set():
+                    return
+                buffers[idx][:len(chunk)] = chunk
+                filled.put((idx, len(chunk)))
+        except Exception as error:
+            filled.put((None, error))
+            return
+        filled.put((None, None))
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            idx, count = filled.get()
+            if idx is None:
+                if count is not None:
+                    raise count
+                return
+            yield buffers[idx][:count]
+            free.put(idx)
+    finally:
+        stop.set()
+        free.put(None)
+        worker.join()
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""Module to read all the channels of a recording of the MTU-5C Family in lockstep
+
+A recording directory (i.e. 10128_2021-04-27-025909/) holds one subdirectory per
+channel, named after the channel id. The Recording class discovers them, opens
+a streamed reader per channel, checks that they belong to the same recording
+and start at the same point in time, and returns aligned (channels, samples)
+blocks decoded concurrently on a thread pool.
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from numpy import arange, asarray, dtype, empty, float32, float64, int64
+from PhoenixGeoPy.Reader.Files import channel_files, channel_tags, first_file, parse_file_name, sequence_length
+from PhoenixGeoPy.Reader.TimeSeries import NativeReader, DecimatedContinuousReader, SEGMENTED_EXTENSIONS
+
+
+class Recording(object):
+    """Synchronized reader over all the channels of one recording
+
+    extension selects the product to read, 'bin' for native sampling rate
+    series, or a continuous decimated product such as 'td_150'. channels
+    optionally restricts the channel ids to read.
+    """
+
+    def __init__(self, rec_dir, extension='bin', num_files=1, channels=None, max_workers=None, **reader_args):
+        if extension in SEGMENTED_EXTENSIONS:
+            raise ValueError("Segmented series cannot be read in lockstep, use DecimatedSegmentedReader")
+        self.rec_dir = rec_dir
+        self.extension = extension
+        self.tags = channel_tags(rec_dir)
+        self.channel_ids = []
+        self.readers = []
+        for ch_id, path in channel_files(rec_dir, extension, channels):
+            if extension == 'bin':
+                reader = NativeReader(path, num_files=num_files, **reader_args)
+            else:
+                reader = DecimatedContinuousReader(path, num_files=num_files, **reader_args)
+            self.channel_ids.append(ch_id)
+            self.readers.append(reader)
+        if not self.readers:
+            raise LookupError("No '%s' channels found in %s" % (extension, rec_dir))
+        self.sample_rate = self.readers[0].header_info['sample_rate']
+        self._check_consistency()
+        if extension == 'bin':
+            self._align_frames()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.readers))
+
+    @property
+    def channel_names(self):
+        """Channel tags from recmeta.json, or the channel ids as strings"""
+        return [self.tags.get(ch_id, str(ch_id)) for ch_id in self.channel_ids]
+
+    def _check_consistency(self):
+        reference = self.readers[0]
+        for ch_id, reader in zip(self.channel_ids, self.readers):
+            for key in ('rec_id', 'file_sequence', 'sample_rate'):
+                if reader.header_info[key] != reference.header_info[key]:
+                    raise ValueError("Channel %d does not match channel %d in %s (%s != %s)" %
+                                     (ch_id, self.channel_ids[0], key,
+                                      reader.header_info[key], reference.header_info[key]))
+            if reader.seq != reference.seq:
+                raise ValueError("Channel %d starts at file %08X while channel %d starts at %08X" %
+                                 (ch_id, reader.seq, self.channel_ids[0], reference.seq))
+
+    def _align_frames(self):
+        """Skip frames in the channels that start earlier, so that the first
+        frame counters of all channels match"""
+        first_frames = []
+        for reader in self.readers:
+            raw = reader.raw_frames(0, 1)
+            if len(raw) == 0:
+                raise ValueError("Channel file %s holds no frames" % reader.base_path)
+            footer = int(raw[0].view('<u4')[15])
+            first_frames.append(footer & reader.footer_idx_samp_mask)
+        latest = max(first_frames)
+        for reader, first_frame in zip(self.readers, first_frames):
+            reader.last_frame = latest - 1
+            if latest > first_frame:
+                reader.skip_frames(latest - first_frame)
+                reader.last_frame = latest - 1
+
+    def _read_blocks(self, read_channel, num_samples, out, dtype):
+        if out is None:
+            out = empty([len(self.readers), num_samples], dtype=dtype)
+        results = list(self._pool.map(read_channel, self.readers, out))
+        # The channels read at the end of the recording are cut to the shortest
+        return out[:, :min(len(result) for result in results)]
+
+    def read_frames(self, num_frames, out=None, dtype=float64):
+        """Read num_frames frames from every native channel, returns a
+        (channels, num_frames * 20) array, fewer samples at the end of the
+        recording (as many as the shortest channel holds) and none past it"""
+        if self.extension != 'bin':
+            raise TypeError("read_frames is only available for native 'bin' recordings")
+        return self._read_blocks(lambda reader, row: reader.read_frames(num_frames, out=row, partial=True),
+                                 num_frames * 20, out, dtype)
+
+    def read_data(self, num_samples, out=None, dtype=float64):
+        """Read num_samples samples from every continuous decimated channel,
+        returns a (channels, num_samples) array, fewer samples at the end of
+        the recording (as many as the shortest channel holds) and none past it"""
+        if self.extension == 'bin':
+            raise TypeError("read_data is only available for continuous decimated recordings")
+
+        def read_channel(reader, row):
+            if row.dtype == float32:
+                return reader.read_data(num_samples, out=row, partial=True)
+            data = reader.read_data(num_samples, partial=True)
+            row[:len(data)] = data
+            return data
+        return self._read_blocks(read_channel, num_samples, out, dtype)
+
+    def close(self):
+        self._pool.shutdown()
+        for reader in self.readers:
+            reader.close()
+
+
+class RecordingArray(object):
+    """Lazy (channels, samples) array over all the files of a recording
+
+    Indexing returns another lazy view without reading anything, i.e.
+    rec["E1", t0:t1], rec[:, 1000000:2000000] or rec[["E1", "E2"], ::150].
+    Channels are selected by position, channel id string or tag from
+    recmeta.json. Samples are selected by integer index or, with float
+    bounds, by epoch time. The data is only read when the view is converted
+    to an array (np.asarray(view) or view.read()), with random access reads
+    of just the frames or samples it covers, strided views included.
+
+    Native channels are aligned on their frame counters like in Recording.
+    Samples are addressed by position in the files, missing frames are not
+    filled in.
+    """
+
+    def __init__(self, rec_dir, extension='bin', channels=None):
+        if extension in SEGMENTED_EXTENSIONS:
+            raise ValueError("Segmented series have no continuous sample index")
+        self.rec_dir = rec_dir
+        self.extension = extension
+        tags = channel_tags(rec_dir)
+        self.readers = []
+        self.channel_ids = []
+        for ch_id, path in channel_files(rec_dir, extension, channels):
+            reader_class = NativeReader if extension == 'bin' else DecimatedContinuousReader
+            self.readers.append(reader_class(path, num_files=sequence_length(path)))
+            self.channel_ids.append(ch_id)
+        if not self.readers:
+            raise LookupError("No '%s' channels found in %s" % (extension, rec_dir))
+        self.channel_names = [tags.get(ch_id, str(ch_id)) for ch_id in self.channel_ids]
+        self.sample_rate = float(self.readers[0].header_info['sample_rate'])
+        self.dtype = dtype(float64 if extension == 'bin' else float32)
+        self._offsets = [0] * len(self.readers)
+        if extension == 'bin':
+            first_frames = [int(reader.absolute_frames(0, 1)[0]) for reader in self.readers]
+            latest = max(first_frames)
+            self._offsets = [(latest - first_frame) * 20 for first_frame in first_frames]
+            self.start_time = self.readers[0].header_info['rec_id'] + latest * 20 / self.sample_rate
+            lengths = [reader.frame_count() * 20 for reader in self.readers]
+        else:
+            self.start_time = float(self.readers[0].file_start_times()[0])
+            lengths = [reader.sample_count() for reader in self.readers]
+        self._channels = list(range(len(self.readers)))
+        self._samples = range(min(length - offset for length, offset in zip(lengths, self._offsets)))
+        self._squeeze_channels = False
+
+    def _view(self, channels, samples, squeeze_channels):
+        view = object.__new__(RecordingArray)
+        view.__dict__.update(self.__dict__)
+        view._channels = channels
+        view._samples = samples
+        view._squeeze_channels = squeeze_channels
+        return view
+
+    @property
+    def shape(self):
+        shape = () if self._squeeze_channels else (len(self._channels),)
+        if isinstance(self._samples, range):
+            shape += (len(self._samples),)
+        return shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "<RecordingArray %s %s shape=%s dtype=%s>" % (self.rec_dir, self.extension, self.shape, self.dtype)
+
+    def _channel_position(self, key):
+        if isinstance(key, str):
+            names = [self.channel_names[position] for position in self._channels]
+            ids = [str(self.channel_ids[position]) for position in self._channels]
+            if key in names:
+                return names.index(key)
+            if key in ids:
+                return ids.index(key)
+            raise KeyError("No channel '%s' in %s" % (key, self.rec_dir))
+        return key
+
+    def _sample_index(self, value):
+        """Integer sample index, or the first sample at or after the epoch time
+        value if it is a float"""
+        if isinstance(value, float):
+            return max(0, ceil((value - self.start_time) * self.sample_rate - 1e-6 * self.sample_rate))
+        return value
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2 or (self._squeeze_channels and len(key) > 1):
+            raise IndexError("Too many indices for a %d-D recording array" % self.ndim)
+        channels, squeeze_channels, samples = self._channels, self._squeeze_channels, self._samples
+        keys = list(key)
+        if not squeeze_channels:
+            channel_key = keys.pop(0)
+            if isinstance(channel_key, slice):
+                channels = channels[channel_key]
+            elif isinstance(channel_key, (list, tuple)):
+                channels = [channels[self._channel_position(item)] for item in channel_key]
+            else:
+                channels = [channels[self._channel_position(channel_key)]]
+                squeeze_channels = True
+        if keys:
+            if not isinstance(samples, range):
+                raise IndexError("Too many indices for a %d-D recording array" % self.ndim)
+            sample_key = keys[0]
+            if isinstance(sample_key, slice):
+                samples = samples[slice(self._sample_index(sample_key.start), self._sample_index(sample_key.stop),
+                                        sample_key.step)]
+            else:
+                samples = samples[self._sample_index(sample_key)]
+        return self._view(channels, samples, squeeze_channels)
+
+    def _read_channel(self, position, samples):
+        reader = self.readers[position]
+        indices = samples if samples.step > 0 else samples[::-1]
+        if not len(indices):
+            return empty([0], dtype=self.dtype)
+        first = indices.start + self._offsets[position]
+        if self.extension != 'bin':
+            if indices.step == 1:
+                data = reader.samples(first, len(indices))
+            else:
+                data = reader.map_samples().take(arange(len(indices)) * indices.step + first)
+        elif indices.step == 1:
+            data = reader.read_samples_at(first, len(indices))
+        elif indices.step < 20:
+            # Every frame in the range holds samples of the view
+            data = reader.read_samples_at(first, indices[-1] - indices.start + 1)[::indices.step]
+        else:
+            # Decode only the frames holding the samples of the view
+            wanted = arange(len(indices), dtype=int64) * indices.step + first
+            frames, _ = reader._decode_frames(reader.map_frames().take(wanted // 20))
+            data = reader._scale(frames, empty(frames.shape))[arange(len(wanted)), wanted % 20]
+        return data if samples.step > 0 else data[::-1]
+
+    def read(self):
+        """Read the data of this view into a new array"""
+        if isinstance(self._samples, range):
+            out = empty([len(self._channels), len(self._samples)], dtype=self.dtype)
+            for row, position in enumerate(self._channels):
+                out[row] = self._read_channel(position, self._samples)
+        else:
+            out = empty([len(self._channels)], dtype=self.dtype)
+            for row, position in enumerate(self._channels):
+                out[row] = self._read_channel(position, range(self._samples, self._samples + 1))[0]
+        return out[0] if self._squeeze_channels else out
+
+    def __array__(self, dtype=None, copy=None):
+        data = asarray(self.read())
+        return data if dtype is None else data.astype(dtype)
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
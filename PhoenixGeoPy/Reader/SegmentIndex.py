@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Persistent index of the segments of a segmented-decimated time series
+sequence (i.e. *.td_24k) of the MTU-5C Family
+
+The index is built by walking the 32 byte subheaders of every file in the
+sequence once, seeking over the payloads, and is stored in a sidecar file next
+to the first file of the sequence. The sidecar remembers the size and mtime of
+every indexed file, and is rebuilt automatically when any of them change.
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+from numpy import arange, array, empty, fromfile, float32, load, savez, searchsorted
+from PhoenixGeoPy.Reader.Headers import SUBHEADER_STRUCT, SUBHEADER_SIZE
+
+SEGMENT_INDEX_DTYPE = [('file', 'u4'),             # Position of the file in the indexed sequence
+                       ('offset', 'u8'),           # Byte offset of the subheader within the file
+                       ('timestamp', 'u4'),
+                       ('samplesInRecord', 'u4'),
+                       ('satCount', 'u2'),
+                       ('missCount', 'u2'),
+                       ('minVal', 'f4'),
+                       ('maxVal', 'f4'),
+                       ('avgVal', 'f4')]
+
+
+def file_stats(paths):
+    """Sizes and mtimes (ns) of the files, to tell when a sidecar is stale"""
+    sizes = []
+    mtimes = []
+    for path in paths:
+        stat = os.stat(path)
+        sizes.append(stat.st_size)
+        mtimes.append(stat.st_mtime_ns)
+    return array(sizes, dtype='u8'), array(mtimes, dtype='i8')
+
+
+class SegmentIndex(object):
+    """Index of every segment in a sequence of segmented files"""
+
+    sidecar_suffix = '.segidx.npz'
+
+    def __init__(self, paths, header_size=128, index_path=None):
+        self.paths = list(paths)
+        self.header_size = header_size
+        if index_path is None and self.paths:
+            index_path = self.paths[0] + self.sidecar_suffix
+        self.index_path = index_path
+        self.segments = empty([0], dtype=SEGMENT_INDEX_DTYPE)
+        if not self.load():
+            self.build()
+            self.save()
+
+    def _file_stats(self):
+        return file_stats(self.paths)
+
+    def build(self):
+        """Scan the subheaders of all files in the sequence"""
+        entries = []
+        for file_pos, path in enumerate(self.paths):
+            with open(path, 'rb') as stream:
+                offset = self.header_size
+                stream.seek(offset)
+                subheader_bytes = stream.read(SUBHEADER_SIZE)
+                while len(subheader_bytes) == SUBHEADER_SIZE:
+                    fields = SUBHEADER_STRUCT.unpack_from(subheader_bytes)
+                    entries.append((file_pos, offset) + fields)
+                    offset += SUBHEADER_SIZE + 4 * fields[1]
+                    stream.seek(offset)
+                    subheader_bytes = stream.read(SUBHEADER_SIZE)
+        self.segments = array(entries, dtype=SEGMENT_INDEX_DTYPE)
+
+    def load(self):
+        """Load the sidecar, returns False if it is missing or stale"""
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return False
+        try:
+            with load(self.index_path, allow_pickle=False) as sidecar:
+                names = [os.path.basename(path) for path in self.paths]
+                if list(sidecar['files']) != names:
+                    return False
+                sizes, mtimes = self._file_stats()
+                if (sidecar['sizes'] != sizes).any() or (sidecar['mtimes'] != mtimes).any():
+                    return False
+                self.segments = sidecar['segments']
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def save(self):
+        """Write the sidecar, silently keeping the index in memory only when
+        the data directory is not writable"""
+        if self.index_path is None:
+            return False
+        sizes, mtimes = self._file_stats()
+        try:
+            with open(self.index_path, 'wb') as sidecar:
+                savez(sidecar, segments=self.segments, sizes=sizes, mtimes=mtimes,
+                      files=array([os.path.basename(path) for path in self.paths]))
+        except OSError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.segments)
+
+    def subheader(self, segment):
+        """Subheader fields of a segment, in the same form as
+        DecimatedSegmentedReader.subheader"""
+        entry = self.segments[segment]
+        return {'timestamp': int(entry['timestamp']),
+                'samplesInRecord': int(entry['samplesInRecord']),
+                'satCount': int(entry['satCount']),
+                'missCount': int(entry['missCount']),
+                'minVal': float(entry['minVal']),
+                'maxVal': float(entry['maxVal']),
+                'avgVal': float(entry['avgVal'])}
+
+    def read(self, segment):
+        """Read the float32 payload of one segment"""
+        entry = self.segments[segment]
+        return fromfile(self.paths[entry['file']], dtype=float32,
+                        count=int(entry['samplesInRecord']),
+                        offset=int(entry['offset']) + SUBHEADER_SIZE)
+
+    def between(self, t0, t1, sample_rate):
+        """Indices of the segments that overlap the time range [t0, t1), with
+        times in the same epoch seconds as the subheader timestamps"""
+        timestamps = self.segments['timestamp']
+        ends = timestamps + self.segments['samplesInRecord'] / float(sample_rate)
+        first = searchsorted(timestamps, t0, side='right')
+        # The segment starting just before t0 may still overlap it
+        if first > 0 and ends[first - 1] > t0:
+            first -= 1
+        last = searchsorted(timestamps, t1, side='left')
+        return arange(first, max(first, last))
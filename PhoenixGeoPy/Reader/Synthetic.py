@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Synthetic time series files of the MTU-5C Family
+
+Writes valid native (.bin), segmented decimated (.td_24k) and continuous
+decimated (.td_150) sequences of any size and number of files, with headers
+packed from the same layout the readers parse (see Headers). Native frames
+carry proper footers: a 28 bit frame counter that keeps counting across files
+and rolls over, optional dropped frames, and optional saturation bits.
+
+The samples are a sine wave plus noise from a seeded generator, so the same
+arguments always produce the same files. Data is generated and written in
+blocks, memory use does not depend on the size of the files.
+
+i.e. write_recording("/tmp/survey", products=('bin', 'td_150'), num_files=4)
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import json
+import time
+from numpy import arange, asarray, clip, empty, float32, int32, isin, pi, sin, uint8
+from numpy.random import default_rng
+from PhoenixGeoPy.Reader.Headers import HEADER_FIELDS, HEADER_STRUCT, SUBHEADER_STRUCT
+
+# Board configurations of an MTU-5C, the first 5 channels of a standard layout
+CHANNEL_TAGS = ('H2', 'E1', 'H1', 'H3', 'E2')
+_conf_fp = {'E': (16, 40, 0, 0, 0, 227, 127, 0),   # E channel, preamp on
+            'H': (4, 1, 0, 0, 0, 0, 0, 0)}          # H channel, differential sensor
+
+_default_header = {'file_version': 2,
+                   'length': 128,
+                   'inst_type': b'MTU-5C',
+                   'inst_serial': b'10128',
+                   'ch_hwv': b'BCM01-I ',
+                   'ch_ser': b'03118D',
+                   'ch_fir': 65567,
+                   'sample_rate_exp': 0,
+                   'frame_size': 64,
+                   'decimation_node_id': 0,
+                   'frame_rollover_count': 0,
+                   'gps_long': -79.3936,
+                   'gps_lat': 43.6963,
+                   'gps_height': 140.0,
+                   'gps_hacc': 17512,
+                   'gps_vacc': 22404,
+                   'timing_flags': 55,
+                   'timing_sat_count': 7,
+                   'timing_stability': 201}
+
+FRAGMENT_PERIOD = {'bin': 60, 'td_24k': 360, 'td_150': 360}
+_file_type = {'bin': 1, 'td_24k': 2, 'td_150': 2}
+_bytes_per_sample = {'bin': 3, 'td_24k': 4, 'td_150': 4}
+_sample_rate = {'bin': 24000, 'td_24k': 24000, 'td_150': 150}
+
+
+def make_header(**fields):
+    """Pack a 128 byte file header. Any field of the header layout can be
+    given, the rest take the values of a typical MTU-5C file"""
+    values = dict(_default_header, ch_id=0, rec_id=0, file_sequence=0, frag_period=60,
+                  sample_rate_base=24000, bytes_per_sample=3, file_type=1, conf_fp=_conf_fp['E'])
+    values.update(fields)
+    flat = []
+    for name in HEADER_FIELDS:
+        value = values.get(name, 0)
+        if name == 'conf_fp':
+            flat.extend(value)
+        else:
+            flat.append(value)
+    return HEADER_STRUCT.pack(*flat)
+
+
+def file_name(inst_id, rec_id, ch_id, seq, extension):
+    return "%s_%08X_%d_%08X.%s" % (inst_id, rec_id, ch_id, seq, extension)
+
+
+class _Signal(object):
+    """Seeded sine plus noise, continuous across calls"""
+
+    def __init__(self, sample_rate, amplitude, frequency=1.0, noise=0.05, seed=0):
+        self.sample_rate = float(sample_rate)
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.noise = noise
+        self.rng = default_rng(seed)
+        self.position = 0
+
+    def next(self, num_samples):
+        t = (self.position + arange(num_samples)) / self.sample_rate
+        self.position += num_samples
+        signal = sin(2 * pi * self.frequency * t) + self.noise * self.rng.standard_normal(num_samples)
+        return self.amplitude * signal
+
+
+def encode_frames(samples, frame_counts, sat_codes=None):
+    """Pack (frames, 20) integer A/D values (24 bit range) into native 64
+    byte frames with the given 28 bit counters and 3 bit saturation codes"""
+    samples = asarray(samples)
+    frames = empty((samples.shape[0], 64), dtype=uint8)
+    frames[:, :60] = samples.astype('>i4').view(uint8).reshape(-1, 20, 4)[:, :, 1:].reshape(-1, 60)
+    footers = asarray(frame_counts).astype('<u4') & 0x0fffffff
+    if sat_codes is not None:
+        footers |= (asarray(sat_codes).astype('<u4') & 0x7) << 28
+    frames[:, 60:] = footers.view(uint8).reshape(-1, 4)
+    return frames
+
+
+def write_native(ch_dir, num_files, frames_per_file, inst_id='10128', rec_id=0x60877DFD, ch_id=0,
+                 first_frame=0, dropped=(), saturated=(), channel_type='E', seed=0, block_frames=12000):
+    """Write a native 24 kSps sequence of num_files files of frames_per_file
+    frames each, returns their paths
+
+    first_frame is the counter of the first frame, set it close to 2^28 to
+    exercise counter rollovers. dropped holds the frame numbers (counted
+    from first_frame, before wrapping) left out of the files and saturated
+    those flagged as saturated; dropped frames do not count towards
+    frames_per_file."""
+    os.makedirs(ch_dir, exist_ok=True)
+    sample_rate = _sample_rate['bin']
+    signal = _Signal(sample_rate, 0.8 * (1 << 23), seed=seed)
+    dropped = asarray(sorted(dropped), dtype='i8') + first_frame
+    saturated = asarray(sorted(saturated), dtype='i8') + first_frame
+    frame = first_frame
+    paths = []
+    for file_idx in range(num_files):
+        seq = file_idx + 1
+        path = os.path.join(ch_dir, file_name(inst_id, rec_id, ch_id, seq, 'bin'))
+        with open(path, 'wb') as stream:
+            stream.write(make_header(rec_id=rec_id, ch_id=ch_id, file_sequence=seq - 1, frag_period=60,
+                                     frame_rollover_count=frame >> 28, conf_fp=_conf_fp[channel_type]))
+            written = 0
+            while written < frames_per_file:
+                count = min(block_frames, frames_per_file - written)
+                # Generate enough frames to keep count of them after the drops
+                numbers = arange(frame, frame + count + len(dropped))
+                numbers = numbers[~isin(numbers, dropped)][:count]
+                samples = signal.next(count * 20).reshape(count, 20)
+                sat_codes = isin(numbers, saturated) * 1
+                stream.write(encode_frames(clip(samples, -(1 << 23), (1 << 23) - 1).astype(int32),
+                                           numbers, sat_codes).tobytes())
+                written += count
+                frame = int(numbers[-1]) + 1
+        paths.append(path)
+    return paths
+
+
+def write_continuous(ch_dir, num_files, samples_per_file=None, inst_id='10128', rec_id=0x608783F4, ch_id=0,
+                     sample_rate=150, extension='td_150', channel_type='E', seed=0, block_samples=1 << 20):
+    """Write a continuous decimated sequence of float32 samples, one fragment
+    period (360 s) of samples per file unless samples_per_file is given.
+    Returns the paths of the files"""
+    os.makedirs(ch_dir, exist_ok=True)
+    frag_period = FRAGMENT_PERIOD['td_150']
+    if samples_per_file is None:
+        samples_per_file = frag_period * sample_rate
+    signal = _Signal(sample_rate, 0.5, frequency=0.1, seed=seed)
+    paths = []
+    for file_idx in range(num_files):
+        seq = file_idx + 1
+        path = os.path.join(ch_dir, file_name(inst_id, rec_id, ch_id, seq, extension))
+        with open(path, 'wb') as stream:
+            stream.write(make_header(file_type=2, rec_id=rec_id, ch_id=ch_id, file_sequence=seq,
+                                     frag_period=frag_period, sample_rate_base=sample_rate, bytes_per_sample=4,
+                                     decimation_node_id=2, conf_fp=_conf_fp[channel_type]))
+            written = 0
+            while written < samples_per_file:
+                count = min(block_samples, samples_per_file - written)
+                stream.write(signal.next(count).astype(float32).tobytes())
+                written += count
+        paths.append(path)
+    return paths
+
+
+def write_segmented(ch_dir, num_files, segments_per_file=12, samples_per_segment=48000, inst_id='10128',
+                    rec_id=0x608783F4, ch_id=0, sample_rate=24000, segment_period=30, missing=(),
+                    extension='td_24k', channel_type='E', seed=0):
+    """Write a segmented decimated sequence, each segment of
+    samples_per_segment float32 samples behind its 32 byte subheader, one
+    segment every segment_period seconds. missing holds the global indices of
+    segments given a non-zero missCount. Returns the paths of the files"""
+    os.makedirs(ch_dir, exist_ok=True)
+    frag_period = FRAGMENT_PERIOD['td_24k']
+    signal = _Signal(sample_rate, 0.25, frequency=10.0, seed=seed)
+    missing = set(missing)
+    segment = 0
+    paths = []
+    for file_idx in range(num_files):
+        seq = file_idx + 1
+        path = os.path.join(ch_dir, file_name(inst_id, rec_id, ch_id, seq, extension))
+        with open(path, 'wb') as stream:
+            stream.write(make_header(file_type=2, rec_id=rec_id, ch_id=ch_id, file_sequence=seq,
+                                     frag_period=frag_period, sample_rate_base=sample_rate, bytes_per_sample=4,
+                                     conf_fp=_conf_fp[channel_type]))
+            for _ in range(segments_per_file):
+                data = signal.next(samples_per_segment).astype(float32)
+                timestamp = rec_id + (segment + 1) * segment_period
+                stream.write(SUBHEADER_STRUCT.pack(timestamp, samples_per_segment, 0,
+                                                   20 if segment in missing else 0,
+                                                   data.min(), data.max(), data.mean()))
+                stream.write(data.tobytes())
+                segment += 1
+        paths.append(path)
+    return paths
+
+
+def write_recording(root, products=('bin',), num_files=2, channel_tags=CHANNEL_TAGS, inst_id='10128',
+                    rec_id=0x60877DFD, native_frames_per_file=72000):
+    """Write a whole recording directory <root>/<inst>_<date>/<ch>/ with one
+    channel per tag, the requested products and a minimal recmeta.json.
+    Returns the recording directory"""
+    rec_dir = os.path.join(root, "%s_%s" % (inst_id, time.strftime("%Y-%m-%d-%H%M%S", time.gmtime(rec_id))))
+    chans = []
+    for ch_id, tag in enumerate(channel_tags):
+        channel_type = 'E' if tag.startswith('E') else 'H'
+        ch_dir = os.path.join(rec_dir, str(ch_id))
+        for extension in products:
+            if extension == 'bin':
+                write_native(ch_dir, num_files, native_frames_per_file, inst_id, rec_id, ch_id,
+                             channel_type=channel_type, seed=ch_id)
+            elif extension == 'td_24k':
+                write_segmented(ch_dir, num_files, inst_id=inst_id, rec_id=rec_id, ch_id=ch_id,
+                                channel_type=channel_type, seed=ch_id)
+            else:
+                write_continuous(ch_dir, num_files, inst_id=inst_id, rec_id=rec_id, ch_id=ch_id,
+                                 extension=extension, sample_rate=int(extension.split('_')[1]),
+                                 channel_type=channel_type, seed=ch_id)
+        chans.append({'tag': tag, 'ty': 'E' if channel_type == 'E' else 'M', 'on': 1,
+                      'sampleRate': _sample_rate['bin'], 'hw': _default_header['ch_hwv'].decode()})
+    recmeta = {'name': 'recording', 'version': 6,
+               'chconfig': {'name': 'chconfig', 'chans': chans},
+               'channel_map': {'mapping': [{'idx': ch_id, 'tag': tag} for ch_id, tag in enumerate(channel_tags)]}}
+    with open(os.path.join(rec_dir, 'recmeta.json'), 'w') as recmeta_file:
+        json.dump(recmeta, recmeta_file, indent='\t')
+    return rec_dir
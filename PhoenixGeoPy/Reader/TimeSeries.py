@@ -6,26 +6,164 @@ and native sampling rate time series formats of the MTU-5C family.
 
 __author__ = 'Jorge Torres-Solis'
 
-from numpy import empty, fromfile, float32, append
-from struct import unpack_from, unpack
+from numpy import (dtype, empty, zeros, full, frombuffer, memmap, concatenate, arange, cumsum, maximum,
+                   searchsorted, unique, asarray, float32, float64, uint8, int64, multiply, diff, nonzero, nan)
+from math import ceil, floor
+from bisect import bisect_right
 import os
-import string
-from cmath import phase
+import time
+from struct import Struct
+import asyncio
+import logging
 from PhoenixGeoPy.Reader.DataScaling import DataScaling
+from PhoenixGeoPy.Reader.Files import parse_file_name, SEGMENTED_EXTENSIONS
+from PhoenixGeoPy.Reader.Headers import (ChannelConfig, CONFIG_ATTRIBUTES, parse_header, parse_subheader,
+                                         scan_headers, SUBHEADER_DTYPE, SUBHEADER_SIZE)
+from PhoenixGeoPy.Reader.SegmentIndex import SegmentIndex
+from PhoenixGeoPy.Reader.Instrumentation import instrument, uninstrument
+from PhoenixGeoPy.Reader.Prefetch import FilePrefetcher, read_ahead
+from PhoenixGeoPy.Reader.ChunkCache import CACHE
+from PhoenixGeoPy.Reader.Overview import Overview
+
+LOGGER = logging.getLogger('PhoenixGeoPy.Reader')
+
+
+def decode_frames(raw, scratch=None):
+    """Split a block of native 64 byte frames into samples and footers
+
+    raw is any bytes-like object holding a whole number of frames. Returns a
+    (frames, 20) big-endian int32 array with the 24 bit samples left-justified
+    in 32 bits (the same value unpack(">i", sample + b'\\x00') produces) and a
+    view of the frame footers as a uint32 array.
+
+    scratch is an optional zero-initialised uint8 array of at least
+    (frames, 20, 4) elements, the samples returned are a view of it. Reusing it
+    between calls avoids allocating a new one per block.
+    """
+    frames = frombuffer(raw, dtype=uint8).reshape(-1, 64)
+    if scratch is None or scratch.shape[0] < frames.shape[0]:
+        scratch = zeros((frames.shape[0], 20, 4), dtype=uint8)
+    padded = scratch[:frames.shape[0]]
+    padded[:, :, :3] = frames[:, :60].reshape(-1, 20, 3)
+    samples = padded.view('>i4').reshape(-1, 20)
+    footers = frombuffer(raw, dtype='<u4').reshape(-1, 16)[:, 15]
+    return samples, footers
+
+
+# Missing and saturated frames found while streaming native frames. frame is the
+# running index of the frame in the stream, gap the number of frames missing
+# right before it (negative if the counter went backwards), and sat_count the
+# saturation count reported in its footer
+FRAME_EVENT_DTYPE = [('frame', 'i8'), ('frame_count', 'u4'), ('gap', 'i8'), ('sat_count', 'u2')]
+
+# Frames per cached chunk of native random access reads (0.5 s at 24 kHz, 96 kB scaled)
+CHUNK_FRAMES = 600
+
+
+def detect_frame_events(footers, last_frame, first_frame_index=0, report_hw_sat=False):
+    """Find the gaps in the 28 bit frame counters and the saturated frames of
+    a block of footers in one pass
+
+    last_frame is the counter of the frame preceding the block, or None if
+    unknown (the first frame is then taken as the reference). Returns the
+    events as a FRAME_EVENT_DTYPE array and the gap before each frame."""
+    frame_counts = (footers & 0x0fffffff).astype(int64)
+    previous = frame_counts[0] - 1 if last_frame is None else last_frame
+    # Signed difference modulo 2^28 to survive counter rollovers
+    gaps = ((diff(frame_counts, prepend=previous) + (1 << 27)) & 0x0fffffff) - (1 << 27) - 1
+    flagged = gaps != 0
+    sat_counts = None
+    if report_hw_sat:
+        sat_counts = (footers & 0x70000000) >> 24
+        flagged |= sat_counts != 0
+    idx = nonzero(flagged)[0]
+    events = empty(len(idx), dtype=FRAME_EVENT_DTYPE)
+    events['frame'] = idx + first_frame_index
+    events['frame_count'] = frame_counts[idx]
+    events['gap'] = gaps[idx]
+    events['sat_count'] = sat_counts[idx] if sat_counts is not None else 0
+    return events, gaps
+
+
+class _MappedSequence(object):
+    """Read-only memory maps over the payload of every file in a sequence
+
+    Records (64 byte frames, or float32 samples) are addressed with a single
+    running index across all files, the header of each file is skipped.
+    """
+    def __init__(self, paths, header_size, record_dtype, record_shape=()):
+        self.paths = []
+        self.positions = []   # Position of each mapped file in the list of paths given
+        self.maps = []
+        self.starts = [0]
+        record_dtype = dtype(record_dtype)
+        self.record_bytes = record_dtype.itemsize
+        for dim in record_shape:
+            self.record_bytes *= dim
+        for position, path in enumerate(paths):
+            count = (os.path.getsize(path) - header_size) // self.record_bytes
+            if count <= 0:
+                continue
+            self.paths.append(path)
+            self.positions.append(position)
+            self.maps.append(memmap(path, dtype=record_dtype, mode='r', offset=header_size,
+                                    shape=(count,) + tuple(record_shape)))
+            self.starts.append(self.starts[-1] + count)
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def locate(self, index):
+        """Returns (file position in the sequence, record index within that file)"""
+        if index < 0 or index >= len(self):
+            raise IndexError("Record %d out of range [0, %d)" % (index, len(self)))
+        file_idx = bisect_right(self.starts, index) - 1
+        return file_idx, index - self.starts[file_idx]
+
+    def records(self, start, count):
+        """Records [start, start + count), a zero-copy view when they all
+        live in the same file, a copy otherwise. Truncated at the end of the
+        sequence"""
+        stop = min(start + count, len(self))
+        if start >= stop:
+            return self.maps[0][:0] if self.maps else empty([0])
+        file_idx, local = self.locate(start)
+        if stop <= self.starts[file_idx + 1]:
+            return self.maps[file_idx][local:local + stop - start]
+        parts = []
+        while start < stop:
+            file_idx, local = self.locate(start)
+            part = self.maps[file_idx][local:local + stop - start]
+            parts.append(part)
+            start += len(part)
+        return concatenate(parts)
+
+    def take(self, indices):
+        """Records at the given running indices, gathered from the maps so
+        that only the pages holding them are read"""
+        indices = asarray(indices, dtype=int64)
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError("Record indices out of range [0, %d)" % len(self))
+        out = empty((len(indices),) + self.maps[0].shape[1:], dtype=self.maps[0].dtype)
+        file_idx = searchsorted(self.starts, indices, side='right') - 1
+        for idx in unique(file_idx):
+            selected = file_idx == idx
+            out[selected] = self.maps[idx][indices[selected] - self.starts[idx]]
+        return out
 
 
 class _TSReaderBase(object):
     def __init__(self, path, num_files=1, header_size=128, report_hw_sat=False):
         self.base_path = path
         self.base_dir, self.file_name = os.path.split(self.base_path)
-        file_name_base, self.file_extension = self.file_name.split(".", 2)
-        file_parts = file_name_base.split("_")
-        self.inst_id = file_parts[0]
-        self.rec_id = file_parts[1]
-        self.ch_id = file_parts[2]
-        seq_str = file_parts[3]
-        self.seq = int(seq_str, base=16)
+        self.inst_id, self.rec_id, self.ch_id, self.seq, self.file_extension = parse_file_name(self.file_name)
+        self.first_seq = self.seq
         self.last_seq = self.seq + num_files
+        self._mapped = None
+        self._overviews = {}    # Overview by (factor, base_block, overview_path), see overview
+        self.metrics = None     # ReaderMetrics while instrumented, see enable_metrics
+        self.prefetcher = None  # FilePrefetcher once enabled, see enable_prefetch
+        self.cache = CACHE      # ChunkCache of decoded random access reads, None to disable
         self.stream = None
         self.report_hw_sat = report_hw_sat
         self.header_info = {}
@@ -42,20 +180,30 @@ class _TSReaderBase(object):
         self.preamp_gain = 1.0
         self.attenuator_gain = 1.0
 
+    def _open_stream(self, path, prepared=None):
+        """Make path the current stream and read its header, or take the
+        (stream, header) already prepared for it by the prefetcher"""
+        if prepared is not None:
+            self.stream, self.dataHeader = prepared
+            return
+        self.stream = open(path, 'rb')
+        if self.header_size > 0:
+            self.dataHeader = self.stream.read(self.header_size)
+        if self.prefetcher is not None:
+            # Jumped to another file, prefetch the one after it instead
+            self.prefetcher.prepare(self.seq)
+
     def open_next(self):
+        if self.prefetcher is not None:
+            return self.prefetcher.open_next()
         ret_val = False
         if self.stream is not None:
             self.stream.close()
         self.seq += 1
         if self.seq < self.last_seq:
-            new_seq_str = "%08X" % (self.seq)
-            new_path = (self.base_dir + '/' + self.inst_id + '_' +
-                        self.rec_id + '_' + self.ch_id + '_' +
-                        new_seq_str + '.' + self.file_extension)
+            new_path = self.seq_path(self.seq)
             if os.path.exists(new_path):
-                self.stream = open(new_path, 'rb')
-                if self.header_size > 0:
-                    self.dataHeader = self.stream.read(self.header_size)
+                self._open_stream(new_path)
                 ret_val = True
 
         return ret_val
@@ -65,199 +213,185 @@ class _TSReaderBase(object):
         if self.stream is not None:
             self.stream.close()
         self.seq = file_seq_num
-        new_seq_str = "%08X" % (self.seq)
-        new_path = (self.base_dir + '/' + self.inst_id + '_' +
-                    self.rec_id + '_' + self.ch_id + '_' +
-                    new_seq_str + '.' + self.file_extension)
+        new_path = self.seq_path(self.seq)
         if os.path.exists(new_path):
-            print (" opening " + new_path)
-            self.stream = open(new_path, 'rb')
-            if self.header_size > 0:
-                self.dataHeader = self.stream.read(self.header_size)
+            LOGGER.info("opening %s", new_path)
+            self._open_stream(new_path)
             ret_val = True
 
         return ret_val
 
-    def __populate_channel_type(self, config_fp):
-        if config_fp[1] & 0x08 == 0x08:
-            self.channel_type = "E"
-        else:
-            self.channel_type = "H"
-        # Channel type detected by electronics
-        # this normally matches self.channel_type, but used in electronics design and testing
-        if config_fp[1] & 0x20 == 0x20:
-            self.detected_channel_type = 'E'
-        else:
-            self.detected_channel_type = 'H'
-
-    def __populate_lpf(self, config_fp):
-        if config_fp[0] & 0x80 == 0x80:            # LPF on
-            if config_fp[0] & 0x03 == 0x03:
-                self.lpf_Hz = 10
-            elif config_fp[0] & 0x03 == 0x02:
-                if (self.board_model_main == "BCM03" or self.board_model_main == "BCM06"):
-                    self.lpf_Hz = 1000
-                else:
-                    self.lpf_Hz = 100
-            elif config_fp[0] & 0x03 == 0x01:
-                if (self.board_model_main == "BCM03" or self.board_model_main == "BCM06"):
-                    self.lpf_Hz = 10000
-                else:
-                    self.lpf_Hz = 1000
-        else:                                      # LPF off
-            if (self.board_model_main == "BCM03" or self.board_model_main == "BCM06"):
-                self.lpf_Hz = 17800
+    def read_into(self, buf, record_size=1):
+        """Fill the writable buffer buf from the stream, crossing into the next
+        files of the sequence as needed. Returns the number of bytes read, a
+        whole number of record_size records, which is short of len(buf) only
+        at the end of the sequence"""
+        view = memoryview(buf).cast('B')
+        bytes_in_buf = 0
+        while bytes_in_buf < len(view):
+            local_read_size = 0
+            if self.stream is not None and not self.stream.closed:
+                local_read_size = self.stream.readinto(view[bytes_in_buf:])
+            if not local_read_size:
+                # Only whole records are ever stored, drop any trailing bytes
+                # in the previous file before moving on
+                bytes_in_buf -= bytes_in_buf % record_size
+                if not self.open_next():
+                    break
             else:
-                self.lpf_Hz = 10000
+                bytes_in_buf += local_read_size
+        return bytes_in_buf - bytes_in_buf % record_size
 
-    def __popuate_peamp_gain(self, config_fp):
-        if self.channel_type == "?":
-            raise Exception("Channel type must be set before attemting to calculate preamp gain")
-        preamp_on = bool(config_fp[0] & 0x10)
-        self.preamp_gain = 1.0
-        if self.channel_type == "E":
-            if preamp_on is True:
-                if self.board_model_main == "BCM01" or self.board_model_main == "BCM03":
-                    self.preamp_gain = 4.0
-                    if (self.board_model_revision == "L"):
-                        #Account for BCM01-L experimental prototype
-                        self.preamp_gain = 8.0
-                else:
-                    self.preamp_gain = 8.0
-                    # Acount for experimental prototype BCM05-A
-                    if self.header_info['ch_hwv'][0:7] == "BCM05-A":
-                        self.preamp_gain = 4.0
-    
-    def __populate_main_gain(self, config_fp):
-        # BCM05-B and BCM06 introduced different selectable gains
-        new_gains = True   # we asume any newer board will have the new gain banks
-        if self.board_model_main == "BCM01" or self.board_model_main == "BCM03":
-            # Original style 24 KSps boards and original 96 KSps boards
-            new_gains = False
-        if self.header_info['ch_hwv'][0:7] == "BCM05-A":
-            # Acount for experimental prototype BCM05-A, which also had original gain banks
-            new_gains = False
-        if config_fp[0] & 0x0C == 0x00:
-            self.channel_main_gain = 1.0
-        elif config_fp[0] & 0x0C == 0x04:
-            self.channel_main_gain = 4.0
-        elif config_fp[0] & 0x0C == 0x08:
-            self.channel_main_gain = 6.0
-            if not new_gains:
-                self.channel_main_gain = 16.0
-        elif config_fp[0] & 0x0C == 0x0C:
-            self.channel_main_gain = 8.0
-            if not new_gains:
-                self.channel_main_gain = 32.0
-
-    def __handle_sensor_range(self, config_fp):
-        """This function will adjust the intrinsic circuitry gain based on the
-           sensor range configuration in the configuration fingerprint
-           
-           For this, we consider that for the Electric channel, calibration path, or H-legacy
-           sensors all go through a 1/4 gain stage, and then they get a virtial x2 gain from
-           Single-ended-diff before the A/D. In the case of newer sensors (differential)
-           instead of a 1/4 gain stage, there is only a 1/2 gain stage
-           
-           Therefore, in the E,cal and legacy sensor case the circuitry gain is 1/2, while for
-           newer sensors it is 1
-           """
-        if self.channel_type == "?":
-            raise Exception("Channel type must be set before attemting to calculate preamp gain")
-        self.intrinsic_circuitry_gain = 0.5   
-        if self.channel_type == "H":
-            if config_fp[1] & 0x01 == 0x01:
-                self.intrinsic_circuitry_gain = 1.0
-
-    def __populate_attenuator_gain(self, config_fp):
-        self.attenuator_gain = 1.0    # Asume attenuator off
-        if self.channel_type == "?":
-            raise Exception("Channel type must be set before attemting to calculate preamp gain")
-        attenuator_on = bool(config_fp[4] & 0x01)
-        if attenuator_on and self.channel_type == "E":
-            new_attenuator = True  # By default assume that we are dealing with a newer types of boards
-            if self.board_model_main == "BCM01" or self.board_model_main == "BCM03":
-                # Original style 24 KSps boards and original 96 KSps boards
-                new_attenuator = False
-            if self.header_info['ch_hwv'][0:7] == "BCM05-A":
-                # Acount for experimental prototype BCM05-A, which also had original gain banks
-                new_attenuator = False
-
-            if new_attenuator:
-                self.attenuator_gain = 523.0 / 5223.0
+    def _complete_records(self, record_size):
+        """Number of whole records of record_size bytes already written to the
+        current file after the stream position"""
+        if self.stream is None or self.stream.closed:
+            return 0
+        return (os.fstat(self.stream.fileno()).st_size - self.stream.tell()) // record_size
+
+    def _next_file_ready(self):
+        """True once the next file of the sequence exists with a complete
+        header, which means that the current file will not grow any more"""
+        try:
+            return os.path.getsize(self.seq_path(self.seq + 1)) >= self.header_size
+        except OSError:
+            return False
+
+    def _read_available(self, chunk, out):
+        """Return the next chunk if it has been completely written, or None"""
+        raise NotImplementedError
+
+    def _chunk_buffer(self, chunk):
+        """Buffer reused for every chunk while following, None to allocate
+        one per chunk"""
+        return None
+
+    def _follow_steps(self, chunk, out, poll_interval, max_interval, timeout):
+        """Generator behind follow and follow_blocking, yields ('data', chunk)
+        or ('wait', seconds to wait before polling again)"""
+        if out is None:
+            out = self._chunk_buffer(chunk)
+        poll_interval, max_interval = float(poll_interval), float(max_interval)
+        delay = poll_interval
+        idle = 0.0
+        while True:
+            data = self._read_available(chunk, out)
+            if data is not None:
+                delay = poll_interval
+                idle = 0.0
+                yield 'data', data
+                continue
+            if timeout is not None and idle >= timeout:
+                return
+            yield 'wait', delay
+            idle += delay
+            delay = min(delay * 2, max_interval)
+
+    def follow_blocking(self, chunk, out=None, poll_interval=0.05, max_interval=1.0, timeout=None):
+        """Tail a sequence that is still being recorded.
+
+        Generator that yields chunks as soon as they are completely written,
+        waiting for more data and for the next file of the sequence to
+        appear (regardless of num_files). The files are polled, backing off
+        from poll_interval up to max_interval seconds while idle, and the
+        generator ends after timeout idle seconds (never if None). Chunks are
+        views of a reused buffer as in iter_chunks. A chunk is shorter than
+        requested only at the end of a file, and never holds partial frames
+        or segments"""
+        for kind, step in self._follow_steps(chunk, out, poll_interval, max_interval, timeout):
+            if kind == 'wait':
+                time.sleep(step)
+            else:
+                yield step
+
+    async def follow(self, chunk, out=None, poll_interval=0.05, max_interval=1.0, timeout=None):
+        """asyncio version of follow_blocking, for use with 'async for'"""
+        for kind, step in self._follow_steps(chunk, out, poll_interval, max_interval, timeout):
+            if kind == 'wait':
+                await asyncio.sleep(step)
             else:
-                self.attenuator_gain = 0.1
+                yield step
+
+    def seq_path(self, seq):
+        """Path of the file with sequence number seq in this reader's sequence"""
+        return (self.base_dir + '/' + self.inst_id + '_' +
+                self.rec_id + '_' + self.ch_id + '_' +
+                "%08X" % (seq) + '.' + self.file_extension)
+
+    def sequence_paths(self):
+        """Paths of the files in the sequence [first_seq, last_seq), stopping
+        at the first one that does not exist"""
+        paths = []
+        for seq in range(self.first_seq, self.last_seq):
+            path = self.seq_path(seq)
+            if not os.path.exists(path):
+                break
+            paths.append(path)
+        return paths
+
+    def map_sequence(self, record_dtype, record_shape=()):
+        """Memory map the whole sequence on first use, see _MappedSequence"""
+        if self._mapped is None:
+            self._mapped = _MappedSequence(self.sequence_paths(), self.header_size, record_dtype, record_shape)
+        return self._mapped
+
+    def seek_record(self, index, record_dtype, record_shape=()):
+        """Position the stream at the record with running index 'index' of
+        the mapped sequence, so that streamed reads continue from there"""
+        mapped = self.map_sequence(record_dtype, record_shape)
+        file_idx, local = mapped.locate(index)
+        path = mapped.paths[file_idx]
+        if self.stream is None or self.stream.name != path:
+            if self.stream is not None:
+                self.stream.close()
+            self.seq = self.first_seq + mapped.positions[file_idx]
+            self._open_stream(path)
+        self.stream.seek(self.header_size + local * mapped.record_bytes)
 
     def unpack_header(self):
-        self.header_info['file_type'] = unpack_from('B', self.dataHeader, 0)[0]
-        self.header_info['file_version'] = unpack_from('B', self.dataHeader, 1)[0]
-        self.header_info['length'] = unpack_from('H', self.dataHeader, 2)[0]
-        self.header_info['inst_type'] = unpack_from('8s', self.dataHeader, 4)[0].decode("utf-8").strip(' ').strip('\x00')
-        self.header_info['inst_serial'] = b''.join(unpack_from('cccccccc', self.dataHeader, 12)).strip(b'\x00')
-        self.header_info['rec_id'] = unpack_from('I', self.dataHeader, 20)[0]
-        self.header_info['ch_id'] = unpack_from('B', self.dataHeader, 24)[0]
-        self.header_info['file_sequence'] = unpack_from('I', self.dataHeader, 25)[0]
-        self.header_info['frag_period'] = unpack_from('H', self.dataHeader, 29)[0]
-        self.header_info['ch_hwv'] = unpack_from('8s', self.dataHeader, 31)[0].decode("utf-8").strip(' ')
-        self.board_model_main = self.header_info['ch_hwv'][0:5]
-        self.board_model_revision = self.header_info['ch_hwv'][6:1]
-        self.header_info['ch_ser'] = unpack_from('8s', self.dataHeader, 39)[0].decode("utf-8").strip('\x00')
-        # handle the case of backend < v0.14, which puts '--------' in ch_ser
-        if all(chars in string.hexdigits for chars in self.header_info['ch_ser']):
-            self.header_info['ch_ser'] = int(self.header_info['ch_ser'], 16)
-        else:
-            self.header_info['ch_ser'] = 0
-        self.header_info['ch_fir'] = hex(unpack_from('I', self.dataHeader, 47)[0])
-        config_fp = unpack_from('BBBBBBBB', self.dataHeader, 51)
-        self.header_info['conf_fp'] = config_fp
-        # Channel type
-        self.__populate_channel_type(config_fp)
-        # Electric channel Preamp
-        self.__popuate_peamp_gain(config_fp)
-        # LPF
-        self.__populate_lpf(config_fp)
-        # Main Gain Stage
-        self.__populate_main_gain(config_fp)
-        # Sensor range
-        self.__handle_sensor_range(config_fp)
-        # Electric channel attenuator
-        self.__populate_attenuator_gain(config_fp)
-        # Board-wide gains
-        self.total_selectable_gain = self.channel_main_gain * self.preamp_gain * self.attenuator_gain
-        self.total_circuitry_gain = self.total_selectable_gain * self.intrinsic_circuitry_gain
-
-        self.header_info['sample_rate_base'] = unpack_from('H', self.dataHeader, 59)[0]
-        self.header_info['sample_rate_exp'] = unpack_from('b', self.dataHeader, 61)[0]
-        self.header_info['sample_rate'] = self.header_info['sample_rate_base']
-        if self.header_info['sample_rate_exp'] != 0:
-            self.header_info['sample_rate'] *= pow(10, self.header_info['sample_rate_exp'])
-        self.header_info['bytes_per_sample'] = unpack_from('B', self.dataHeader, 62)[0]
-        self.header_info['frame_size'] = unpack_from('I', self.dataHeader, 63)[0]
+        self.header_info.update(parse_header(self.dataHeader))
+        config = ChannelConfig(self.header_info['conf_fp'], self.header_info['ch_hwv'])
+        for name in CONFIG_ATTRIBUTES:
+            setattr(self, name, getattr(config, name))
         self.dataFooter = self.header_info['frame_size'] >> 24
         self.frameSize = self.header_info['frame_size'] & 0x0ffffff
-        self.header_info['decimation_node_id'] = unpack_from('H', self.dataHeader, 67)[0]
-        self.header_info['frame_rollover_count'] = unpack_from('H', self.dataHeader, 69)[0]
-        self.header_info['gps_long'] = unpack_from('f', self.dataHeader, 71)[0]
-        self.header_info['gps_lat'] = unpack_from('f', self.dataHeader, 75)[0]
-        self.header_info['gps_height'] = unpack_from('f', self.dataHeader, 79)[0]
-        self.header_info['gps_hacc'] = unpack_from('I', self.dataHeader, 83)[0]
-        self.header_info['gps_vacc'] = unpack_from('I', self.dataHeader, 87)[0]
-        self.header_info['timing_status'] = unpack_from('BBH', self.dataHeader, 91)
-        self.header_info['timing_flags'] = self.header_info['timing_status'][0]
-        self.header_info['timing_sat_count'] = self.header_info['timing_status'][1]
-        self.header_info['timing_stability'] = self.header_info['timing_status'][2]
-        self.header_info['future1'] = unpack_from('b', self.dataHeader, 95)[0]
-        self.header_info['future2'] = unpack_from('i', self.dataHeader, 97)[0]
-        self.header_info['saturated_frames'] = unpack_from('H', self.dataHeader, 101)[0]
-        if self.header_info['saturated_frames'] & 0x80 == 0x80:
-            self.header_info['saturated_frames'] &= 0x7F
-            self.header_info['saturated_frames'] <<= 4
-        self.header_info['missing_frames'] = unpack_from('H', self.dataHeader, 103)[0]
-        self.header_info['battery_voltage_mV'] = unpack_from('H', self.dataHeader, 105)[0]
-        self.header_info['min_signal'] = unpack_from('f', self.dataHeader, 107)[0]
-        self.header_info['max_signal'] = unpack_from('f', self.dataHeader, 111)[0]
+
+    def overview(self, factor=4, base_block=64, overview_path=None):
+        """Min/max/mean overview pyramid of the sequence, loaded from its
+        sidecar files or built with a single pass over the samples if missing
+        or stale, see Overview. Kept for later calls with the same arguments"""
+        key = (factor, base_block, overview_path)
+        if key not in self._overviews:
+            self._overviews[key] = Overview(self, factor, base_block, overview_path)
+        return self._overviews[key]
+
+    def enable_metrics(self, callback=None, logger=None):
+        """Count and time file opens, reads, seeks, decoding and scaling from
+        now on, see Instrumentation. Returns the ReaderMetrics"""
+        return instrument(self, callback, logger)
+
+    def disable_metrics(self):
+        uninstrument(self)
+
+    def enable_prefetch(self):
+        """Map the files of the sequence once, skipping holes in the
+        numbering, and open each next file in the background, see Prefetch"""
+        if self.prefetcher is None:
+            self.prefetcher = FilePrefetcher(self)
+        return self.prefetcher
+
+    def disable_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+    def read_ahead(self, chunk, depth=2, prefetch_files=True):
+        """Like iter_chunks, with the next chunks read by a worker thread,
+        see Prefetch.read_ahead"""
+        return read_ahead(self, chunk, depth, prefetch_files)
 
     def close(self):
+        self.disable_prefetch()
         if self.stream is not None:
             self.stream.close()
 
@@ -265,13 +399,24 @@ class NativeReader(_TSReaderBase):
     """Native sampling rate 'Raw' time series reader class"""
 
     def __init__(self, path, num_files=1, scale_to=DataScaling.instrument_input_volts,
-                 header_size=128, last_frame=0, channel_gain=0.5, ad_plus_minus_range = 5.0,
-                 channel_type="E", report_hw_sat=False):
+                 header_size=128, last_frame=None, channel_gain=0.5, ad_plus_minus_range = 5.0,
+                 channel_type="E", report_hw_sat=False, event_callback=None, fill_missing=None):
         # Init the base class
         _TSReaderBase.__init__(self, path, num_files, header_size, report_hw_sat)
 
-        # Track the last frame seen by the streamer, to report missing frames
+        # Track the last frame seen by the streamer, to report missing frames.
+        # None takes the first frame read as the reference
         self.last_frame = last_frame
+        # Running index of the next frame read from the stream
+        self.frame_index = 0
+        # Missing/saturated frame events (FRAME_EVENT_DTYPE) of the last read,
+        # also passed to event_callback(reader, events) when there are any
+        self.events = empty(0, dtype=FRAME_EVENT_DTYPE)
+        self.event_callback = event_callback
+        # None, 'zero' or 'nan': fill missing frames so sample index stays equal to time
+        if fill_missing not in (None, 'zero', 'nan'):
+            raise ValueError("fill_missing must be None, 'zero' or 'nan'")
+        self.fill_missing = fill_missing
         self.header_size = header_size
         self.data_scaling = scale_to
         self.total_circuitry_gain = channel_gain
@@ -296,75 +441,310 @@ class NativeReader(_TSReaderBase):
         # optimization variables
         self.footer_idx_samp_mask = int('0x0fffffff', 16)
         self.footer_sat_mask = int('0x70000000', 16)
+        self._frame_origin = None   # Absolute counter of the first frame, see absolute_frames
+        self._raw_buf = bytearray()
+        self._scratch = zeros((0, 20, 4), dtype=uint8)
 
     def unpack_header(self):
         super(NativeReader, self).unpack_header()
         # TODO: Implement any specific header unpacking for this particular class below
 
-    def read_frames(self, num_frames):
-        frames_in_buf = 0
-        _idx_buf = 0
-        _data_buf = empty([num_frames * 20])  # 20 samples packed in a frame
+    def read_raw_frames(self, num_frames, partial=False):
+        """Read num_frames undecoded frames with as few reads as possible,
+        crossing into the next file of the sequence when needed.
+        Returns a memoryview over an internal buffer that is reused by the
+        next call, or None if the sequence ran out of data. With partial=True
+        the frames left at the end of the sequence are returned instead"""
+        num_bytes = num_frames * 64
+        if len(self._raw_buf) < num_bytes:
+            self._raw_buf = bytearray(num_bytes)
+        raw = memoryview(self._raw_buf)[:num_bytes]
+        bytes_in_buf = self.read_into(raw, 64)
+        if bytes_in_buf < num_bytes and not (partial and bytes_in_buf):
+            return None
+        return raw[:bytes_in_buf]
 
-        while (frames_in_buf < num_frames):
+    def _decode_into(self, raw, out):
+        """Decode the frames in raw, check their continuity and scale them
+        into out. Returns the filled part of out, which is longer than the
+        frames read when missing frames are filled in, or a new array if out
+        is too short for them"""
+        num_frames = len(raw) // 64
+        samples, footers = self._decode_frames(raw)
 
-            dataFrame = self.stream.read(64)
-            if not dataFrame:
-                if not self.open_next():
-                    return empty([0])
-                dataFrame = self.stream.read(64)
-                if not dataFrame:
-                    return empty([0])
+        # Check that there are no skipped or saturated frames
+        gaps = self._track_frames(footers, self.report_hw_sat)
+
+        if self.fill_missing is None or not (gaps > 0).any():
+            out = out[:num_frames * 20]
+            self._scale(samples, out.reshape(-1, 20))
+            return out
+
+        # Spread the frames out to where they belong in time, filling the gaps
+        rows = arange(num_frames) + cumsum(maximum(gaps, 0))
+        num_samples = (int(rows[-1]) + 1) * 20
+        if len(out) < num_samples:
+            out = empty([num_samples], dtype=out.dtype)
+        out = out[:num_samples]
+        out.fill(nan if self.fill_missing == 'nan' else 0)
+        out.reshape(-1, 20)[rows] = self._scale(samples, empty(samples.shape, dtype=out.dtype))
+        return out
+
+    def _track_frames(self, footers, report_hw_sat):
+        """Find the missing and saturated frames in the footers of the frames
+        just read from the stream (self.events, handed to event_callback) and
+        move the frame bookkeeping past them. Returns the gap before each
+        frame"""
+        self.events, gaps = detect_frame_events(footers, self.last_frame, self.frame_index, report_hw_sat)
+        self.last_frame = int(footers[-1] & self.footer_idx_samp_mask)
+        self.frame_index += len(footers)
+        if len(self.events) and self.event_callback is not None:
+            self.event_callback(self, self.events)
+        return gaps
+
+    def read_decoded_frames(self, num_frames, partial=False, report_hw_sat=None):
+        """Read and decode num_frames frames without scaling them, checking
+        their continuity as read_frames does (report_hw_sat overrides the
+        reader's setting for these frames). Returns (index of the first frame
+        in the sequence, samples and footers as decode_frames returns them,
+        events), or None at the end of the sequence. The samples are a view
+        of a buffer reused by the next call. partial is as in read_raw_frames"""
+        raw = self.read_raw_frames(num_frames, partial)
+        if raw is None:
+            return None
+        first_frame = self.frame_index
+        samples, footers = self._decode_frames(raw)
+        self._track_frames(footers, self.report_hw_sat if report_hw_sat is None else report_hw_sat)
+        return first_frame, samples, footers, self.events
 
-            dataFooter = unpack_from("I", dataFrame, 60)
+    def _decode_frames(self, raw):
+        """decode_frames into the reusable scratch buffer"""
+        num_frames = len(raw) // 64
+        if self._scratch.shape[0] < num_frames:
+            self._scratch = zeros((num_frames, 20, 4), dtype=uint8)
+        return decode_frames(raw, self._scratch)
 
-            # Check that there are no skipped frames
-            frameCount = dataFooter[0] & self.footer_idx_samp_mask
-            difCount = frameCount - self.last_frame
-            if (difCount != 1):
-                print ("Ch [%s] Missing frames at %d [%d]\n" %
-                       (self.ch_id, frameCount, difCount))
-            self.last_frame = frameCount
+    def _scale(self, samples, out):
+        """Scale decoded (frames, 20) samples into out"""
+        return multiply(samples, self._scale_factor, out=out)
 
-            for ptrSamp in range(0, 60, 3):
-                tmpSampleTupple = unpack(">i", dataFrame[ptrSamp:ptrSamp + 3] + b'\x00')
-                _data_buf[_idx_buf] = tmpSampleTupple[0] * self._scale_factor
-                _idx_buf += 1
+    def read_frames(self, num_frames, out=None, partial=False):
+        """Read and scale num_frames frames (20 samples each)
 
-            frames_in_buf += 1
+        If out is given (float32 or float64, at least num_frames * 20 samples)
+        the scaled samples are written into it and a view of the filled part
+        is returned, otherwise a new float64 array is allocated.
+        Missing and saturated frames are left in self.events. With fill_missing
+        set, the result also holds 20 fill samples per missing frame. With
+        partial=True the frames left at the end of the sequence are returned
+        rather than an empty array."""
+        raw = self.read_raw_frames(num_frames, partial)
+        if raw is None:
+            return empty([0])
+        if out is None:
+            out = empty([num_frames * 20])  # 20 samples packed in a frame
+        return self._decode_into(raw, out)
 
-            if self.report_hw_sat:
-                satCount = (dataFooter[0] & self.footer_sat_mask) >> 24
-                if satCount:
-                    print ("Ch [%s] Frame %d has %d saturations" %
-                           (self.ch_id, frameCount, satCount))
+    def iter_chunks(self, chunk_samples, out=None):
+        """Generator over the rest of the sequence in chunks of chunk_samples
+        scaled samples (a multiple of 20), the last one possibly shorter.
 
-        return _data_buf
+        Every chunk is a view of the same buffer, out if given or one
+        allocated once otherwise, so it is overwritten by the next chunk.
+        Copy it if it has to outlive the iteration step."""
+        if chunk_samples % 20:
+            raise ValueError("Native chunks must hold whole frames (a multiple of 20 samples)")
+        if out is None:
+            out = empty([chunk_samples])
+        while True:
+            raw = self.read_raw_frames(chunk_samples // 20, partial=True)
+            if raw is None:
+                return
+            yield self._decode_into(raw, out)
+
+    def _read_available(self, num_frames, out):
+        available = self._complete_records(64)
+        while not available and self._next_file_ready():
+            self.open_file_seq(self.seq + 1)
+            available = self._complete_records(64)
+        if available < num_frames and not (available and self._next_file_ready()):
+            return None
+        return self._decode_into(self.read_raw_frames(min(available, num_frames)), out)
+
+    def _chunk_buffer(self, num_frames):
+        return empty([num_frames * 20])
 
     def skip_frames(self, num_frames):
         bytes_to_skip = int(num_frames * 64)
-        # Python is dumb for seek and tell, it cannot tell us if a seek goes
-        # past EOF so instead we need to do inefficient reads to skip bytes
+        # Seek forward within the current file as far as its size allows,
+        # and move on to the next file for whatever is left
         while (bytes_to_skip > 0):
-            foo = self.stream.read(bytes_to_skip)
-            local_read_size = len(foo)
+            position = self.stream.tell()
+            local_skip_size = min(bytes_to_skip, os.fstat(self.stream.fileno()).st_size - position)
 
             # If we ran out of data in this file before finishing the skip,
             # open the next file and return false if there is no next file
             # to indicate that the skip ran out of
             # data before completion
-            if local_read_size == 0:
+            if local_skip_size <= 0:
                 more_data = self.open_next()
                 if not more_data:
                     return False
             else:
-                bytes_to_skip -= local_read_size
+                self.stream.seek(position + local_skip_size)
+                bytes_to_skip -= local_skip_size
 
         # If we reached here we managed to skip all the data requested
         # return true
-        self.last_frame += num_frames
+        if self.last_frame is not None:
+            self.last_frame += num_frames
+        self.frame_index += num_frames
         return True
 
+    def map_frames(self):
+        """Memory map every frame of the sequence as a (frames, 64) uint8 array"""
+        return self.map_sequence(uint8, (64,))
+
+    def frame_count(self):
+        """Total number of frames in the sequence"""
+        return len(self.map_frames())
+
+    def raw_frames(self, start_frame, num_frames):
+        """Undecoded frames [start_frame, start_frame + num_frames) of the
+        whole sequence as a (frames, 64) uint8 array. This is a zero-copy view
+        of the file unless the range spans a file boundary"""
+        return self.map_frames().records(start_frame, num_frames)
+
+    def read_frames_at(self, start_frame, num_frames, out=None):
+        """Random access version of read_frames. Decodes and scales the frames
+        [start_frame, start_frame + num_frames) of the whole sequence without
+        moving the stream or reporting missing frames.
+        Decoded chunks are kept in self.cache (see ChunkCache) for later reads
+        of the same frames, unless the range is a large share of its budget"""
+        mapped = self.map_frames()
+        stop = min(start_frame + num_frames, len(mapped))
+        if out is None:
+            out = empty([max(0, stop - start_frame) * 20])
+        out = out[:max(0, stop - start_frame) * 20]
+        if start_frame >= stop:
+            return out
+        if self.cache is None or len(out) * 8 > self.cache.max_bytes // 4:
+            samples, _ = self._decode_frames(mapped.records(start_frame, stop - start_frame))
+            self._scale(samples, out.reshape(-1, 20))
+            return out
+        frame = start_frame
+        while frame < stop:
+            file_idx, local = mapped.locate(frame)
+            chunk_idx, offset = divmod(local, CHUNK_FRAMES)
+            chunk = self._cached_chunk(mapped, file_idx, chunk_idx)
+            count = min(len(chunk) - offset, stop - frame)
+            out[(frame - start_frame) * 20:(frame - start_frame + count) * 20] = chunk[offset:offset + count].reshape(-1)
+            frame += count
+        return out
+
+    def _cached_chunk(self, mapped, file_idx, chunk_idx):
+        """Scaled (frames, 20) chunk number chunk_idx of a mapped file"""
+        def decode():
+            raw = mapped.maps[file_idx][chunk_idx * CHUNK_FRAMES:(chunk_idx + 1) * CHUNK_FRAMES]
+            samples, _ = self._decode_frames(raw)
+            return self._scale(samples, empty(samples.shape))
+        key = (mapped.paths[file_idx], chunk_idx, 'native', self._scale_factor)
+        return self.cache.get(key, decode)
+
+    def read_samples_at(self, start_sample, num_samples):
+        """Scaled samples [start_sample, start_sample + num_samples) of the
+        whole sequence"""
+        first_frame = start_sample // 20
+        last_frame = (start_sample + num_samples + 19) // 20
+        data = self.read_frames_at(first_frame, last_frame - first_frame)
+        offset = start_sample - first_frame * 20
+        return data[offset:offset + num_samples]
+
+    def seek_frame(self, frame_index):
+        """Move the stream so that the next read_frames starts at frame_index
+        of the whole sequence"""
+        self.seek_record(frame_index, uint8, (64,))
+        footer = frombuffer(self.raw_frames(frame_index, 1), dtype='<u4')[15]
+        self.last_frame = int(footer & self.footer_idx_samp_mask) - 1
+        self.frame_index = frame_index
+
+    def absolute_frames(self, start_frame, num_frames):
+        """Frame counters of the frames [start_frame, start_frame + num_frames)
+        of the sequence, counted from the start of the recording and unwrapped
+        past the 28 bit rollovers"""
+        if self._frame_origin is None:
+            first = int(self.raw_frames(0, 1).view('<u4')[0, 15]) & self.footer_idx_samp_mask
+            self._frame_origin = first + (self.header_info['frame_rollover_count'] << 28)
+        counts = (self.raw_frames(start_frame, num_frames).view('<u4')[:, 15] & self.footer_idx_samp_mask)
+        expected = self._frame_origin + start_frame + arange(len(counts), dtype=int64)
+        # The counter is taken as the closest value to where the frame would be without gaps
+        return expected + ((counts.astype(int64) - expected + (1 << 27)) & 0x0fffffff) - (1 << 27)
+
+    def _frame_at(self, frame_counter):
+        """Index of the first frame of the sequence with an absolute counter
+        of at least frame_counter, by binary search over the footers"""
+        low, high = 0, self.frame_count()
+        while low < high:
+            middle = (low + high) // 2
+            if self.absolute_frames(middle, 1)[0] < frame_counter:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _frame_counter_at(self, t, round_up=False):
+        """Absolute counter of the frame holding the epoch time t, or of the
+        first frame starting at or after t if round_up. Times within a
+        microsecond of a frame boundary, the resolution of epoch times as
+        floats, are taken to be on it"""
+        frames = (t - self.header_info['rec_id']) * self.header_info['sample_rate'] / 20.0
+        tolerance = 1e-6 * self.header_info['sample_rate'] / 20.0
+        return ceil(frames - tolerance) if round_up else floor(frames + tolerance)
+
+    def frame_at_time(self, t):
+        """Index in the sequence of the first frame that ends after the epoch
+        time t, frame_count() if there is none"""
+        return self._frame_at(self._frame_counter_at(t))
+
+    def seek_time(self, t):
+        """Move the stream so that the next read_frames starts with the frame
+        holding the epoch time t"""
+        self.seek_frame(self.frame_at_time(t))
+
+    def read_time_range(self, t0, t1):
+        """Scaled samples with epoch times in [t0, t1) and their timestamps
+
+        The frames are located by binary search over the frame counters, so
+        the cost does not depend on where the window is. The timestamps come
+        from the frame counters and stay exact across missing frames, which are
+        left in self.events (and passed to event_callback), and filled in
+        with zeros or NaNs if fill_missing is set. The stream is not moved.
+        Returns (samples, timestamps)"""
+        sample_rate = float(self.header_info['sample_rate'])
+        rec_id = self.header_info['rec_id']
+        first = self._frame_at(self._frame_counter_at(t0))
+        last = self._frame_at(self._frame_counter_at(t1, round_up=True))
+        raw = self.raw_frames(first, last - first)
+        if not len(raw):
+            return empty([0]), empty([0])
+        samples, footers = self._decode_frames(raw)
+        self.events, gaps = detect_frame_events(footers, None, first, self.report_hw_sat)
+        if len(self.events) and self.event_callback is not None:
+            self.event_callback(self, self.events)
+        counters = self.absolute_frames(first, last - first)
+        if self.fill_missing is not None:
+            rows = counters - counters[0]
+            data = full([int(rows[-1]) + 1, 20], nan if self.fill_missing == 'nan' else 0.0)
+            data[rows] = self._scale(samples, empty(samples.shape))
+            counters = counters[0] + arange(len(data))
+        else:
+            data = self._scale(samples, empty(samples.shape))
+        timestamps = rec_id + (counters[:, None] * 20 + arange(20)) / sample_rate
+        data = data.reshape(-1)
+        timestamps = timestamps.reshape(-1)
+        keep = slice(searchsorted(timestamps, t0), searchsorted(timestamps, t1))
+        return data[keep], timestamps[keep]
+
 
 class DecimatedSegmentedReader(_TSReaderBase):
     """Class to create a streamer for segmented decimated time series,
@@ -374,6 +754,7 @@ class DecimatedSegmentedReader(_TSReaderBase):
         _TSReaderBase.__init__(self, path, num_files, 128, report_hw_sat)
         self.unpack_header()
         self.subheader = {}
+        self._segment_index = None
 
     def unpack_header(self):   # TODO: Work in progress, for now unpacking as raw time series header
         if self.header_size == 128:
@@ -390,32 +771,187 @@ class DecimatedSegmentedReader(_TSReaderBase):
             self.subheader['timestamp'] = 0
             self.subheader['samplesInRecord'] = 0
         else:
-            self.subheader['timestamp'] = unpack_from('I', subheaderBytes, 0)[0]
-            self.subheader['samplesInRecord'] = unpack_from('I', subheaderBytes, 4)[0]
-            self.subheader['satCount'] = unpack_from('H', subheaderBytes, 8)[0]
-            self.subheader['missCount'] = unpack_from('H', subheaderBytes, 10)[0]
-            self.subheader['minVal'] = unpack_from('f', subheaderBytes, 12)[0]
-            self.subheader['maxVal'] = unpack_from('f', subheaderBytes, 16)[0]
-            self.subheader['avgVal'] = unpack_from('f', subheaderBytes, 20)[0]
+            self.subheader.update(parse_subheader(subheaderBytes))
 
     def read_record_data(self):
         ret_array = empty([0])
         if (self.stream is not None
                 and self.subheader['samplesInRecord'] is not None
                 and self.subheader['samplesInRecord'] != 0):
-            ret_array = fromfile(self.stream, dtype=float32, count=self.subheader['samplesInRecord'])
+            ret_array = self._read_samples(self.subheader['samplesInRecord'])
             if ret_array.size == 0:
                 if not self.open_next():
                     return empty([0])
                 # Array below will contain the data, or will be an empty array if end of series as desired
-                ret_array = fromfile(self.stream, dtype=float32, count=self.subheader['samplesInRecord'])
+                ret_array = self._read_samples(self.subheader['samplesInRecord'])
 
         return ret_array
 
+    def _read_samples(self, count):
+        """Up to count float32 samples from the current file"""
+        data = empty([count], dtype=float32)
+        return data[:self.stream.readinto(memoryview(data).cast('B')) // 4]
+
     def read_record(self):
         self.read_subheader()
         return self.read_record_data()
 
+    def _read_segment_bytes(self, max_segments):
+        """Read the complete segments that follow in the current file, up to
+        max_segments, with as few reads as possible. Returns (bytes, subheader
+        offsets in them, True if the file has no more complete segments)"""
+        available = os.fstat(self.stream.fileno()).st_size - self.stream.tell()
+        segment_bytes = SUBHEADER_SIZE + 4 * (self.subheader.get('samplesInRecord') or 0)
+        buf = bytearray()
+        offsets = []
+        position = 0
+        exhausted = False
+        while len(offsets) < max_segments and not exhausted:
+            want = min(available - len(buf), max(2 ** 16, (max_segments - len(offsets)) * segment_bytes))
+            data = self.stream.read(want) if want > 0 else b''
+            if not data:
+                exhausted = True
+                break
+            buf += data
+            while len(offsets) < max_segments:
+                if position + SUBHEADER_SIZE > len(buf):
+                    break
+                samples = _SAMPLES_IN_RECORD.unpack_from(buf, position + 4)[0]
+                end = position + SUBHEADER_SIZE + 4 * samples
+                if not samples:
+                    exhausted = True
+                    break
+                if end > len(buf):
+                    segment_bytes = end - position
+                    break
+                offsets.append(position)
+                position = end
+        # Leave the stream right after the last complete segment
+        if len(buf) > position:
+            self.stream.seek(position - len(buf), os.SEEK_CUR)
+        exhausted = exhausted or available - position < SUBHEADER_SIZE
+        return memoryview(buf)[:position], offsets, exhausted
+
+    def read_records(self, num_records):
+        """Read up to num_records segments at once, crossing into the next
+        files of the sequence, with one large read per file instead of two
+        small reads per segment.
+
+        Returns (data, offsets, subheaders): data is a (segments, samples)
+        float32 array when all the segments have the same length, and the
+        samples of all the segments back to back otherwise. Segment i is
+        data[offsets[i]:offsets[i + 1]] of the flat samples in both cases.
+        subheaders holds the fields of every segment (as SUBHEADER_DTYPE), and
+        self.subheader those of the last one. Fewer segments are returned only
+        at the end of the series. A segment cut short at the end of a file is
+        skipped"""
+        raw_parts = []
+        sub_parts = []
+        count = 0
+        while count < num_records and self.stream is not None and not self.stream.closed:
+            raw, offsets, exhausted = self._read_segment_bytes(num_records - count)
+            if offsets:
+                raw = frombuffer(raw, dtype=uint8)
+                header_bytes = asarray(offsets)[:, None] + arange(SUBHEADER_SIZE)
+                sub_parts.append(raw[header_bytes].view(SUBHEADER_DTYPE).reshape(-1))
+                payload = full(len(raw), True)
+                payload[header_bytes] = False
+                raw_parts.append(raw[payload])
+                count += len(offsets)
+            if exhausted and count < num_records and not self.open_next():
+                break
+        if not count:
+            return empty([0, 0], dtype=float32), zeros(1, dtype=int64), empty(0, dtype=SUBHEADER_DTYPE)
+        subheaders = concatenate(sub_parts)
+        data = concatenate(raw_parts).view('<f4')
+        lengths = subheaders['samplesInRecord'].astype(int64)
+        offsets = concatenate(([0], cumsum(lengths)))
+        if (lengths == lengths[0]).all():
+            data = data.reshape(count, -1)
+        self.subheader.update((name, subheaders[name][-1].item()) for name in subheaders.dtype.names)
+        return data, offsets, subheaders
+
+    def iter_record_batches(self, num_records):
+        """Generator over the rest of the segments in batches of num_records,
+        as returned by read_records, the last one possibly smaller"""
+        while True:
+            batch = self.read_records(num_records)
+            if not len(batch[2]):
+                return
+            yield batch
+
+    def iter_chunks(self, chunk_samples, out=None):
+        """Generator over the samples of the rest of the segments, packed back
+        to back in chunks of chunk_samples samples, the last one possibly
+        shorter. self.subheader holds the subheader of the segment being read.
+
+        Every chunk is a view of the same float32 buffer, out if given or one
+        allocated once otherwise, so it is overwritten by the next chunk.
+        Copy it if it has to outlive the iteration step."""
+        if out is None:
+            out = empty([chunk_samples], dtype=float32)
+        out = out[:chunk_samples]
+        samples_left_in_record = 0
+        end_of_series = False
+        while not end_of_series:
+            filled = 0
+            while filled < chunk_samples:
+                if not samples_left_in_record:
+                    self.read_subheader()
+                    samples_left_in_record = self.subheader['samplesInRecord']
+                    if not samples_left_in_record:
+                        end_of_series = True
+                        break
+                count = min(samples_left_in_record, chunk_samples - filled)
+                read_count = self.stream.readinto(memoryview(out[filled:filled + count]).cast('B')) // 4
+                filled += read_count
+                samples_left_in_record -= read_count
+                if read_count < count:
+                    # Truncated segment at the end of the series
+                    end_of_series = True
+                    break
+            if filled:
+                yield out[:filled]
+
+    def _read_available(self, chunk, out):
+        """chunk is ignored, segments are returned one at a time as they
+        are completed, with their fields in self.subheader"""
+        while self._complete_records(32) == 0:
+            if not self._next_file_ready():
+                return None
+            self.open_file_seq(self.seq + 1)
+        subheader_bytes = self.stream.read(32)
+        subheader = parse_subheader(subheader_bytes)
+        if self._complete_records(4) < subheader['samplesInRecord']:
+            # Payload still being written, come back to this subheader later
+            self.stream.seek(-32, os.SEEK_CUR)
+            return None
+        self.subheader.update(subheader)
+        return self._read_samples(subheader['samplesInRecord'])
+
+    def segment_index(self, index_path=None):
+        """Index of every segment in the sequence, loaded from its sidecar file
+        or built with a single scan of the subheaders if missing or stale"""
+        if self._segment_index is None:
+            self._segment_index = SegmentIndex(self.sequence_paths(), self.header_size, index_path)
+        return self._segment_index
+
+    def read_segment(self, segment):
+        """Random access version of read_record, reads segment number 'segment'
+        of the whole sequence and leaves its fields in self.subheader.
+        Segments are kept in self.cache (see ChunkCache) and returned read-only"""
+        index = self.segment_index()
+        self.subheader = index.subheader(segment)
+        if self.cache is None:
+            return index.read(segment)
+        entry = index.segments[segment]
+        key = (index.paths[entry['file']], int(entry['offset']), 'segment')
+        return self.cache.get(key, lambda: index.read(segment))
+
+    def segments_between(self, t0, t1):
+        """Indices of the segments overlapping [t0, t1), in epoch seconds"""
+        return self.segment_index().between(t0, t1, self.header_info['sample_rate'])
+
 class DecimatedContinuousReader(_TSReaderBase):
     """Class to create a streamer for continuous decimated time series,
     i.e. *.td_150, *.td_30"""
@@ -424,22 +960,132 @@ class DecimatedContinuousReader(_TSReaderBase):
         _TSReaderBase.__init__(self, path, num_files, 128, report_hw_sat)
         self.unpack_header()
         self.subheader = {}
+        self._file_starts = None
 
     def unpack_header(self):   # TODO: Work in progress, for now unpacking as raw time series header
         if self.header_size == 128:
             super(DecimatedContinuousReader, self).unpack_header()
             # TODO: Implement any specific header unpacking for this particular class below
 
-    def read_data(self, numSamples):
+    def read_data(self, numSamples, out=None, partial=False):
+        """Read numSamples samples, into the float32 array out if given. With
+        partial=True the samples left at the end of the sequence are returned
+        rather than an empty array"""
         ret_array = empty([0])
         if self.stream is not None:
-            ret_array = fromfile(self.stream, dtype=float32, count=numSamples)
-            while ret_array.size < numSamples:
-                if not self.open_next():
-                    return empty([0])
-                # Array below will contain the data, or will be an empty array if end of series as desired
-                ret_array = append(ret_array,
-                                   fromfile(self.stream,
-                                            dtype=float32,
-                                            count=(numSamples - ret_array.size)))
+            if out is None:
+                out = empty([numSamples], dtype=float32)
+            ret_array = out[:numSamples]
+            # The buffer will contain the data, or we return an empty array if end of series as desired
+            bytes_read = self.read_into(ret_array, 4)
+            if bytes_read < ret_array.nbytes:
+                return ret_array[:bytes_read // 4] if partial else empty([0])
         return ret_array
+
+    def iter_chunks(self, chunk_samples, out=None):
+        """Generator over the rest of the sequence in chunks of chunk_samples
+        samples, the last one possibly shorter.
+
+        Every chunk is a view of the same float32 buffer, out if given or one
+        allocated once otherwise, so it is overwritten by the next chunk.
+        Copy it if it has to outlive the iteration step."""
+        if out is None:
+            out = empty([chunk_samples], dtype=float32)
+        out = out[:chunk_samples]
+        while self.stream is not None:
+            num_samples = self.read_into(out, 4) // 4
+            if not num_samples:
+                return
+            yield out[:num_samples]
+            if num_samples < chunk_samples:
+                return
+
+    def _read_available(self, num_samples, out):
+        available = self._complete_records(4)
+        while not available and self._next_file_ready():
+            self.open_file_seq(self.seq + 1)
+            available = self._complete_records(4)
+        if available < num_samples and not (available and self._next_file_ready()):
+            return None
+        chunk = out[:min(available, num_samples)]
+        self.read_into(chunk, 4)
+        return chunk
+
+    def _chunk_buffer(self, num_samples):
+        return empty([num_samples], dtype=float32)
+
+    def map_samples(self):
+        """Memory map every sample of the sequence as a float32 array"""
+        return self.map_sequence(float32)
+
+    def sample_count(self):
+        """Total number of samples in the sequence"""
+        return len(self.map_samples())
+
+    def samples(self, start_sample, num_samples):
+        """Samples [start_sample, start_sample + num_samples) of the whole
+        sequence. This is a zero-copy view of the file unless the range spans
+        a file boundary"""
+        return self.map_samples().records(start_sample, num_samples)
+
+    def seek_sample(self, sample_index):
+        """Move the stream so that the next read_data starts at sample_index
+        of the whole sequence"""
+        self.seek_record(sample_index, float32)
+
+    def file_start_times(self):
+        """Epoch time of the first sample of every mapped file, taken as the
+        start of its fragment period (see Headers.fragment_start)"""
+        if self._file_starts is None:
+            headers = scan_headers(self.map_samples().paths)
+            self._file_starts = (headers.rec_id.astype(float64) +
+                                 (headers.file_sequence.astype(float64) - 1) * headers.frag_period)
+        return self._file_starts
+
+    def read_time_range(self, t0, t1):
+        """Samples with epoch times in [t0, t1) and their timestamps
+
+        Every file is timed from its own header, so missing files leave a gap
+        in the timestamps rather than shifting the samples that follow. The
+        file and the offset in it are computed directly, the stream is not
+        moved. Returns (samples, timestamps)"""
+        mapped = self.map_samples()
+        starts = self.file_start_times()
+        sample_rate = float(self.header_info['sample_rate'])
+        # Times within a microsecond of a sample are taken to be on it
+        tolerance = 1e-6 * sample_rate
+        samples = []
+        timestamps = []
+        for file_idx in range(max(0, bisect_right(starts, t0) - 1), len(mapped.maps)):
+            if starts[file_idx] >= t1:
+                break
+            file_map = mapped.maps[file_idx]
+            first = max(0, ceil((t0 - starts[file_idx]) * sample_rate - tolerance))
+            last = min(len(file_map), ceil((t1 - starts[file_idx]) * sample_rate - tolerance))
+            if first < last:
+                samples.append(file_map[first:last])
+                timestamps.append(starts[file_idx] + arange(first, last) / sample_rate)
+        if not samples:
+            return empty([0], dtype=float32), empty([0])
+        return concatenate(samples), concatenate(timestamps)
+
+
+# samplesInRecord, at offset 4 of a subheader
+_SAMPLES_IN_RECORD = Struct('<I')
+
+def reader_class_name(extension):
+    """Name of the reader class that opens files with this extension"""
+    if extension == 'bin':
+        return 'NativeReader'
+    if extension in SEGMENTED_EXTENSIONS:
+        return 'DecimatedSegmentedReader'
+    return 'DecimatedContinuousReader'
+
+
+def open_reader(reader, path, num_files=1, **reader_args):
+    """Open a reader given the name of its class (i.e. 'NativeReader'), as
+    found in the runs returned by Catalog.find"""
+    reader_classes = {'NativeReader': NativeReader,
+                      'DecimatedSegmentedReader': DecimatedSegmentedReader,
+                      'DecimatedContinuousReader': DecimatedContinuousReader}
+    return reader_classes[reader](path, num_files=num_files, **reader_args)
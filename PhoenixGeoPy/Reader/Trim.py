@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Cut time windows out of time series sequences of the MTU-5C Family into
+new files of the same format, without decoding them
+
+Native files (.bin) are cut at frame granularity and segmented ones (.td_24k)
+at segment granularity. Continuous decimated ones (.td_150, .td_30) are timed
+from the file_sequence of their header, so they are cut at sample granularity
+at the end only: the cut starts at the beginning of the file holding t0. The
+payload is copied by the kernel where possible
+(copy_file_range, then sendfile, then plain reads and writes) behind a copy of
+the 128 byte header of each source file. Files cut short get their
+missing_frames, saturated_frames, min_signal and max_signal fields recomputed
+for what was kept: native ones (and their frame_rollover_count) from the
+footers and the samples of the kept frames, segmented ones from the subheaders of the kept segments, continuous
+ones (which carry no frame flags) only the signal range. Files copied whole
+keep their header as it is, so their data is never decoded.
+
+The output files keep the names, and so the timing, of their source files.
+With renumber=True native and segmented ones, which are timed by their frame
+counters and segment timestamps, are numbered from 1 instead and the
+file_sequence of their headers follows. Continuous ones always keep their
+numbers.
+
+Windows can be cut from the command line, from one sequence or from every
+channel of a recording, with times in epoch seconds or ISO 8601:
+python -m PhoenixGeoPy.Reader.Trim <first file or recording dir> <t0> <t1> <output dir> [--split SECONDS]
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import errno
+import shutil
+import logging
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timezone
+from math import ceil
+from PhoenixGeoPy.Reader.Headers import HEADER_SIZE, SUBHEADER_SIZE, parse_header, update_header
+from PhoenixGeoPy.Reader.Files import SEGMENTED_EXTENSIONS, channel_files, parse_file_name, sequence_length
+from PhoenixGeoPy.Reader.TimeSeries import detect_frame_events, open_reader, reader_class_name
+
+PRODUCTS = ('bin', 'td_24k', 'td_150', 'td_30')
+
+LOGGER = logging.getLogger('PhoenixGeoPy.Reader')
+
+# Errors meaning that a copy method does not work for these files, the next one is tried
+_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def _native_pieces(reader, t0, t1):
+    """(source path, byte offset, byte count, header fields) of the frames
+    of a native sequence in [t0, t1)"""
+    mapped = reader.map_frames()
+    frame = reader._frame_at(reader._frame_counter_at(t0))
+    last = reader._frame_at(reader._frame_counter_at(t1, round_up=True))
+    pieces = []
+    while frame < last:
+        file_idx, local = mapped.locate(frame)
+        frames = mapped.maps[file_idx][local:local + last - frame]
+        fields = {}
+        if len(frames) < len(mapped.maps[file_idx]):
+            events, gaps = detect_frame_events(frames.view('<u4')[:, 15], None, 0, True)
+            samples, _ = reader._decode_frames(frames)
+            # The header holds twice the A/D input voltage
+            signal_scale = 2 * reader.ad_plus_minus_range / 2 ** 31
+            fields = {'missing_frames': min(int(gaps[gaps > 0].sum()), 0xFFFF),
+                      'saturated_frames': int((events['sat_count'] != 0).sum()),
+                      'min_signal': samples.min() * signal_scale,
+                      'max_signal': samples.max() * signal_scale,
+                      # Counted up to the first kept frame, which may be past a rollover
+                      'frame_rollover_count': int(reader.absolute_frames(frame, 1)[0]) >> 28}
+        pieces.append((mapped.paths[file_idx], reader.header_size + local * 64, len(frames) * 64, fields))
+        frame += len(frames)
+    return pieces
+
+
+def _continuous_pieces(reader, t0, t1):
+    """As _native_pieces, from the start of the file holding t0 since the
+    files are timed from their file_sequence"""
+    mapped = reader.map_samples()
+    starts = reader.file_start_times()
+    sample_rate = float(reader.header_info['sample_rate'])
+    # Times within a microsecond of a sample are taken to be on it, as in read_time_range
+    tolerance = 1e-6 * sample_rate
+    signal_scale = 2 * reader.total_circuitry_gain
+    pieces = []
+    for file_idx in range(max(0, bisect_right(starts, t0) - 1), len(mapped.maps)):
+        if starts[file_idx] >= t1:
+            break
+        file_map = mapped.maps[file_idx]
+        if ceil((t0 - starts[file_idx]) * sample_rate - tolerance) >= len(file_map):
+            continue    # Ends before t0
+        last = min(len(file_map), ceil((t1 - starts[file_idx]) * sample_rate - tolerance))
+        if last <= 0:
+            continue
+        fields = {}
+        if last < len(file_map):
+            fields = {'min_signal': float(file_map[:last].min()) * signal_scale,
+                      'max_signal': float(file_map[:last].max()) * signal_scale}
+        pieces.append((mapped.paths[file_idx], reader.header_size, last * 4, fields))
+    return pieces
+
+
+def _segmented_pieces(reader, t0, t1):
+    """As _native_pieces, for whole segments. The subheader satCount and
+    missCount run on from segment to segment, and the firmware leaves minVal
+    at FLT_MAX, so the range is taken from the kept payload"""
+    index = reader.segment_index()
+    kept = reader.segments_between(t0, t1)
+    selected = index.segments[kept]
+    signal_scale = 2 * reader.total_circuitry_gain
+    pieces = []
+    for file_pos in sorted(set(selected['file'].tolist())):
+        in_file = selected['file'] == file_pos
+        segments = selected[in_file]
+        start = int(segments['offset'][0])
+        end = int(segments['offset'][-1]) + SUBHEADER_SIZE + 4 * int(segments['samplesInRecord'][-1])
+        fields = {}
+        if len(segments) < (index.segments['file'] == file_pos).sum():
+            first = int(kept[in_file][0])
+            fields = {'missing_frames': _counted(index.segments['missCount'], first, segments['missCount'][-1]),
+                      'saturated_frames': _counted(index.segments['satCount'], first, segments['satCount'][-1]),
+                      'min_signal': min(float(index.read(idx).min()) for idx in kept[in_file]) * signal_scale,
+                      'max_signal': max(float(index.read(idx).max()) for idx in kept[in_file]) * signal_scale}
+        pieces.append((index.paths[file_pos], start, end - start, fields))
+    return pieces
+
+
+def _counted(counters, first, last_value):
+    """Count up to last_value of a running subheader counter since the segment
+    before first, the whole value if there is none or the counter restarted"""
+    count = int(last_value)
+    if first > 0 and counters[first - 1] <= count:
+        count -= int(counters[first - 1])
+    return min(count, 0xFFFF)
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _read_write(src_fd, dst_fd, offset, count):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    return os.write(dst_fd, os.read(src_fd, min(count, 2 ** 20)))
+
+
+def copy_bytes(src_fd, dst_fd, offset, count):
+    """Copy count bytes from offset of src_fd to the current position of
+    dst_fd, inside the kernel when the platform and file systems allow it.
+    A method that is not supported is only given up for the next one before
+    it copied anything, any other error is raised"""
+    end = offset + count
+    for copy in (_copy_file_range, _sendfile, _read_write):
+        started = False
+        try:
+            while offset < end:
+                copied = copy(src_fd, dst_fd, offset, end - offset)
+                if not copied:
+                    return      # Source shorter than expected
+                offset += copied
+                started = True
+            return
+        except AttributeError:
+            continue    # Not available on this platform
+        except OSError as error:
+            if started or copy is _read_write or error.errno not in _UNSUPPORTED:
+                raise
+
+
+def _renumbered(extension):
+    """True for the products renumber applies to, see the module documentation"""
+    return extension == 'bin' or extension in SEGMENTED_EXTENSIONS
+
+
+def trim_sequence(path, t0, t1, out_dir, num_files=None, renumber=False):
+    """Copy the data of the sequence starting at path in the epoch time range
+    [t0, t1) into new files in out_dir. num_files defaults to all the
+    consecutive files of the sequence. Continuous sequences are copied from
+    the start of the file holding t0 and keep their numbering, renumber is
+    ignored for them with a warning. Returns the paths written"""
+    if num_files is None:
+        num_files = sequence_length(path)
+    extension = parse_file_name(path)[4]
+    if renumber and not _renumbered(extension):
+        # Continuous files are timed from their file_sequence, see the module documentation
+        LOGGER.warning("%s: continuous products keep their file numbers, not renumbered", path)
+        renumber = False
+    reader = open_reader(reader_class_name(extension), path, num_files)
+    try:
+        reader.cache = None
+        if extension == 'bin':
+            pieces = _native_pieces(reader, t0, t1)
+        elif hasattr(reader, 'segment_index'):
+            pieces = _segmented_pieces(reader, t0, t1)
+        else:
+            pieces = _continuous_pieces(reader, t0, t1)
+    finally:
+        reader.close()
+    if pieces:
+        os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for position, (src_path, offset, count, fields) in enumerate(pieces):
+        inst_id, rec_id, ch_id, seq, extension = parse_file_name(src_path)
+        with open(src_path, 'rb') as src:
+            header = src.read(HEADER_SIZE)
+            if renumber:
+                # Keep the offset between the header sequence and the name of the product
+                fields['file_sequence'] = parse_header(header)['file_sequence'] - seq + position + 1
+                seq = position + 1
+            out_path = os.path.join(out_dir, "%s_%s_%s_%08X.%s" % (inst_id, rec_id, ch_id, seq, extension))
+            with open(out_path, 'wb', buffering=0) as dst:
+                dst.write(update_header(header, **fields))
+                copy_bytes(src.fileno(), dst.fileno(), offset, count)
+        written.append(out_path)
+    return written
+
+
+def trim_recording(rec_dir, t0, t1, out_root, products=PRODUCTS, renumber=False):
+    """Cut [t0, t1) out of every channel sequence of a recording into
+    out_root/<recording>/<channel>/, along with its recmeta.json. Returns the
+    paths written. renumber only applies to native and segmented products,
+    a warning lists the continuous ones left as they are"""
+    kept_numbers = [extension for extension in products if not _renumbered(extension)]
+    if renumber and kept_numbers:
+        LOGGER.warning("%s: continuous products (%s) keep their file numbers, not renumbered", rec_dir,
+                       ", ".join(kept_numbers))
+    out_rec_dir = os.path.join(out_root, os.path.basename(os.path.normpath(rec_dir)))
+    written = []
+    for extension in products:
+        for ch_id, path in channel_files(rec_dir, extension):
+            written += trim_sequence(path, t0, t1, os.path.join(out_rec_dir, str(ch_id)),
+                                     renumber=renumber and _renumbered(extension))
+    if written and os.path.exists(os.path.join(rec_dir, 'recmeta.json')):
+        shutil.copy2(os.path.join(rec_dir, 'recmeta.json'), out_rec_dir)
+    return written
+
+
+def _parse_time(text):
+    """Epoch seconds, or an ISO 8601 date and time (UTC unless it says otherwise)"""
+    try:
+        return float(text)
+    except ValueError:
+        t = datetime.fromisoformat(text)
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        return t.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cut a time window out of a sequence or a recording, "
+                                                 "without decoding it")
+    parser.add_argument("source", help="first file of a sequence, or a recording directory")
+    parser.add_argument("t0", help="start, epoch seconds or ISO 8601")
+    parser.add_argument("t1", help="end (excluded), epoch seconds or ISO 8601")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("--products", nargs='+', default=list(PRODUCTS), help="extensions cut from a recording")
+    parser.add_argument("--split", type=float, help="write one window of this many seconds per sub directory")
+    parser.add_argument("--renumber", action='store_true',
+                        help="number the output files from 1, continuous products keep their numbers "
+                             "(with a warning)")
+    args = parser.parse_args(argv)
+    t0, t1 = _parse_time(args.t0), _parse_time(args.t1)
+    windows = [(t0, t1, args.output)]
+    if args.split:
+        windows = [(start, min(start + args.split, t1), os.path.join(args.output, "%d" % start))
+                   for start in [t0 + idx * args.split for idx in range(int(ceil((t1 - t0) / args.split)))]]
+    for start, end, out_dir in windows:
+        if os.path.isdir(args.source):
+            written = trim_recording(args.source, start, end, out_dir, args.products, args.renumber)
+        else:
+            written = trim_sequence(args.source, start, end, out_dir, renumber=args.renumber)
+        print("%s: %d files" % (out_dir, len(written)))
+
+
+if __name__ == '__main__':
+    main()
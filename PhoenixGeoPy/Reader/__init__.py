@@ -1 +1 @@
-__all__ = ["TimeSeries"]
+__all__ = ["TimeSeries", "Headers", "SegmentIndex", "Recording", "Archive", "Synthetic", "Instrumentation", "Prefetch", "ChunkCache", "Overview", "Trim", "Files", "Info"]
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Incremental catalog of the time series files of a survey of the MTU-5C Family
+
+The catalog walks survey folders laid out as
+<root>/<serial>_<date>/<ch>/<inst>_<rec>_<ch>_<seq>.<ext>, parses the file name
+and the 128 byte header of every time series file, and keeps the results in a
+local SQLite database. Files are only re-parsed when their size or mtime change,
+and queries return the parameters needed to open a reader over each run of
+consecutive files.
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import sqlite3
+from struct import unpack_from
+from PhoenixGeoPy.Reader.Headers import (ChannelConfig, parse_header, parse_subheader, frame_time, fragment_start,
+                                         HEADER_SIZE, SUBHEADER_SIZE)
+from PhoenixGeoPy.Reader.Files import channel_tags, is_series_file, parse_file_name, SEGMENTED_EXTENSIONS
+from PhoenixGeoPy.Reader.TimeSeries import reader_class_name
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    rec_dir TEXT,
+    inst_id TEXT,
+    rec_id TEXT,
+    ch_id INTEGER,
+    seq INTEGER,
+    extension TEXT,
+    tag TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    file_type INTEGER,
+    sample_rate REAL,
+    channel_type TEXT,
+    ch_hwv TEXT,
+    total_circuitry_gain REAL,
+    gps_lat REAL,
+    gps_long REAL,
+    gps_height REAL,
+    gps_hacc INTEGER,
+    gps_vacc INTEGER,
+    timing_flags INTEGER,
+    timing_sat_count INTEGER,
+    timing_stability INTEGER,
+    saturated_frames INTEGER,
+    missing_frames INTEGER,
+    min_signal REAL,
+    max_signal REAL,
+    data_offset INTEGER,
+    data_bytes INTEGER,
+    t_start REAL,
+    t_end REAL
+);
+CREATE INDEX IF NOT EXISTS files_query ON files (channel_type, sample_rate, t_start);
+CREATE INDEX IF NOT EXISTS files_sequence ON files (rec_dir, ch_id, extension, seq);
+"""
+
+_columns = ['path', 'rec_dir', 'inst_id', 'rec_id', 'ch_id', 'seq', 'extension', 'tag', 'size', 'mtime_ns',
+            'file_type', 'sample_rate', 'channel_type', 'ch_hwv', 'total_circuitry_gain',
+            'gps_lat', 'gps_long', 'gps_height', 'gps_hacc', 'gps_vacc',
+            'timing_flags', 'timing_sat_count', 'timing_stability',
+            'saturated_frames', 'missing_frames', 'min_signal', 'max_signal',
+            'data_offset', 'data_bytes', 't_start', 't_end']
+
+
+def _time_span(extension, header_info, first_record, data_bytes):
+    """Start and end of the data in a file, in epoch seconds
+
+    Native files are timed exactly from the frame counter of the first frame.
+    Segmented files start at the timestamp of their first segment. Continuous
+    files are assumed to start at the beginning of their fragment period.
+    """
+    sample_rate = float(header_info['sample_rate'])
+    t_fragment = fragment_start(header_info)
+    if extension == 'bin':
+        if len(first_record) < 64:
+            return None, None
+        t_start = frame_time(header_info, unpack_from('<I', first_record, 60)[0] & 0x0fffffff)
+        return t_start, t_start + (data_bytes // 64) * 20 / sample_rate
+    if extension in SEGMENTED_EXTENSIONS:
+        if len(first_record) < SUBHEADER_SIZE:
+            return None, None
+        return (parse_subheader(first_record)['timestamp'],
+                t_fragment + header_info['frag_period'])
+    return t_fragment, t_fragment + (data_bytes // 4) / sample_rate
+
+
+def _parse_file(path, stat, tags):
+    with open(path, 'rb') as stream:
+        head = stream.read(HEADER_SIZE + 64)
+    if len(head) < HEADER_SIZE:
+        return None
+    header_info = parse_header(head)
+    config = ChannelConfig(header_info['conf_fp'], header_info['ch_hwv'])
+    inst_id, rec_id, ch_id, seq, extension = parse_file_name(path)
+    data_bytes = stat.st_size - HEADER_SIZE
+    t_start, t_end = _time_span(extension, header_info, head[HEADER_SIZE:], data_bytes)
+    row = dict((name, header_info[name]) for name in
+               ('file_type', 'sample_rate', 'ch_hwv', 'gps_lat', 'gps_long', 'gps_height', 'gps_hacc', 'gps_vacc',
+                'timing_flags', 'timing_sat_count', 'timing_stability',
+                'saturated_frames', 'missing_frames', 'min_signal', 'max_signal'))
+    row.update(path=path, rec_dir=os.path.dirname(os.path.dirname(path)),
+               inst_id=inst_id, rec_id=rec_id, ch_id=int(ch_id), seq=seq, extension=extension,
+               tag=tags.get(int(ch_id)), size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+               channel_type=config.channel_type, total_circuitry_gain=config.total_circuitry_gain,
+               data_offset=HEADER_SIZE, data_bytes=data_bytes, t_start=t_start, t_end=t_end)
+    return row
+
+
+class Catalog(object):
+    """SQLite backed catalog of the time series files below one or more
+    survey roots"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(_schema)
+
+    def update(self, root):
+        """Bring the catalog up to date with the files below root. Only new or
+        changed files (by size and mtime) are parsed, rows of files that no
+        longer exist are removed. Returns (files parsed, files removed)"""
+        root = os.path.abspath(root)
+        # Compared as a plain prefix, survey folder names are full of LIKE wildcards (_)
+        prefix = root + os.sep
+        known = dict(((row['path'], (row['size'], row['mtime_ns'])) for row in
+                      self.connection.execute("SELECT path, size, mtime_ns FROM files WHERE substr(path, 1, ?) = ?",
+                                              (len(prefix), prefix))))
+        seen = set()
+        rows = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            series_names = [name for name in file_names if is_series_file(name)]
+            if not series_names:
+                continue
+            tags = channel_tags(os.path.dirname(dir_path))
+            for name in series_names:
+                path = os.path.join(dir_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue    # Gone since the directory was listed, its row is removed below
+                seen.add(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                try:
+                    row = _parse_file(path, stat, tags)
+                except OSError:
+                    seen.discard(path)
+                    row = None
+                except (ValueError, IndexError, UnicodeDecodeError):
+                    row = None
+                if row is not None:
+                    rows.append(row)
+        removed = [(path,) for path in known if path not in seen]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files (%s) VALUES (%s)" %
+                                        (', '.join(_columns), ', '.join('?' * len(_columns))),
+                                        [[row[name] for name in _columns] for row in rows])
+            self.connection.executemany("DELETE FROM files WHERE path = ?", removed)
+        return len(rows), len(removed)
+
+    def files(self, channel_type=None, sample_rate=None, t0=None, t1=None, **equals):
+        """Rows of the files matching all the given conditions. t0/t1 select
+        files whose data overlaps [t0, t1), any other keyword is matched for
+        equality against the column of the same name (i.e. tag='E1')"""
+        conditions = []
+        params = []
+        if channel_type is not None:
+            conditions.append("channel_type = ?")
+            params.append(channel_type)
+        if sample_rate is not None:
+            conditions.append("sample_rate = ?")
+            params.append(float(sample_rate))
+        if t0 is not None:
+            conditions.append("t_end > ?")
+            params.append(t0)
+        if t1 is not None:
+            conditions.append("t_start < ?")
+            params.append(t1)
+        for name, value in equals.items():
+            if name not in _columns:
+                raise KeyError("Unknown catalog column '%s'" % name)
+            conditions.append("%s = ?" % name)
+            params.append(value)
+        query = "SELECT * FROM files"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY rec_dir, ch_id, extension, seq"
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def find(self, channel_type=None, sample_rate=None, t0=None, t1=None, **equals):
+        """Like files(), but grouped into runs of consecutive files of the same
+        channel and product. Each result holds the parameters to open a reader
+        over the run: reader (class name in TimeSeries), path (first file),
+        num_files, plus t_start, t_end, sample_rate, channel_type, tag and
+        the identifiers of the channel"""
+        runs = []
+        for row in self.files(channel_type, sample_rate, t0, t1, **equals):
+            last = runs[-1] if runs else None
+            if (last is not None and last['rec_dir'] == row['rec_dir'] and last['ch_id'] == row['ch_id'] and
+                    last['extension'] == row['extension'] and last['seq'] + last['num_files'] == row['seq']):
+                last['num_files'] += 1
+                if row['t_end'] is not None:
+                    last['t_end'] = row['t_end']
+                continue
+            runs.append({'reader': reader_class_name(row['extension']), 'path': row['path'], 'num_files': 1,
+                         'rec_dir': row['rec_dir'], 'inst_id': row['inst_id'], 'rec_id': row['rec_id'],
+                         'ch_id': row['ch_id'], 'tag': row['tag'], 'extension': row['extension'],
+                         'seq': row['seq'], 'sample_rate': row['sample_rate'],
+                         'channel_type': row['channel_type'], 't_start': row['t_start'], 't_end': row['t_end']})
+        return runs
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""Batch decoding of whole surveys of the MTU-5C Family on a process pool
+
+A survey is split into work units of (station, channel, file range), each
+decoding to at most max_unit_bytes of samples; files larger than that are split
+at sample (native: frame) boundaries. The units are decoded by a process pool
+straight into multiprocessing.shared_memory slots, so the samples are never
+pickled: only the unit description goes to the worker, and only the optional
+(small) result of function(unit, block), run in the worker on the decoded
+block, comes back. The parent hands every decoded block to consume(unit, block)
+and then reuses its slot, so memory use is bounded by the number of slots
+(twice the number of processes by default, which keeps every worker busy)
+whatever the size of the survey.
+
+With a state file every completed unit is logged as one JSON line, and a run
+started again with the same state file skips the units already done, i.e.
+after a crash. Progress is logged to the 'PhoenixGeoPy.Survey' logger and
+handed to an optional progress(done, total, unit, result) callback.
+
+Native (.bin) and continuous decimated (.td_150, .td_30) sequences are
+supported. Segmented sequences have no fixed sample layout to split on.
+
+i.e.
+    scheduler = SurveyScheduler(survey_units('/data/survey'), state_path='night.jsonl')
+    results = scheduler.run(function=block_rms)
+"""
+
+__author__ = 'Jorge Torres-Solis'
+
+import os
+import json
+import logging
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+from numpy import dtype, float32, ndarray
+from PhoenixGeoPy.Reader.Files import channel_files, channel_tags
+from PhoenixGeoPy.Reader.Headers import HEADER_SIZE
+from PhoenixGeoPy.Reader.Prefetch import scan_sequence
+from PhoenixGeoPy.Reader.TimeSeries import open_reader, reader_class_name, SEGMENTED_EXTENSIONS
+
+LOGGER = logging.getLogger('PhoenixGeoPy.Survey')
+
+# Frames decoded at a time by the workers, bounds their scratch memory
+DECODE_FRAMES = 2 ** 15
+
+
+def _file_samples(path, extension):
+    data_bytes = max(0, os.path.getsize(path) - HEADER_SIZE)
+    return data_bytes // 64 * 20 if extension == 'bin' else data_bytes // 4
+
+
+def _runs(sequence):
+    """Split a sorted list of (seq, path) into runs of consecutive files"""
+    runs = []
+    for seq, path in sequence:
+        if runs and runs[-1][-1][0] + 1 == seq:
+            runs[-1].append((seq, path))
+        else:
+            runs.append([(seq, path)])
+    return runs
+
+
+def sequence_units(rec_dir, ch_id, tag, path, max_unit_samples):
+    """Work units over the sequence of path (holes in the numbering start a
+    new run of files), each of at most max_unit_samples samples"""
+    extension = path.split('.', 1)[1]
+    if extension == 'bin':
+        max_unit_samples = max(20, max_unit_samples - max_unit_samples % 20)
+    station = os.path.basename(os.path.normpath(rec_dir))
+    units = []
+    for run in _runs(scan_sequence(path)):
+        unit = None
+        for seq, file_path in run:
+            samples = _file_samples(file_path, extension)
+            offset = 0
+            while offset < samples:
+                if unit is None or unit['count'] >= max_unit_samples:
+                    unit = {'id': "%s/%d.%s:%08X+%d" % (station, ch_id, extension, seq, offset),
+                            'station': station, 'rec_dir': rec_dir, 'ch_id': ch_id, 'tag': tag,
+                            'extension': extension, 'reader': reader_class_name(extension), 'path': file_path,
+                            'seq': seq, 'num_files': 1, 'start': offset, 'count': 0}
+                    units.append(unit)
+                unit['num_files'] = seq - unit['seq'] + 1
+                take = min(samples - offset, max_unit_samples - unit['count'])
+                unit['count'] += take
+                offset += take
+    return units
+
+
+def survey_units(root, products=('bin', 'td_150', 'td_30'), max_unit_bytes=64 * 2 ** 20, out_dtype=float32):
+    """Work units of every channel sequence of every recording below root"""
+    max_unit_samples = max(1, max_unit_bytes // dtype(out_dtype).itemsize)
+    units = []
+    for dir_path, dir_names, _ in os.walk(root):
+        dir_names.sort()
+        if not any(name.isdigit() for name in dir_names):
+            continue
+        tags = channel_tags(dir_path)
+        for extension in products:
+            if extension in SEGMENTED_EXTENSIONS:
+                raise ValueError("Segmented sequences (%s) cannot be split into work units" % extension)
+            for ch_id, path in channel_files(dir_path, extension):
+                units.extend(sequence_units(dir_path, ch_id, tags.get(ch_id, str(ch_id)), path, max_unit_samples))
+    return units
+
+
+# Shared memory slots attached by this worker process, by name
+_attached = {}
+
+
+def _detach_slots():
+    for shm in _attached.values():
+        try:
+            shm.close()
+        except BufferError:
+            pass    # A block kept by function, the memory goes away with the process
+    _attached.clear()
+
+
+def _init_worker():
+    # Run by multiprocessing when the worker process exits, which atexit hooks are not
+    Finalize(None, _detach_slots, exitpriority=0)
+
+
+def _decode_unit(unit, slot_name, out_dtype, function):
+    """Worker side: decode a unit into the shared memory slot, returns
+    (samples decoded, function(unit, block))"""
+    shm = _attached.get(slot_name)
+    if shm is None:
+        shm = _attached[slot_name] = SharedMemory(name=slot_name)
+    out = ndarray((unit['count'],), dtype=out_dtype, buffer=shm.buf)
+    reader = open_reader(unit['reader'], unit['path'], unit['num_files'])
+    filled = 0
+    try:
+        reader.cache = None     # Every sample is read once, keep the chunk cache for interactive use
+        if unit['reader'] == 'NativeReader':
+            first_frame = unit['start'] // 20
+            for frame in range(0, unit['count'] // 20, DECODE_FRAMES):
+                num_frames = min(DECODE_FRAMES, unit['count'] // 20 - frame)
+                filled += len(reader.read_frames_at(first_frame + frame, num_frames, out[frame * 20:]))
+        else:
+            for offset in range(0, unit['count'], DECODE_FRAMES * 20):
+                data = reader.samples(unit['start'] + offset, min(DECODE_FRAMES * 20, unit['count'] - offset))
+                out[offset:offset + len(data)] = data
+                filled += len(data)
+    finally:
+        reader.close()
+    result = function(unit, out[:filled]) if function is not None else None
+    del out
+    return filled, result
+
+
+class SurveyScheduler(object):
+    """Decodes work units (see survey_units) on a process pool into shared
+    memory slots"""
+
+    def __init__(self, units, processes=None, out_dtype=float32, state_path=None, progress=None, slots=None):
+        self.units = list(units)
+        self.processes = processes or os.cpu_count() or 1
+        self.out_dtype = dtype(out_dtype)
+        self.state_path = state_path
+        self.progress = progress
+        self.num_slots = slots or 2 * self.processes
+        self.results = {}   # unit id -> {'count': samples decoded, 'result': function result}
+        if state_path is not None:
+            self.load_state()
+
+    def load_state(self):
+        """Units completed by earlier runs, from the state file"""
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as state:
+            for line in state:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # Line cut short by a crash
+                self.results[entry['id']] = {'count': entry['count'], 'result': entry['result']}
+
+    def pending(self):
+        return [unit for unit in self.units if unit['id'] not in self.results]
+
+    def run(self, function=None, consume=None):
+        """Decode every pending unit. function(unit, block) runs in the worker
+        on each decoded block, and must be picklable (i.e. a module level
+        function) and return something JSON serializable when a state file is
+        used. consume(unit, block) runs in this process on each block, which
+        is only valid until consume returns. Returns the results by unit id"""
+        units = self.pending()
+        if not units:
+            return self.results
+        slot_samples = max(unit['count'] for unit in units)
+        slots = [SharedMemory(create=True, size=max(1, slot_samples * self.out_dtype.itemsize))
+                 for _ in range(min(self.num_slots, len(units)))]
+        state = open(self.state_path, 'a') if self.state_path is not None else None
+        free = list(range(len(slots)))
+        running = {}
+        queue = iter(units)
+        done = len(self.units) - len(units)
+        decoded_bytes = 0
+        start = perf_counter()
+        try:
+            with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker) as pool:
+                while True:
+                    while free:
+                        unit = next(queue, None)
+                        if unit is None:
+                            break
+                        idx = free.pop()
+                        running[pool.submit(_decode_unit, unit, slots[idx].name, self.out_dtype.str, function)] = \
+                            (unit, idx)
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        unit, idx = running.pop(future)
+                        count, result = future.result()
+                        if consume is not None:
+                            block = ndarray((count,), dtype=self.out_dtype, buffer=slots[idx].buf)
+                            consume(unit, block)
+                            del block
+                        free.append(idx)
+                        self.results[unit['id']] = {'count': count, 'result': result}
+                        if state is not None:
+                            state.write(json.dumps({'id': unit['id'], 'count': count, 'result': result}) + '\n')
+                            state.flush()
+                        done += 1
+                        decoded_bytes += count * self.out_dtype.itemsize
+                        LOGGER.info("%d/%d units, %s, %.1f MB/s", done, len(self.units), unit['id'],
+                                    decoded_bytes / 2 ** 20 / (perf_counter() - start))
+                        if self.progress is not None:
+                            self.progress(done, len(self.units), unit, result)
+        finally:
+            if state is not None:
+                state.close()
+            for shm in slots:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass    # A block kept by consume, the memory goes away with it
+                shm.unlink()
+        return self.results
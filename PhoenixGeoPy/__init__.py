@@ -1 +1 @@
-__all__ = ["Reader"]
+__all__ = ["Reader", "Processing", "Survey"]
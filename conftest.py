@@ -0,0 +1 @@
+# Lets the tests import PhoenixGeoPy from the source tree without installing it
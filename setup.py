@@ -19,9 +19,15 @@ setup(
     long_description=read('README.md'),
     python_requires = ">=3.7",
     install_requires = [
-        "numpy>=1.20.0", 
-        "matplotlib>=3.4.0"
+        "numpy>=1.20.0"
     ],
+    extras_require = {
+        # Only needed to run the examples
+        "examples": ["matplotlib>=3.4.0"]
+    },
+    entry_points = {
+        "console_scripts": ["phoenixgeopy = PhoenixGeoPy.Reader.Info:main"]
+    },
     classifiers = [
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
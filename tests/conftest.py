@@ -0,0 +1,8 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def sample_data():
+    """Directory of the sample recordings shipped with the repository"""
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Data')
@@ -0,0 +1,59 @@
+import struct
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.Archive import ArchiveReader, export_reader
+from PhoenixGeoPy.Reader.Synthetic import write_continuous, write_native, write_segmented
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, DecimatedSegmentedReader, NativeReader
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib'])
+def test_native_round_trip_across_counter_rollover(tmp_path, compression):
+    # Starts 1000 frames before the 28 bit counter wraps, with a gap after it
+    paths = write_native(str(tmp_path / 'bin'), 2, 3000, first_frame=(1 << 28) - 1000, dropped=(2500,),
+                         saturated=(10,))
+    reader = NativeReader(paths[0], num_files=2)
+    export_reader(reader, str(tmp_path / 'bin.phx'), chunk_samples=12000, compression=compression)
+    reader.close()
+    archive = ArchiveReader(str(tmp_path / 'bin.phx'))
+    reader = NativeReader(paths[0], num_files=2)
+    expected = reader.read_frames(6000)
+    assert np.array_equal(archive.read(0, len(archive)), expected)
+    assert np.array_equal(archive.read(11990, 30), expected[11990:12020])
+    # Chunk times keep increasing past the rollover and the gap
+    frame_period = 20 / reader.header_info['sample_rate']
+    for chunk in archive.chunks:
+        frame = reader.absolute_frames(chunk['first_sample'] // 20, 1)[0]
+        assert chunk['timestamp'] == reader.header_info['rec_id'] + frame * frame_period
+    assert archive.chunks[-1]['timestamp'] > archive.chunks[0]['timestamp']
+    assert [gap for chunk in archive.chunks for gap in chunk['gaps']] == [[2500 % 600 * 20, 1]]
+    assert [sat[0] for sat in archive.chunks[0]['saturations']] == [200]
+    reader.close()
+
+
+def test_decimated_round_trip(tmp_path):
+    paths = write_continuous(str(tmp_path / 'td_150'), 2, samples_per_file=1000)
+    export_reader(DecimatedContinuousReader(paths[0], num_files=2), str(tmp_path / 'td_150.phx'), chunk_samples=300)
+    archive = ArchiveReader(str(tmp_path / 'td_150.phx'))
+    assert np.array_equal(archive.read(250, 1500), DecimatedContinuousReader(paths[0], num_files=2).samples(250, 1500))
+
+    paths = write_segmented(str(tmp_path / 'td_24k'), 1, segments_per_file=3, samples_per_segment=100)
+    export_reader(DecimatedSegmentedReader(paths[0], num_files=1), str(tmp_path / 'td_24k.phx'))
+    archive = ArchiveReader(str(tmp_path / 'td_24k.phx'))
+    assert len(archive.chunks) == 3
+    reader = DecimatedSegmentedReader(paths[0], num_files=1)
+    assert np.array_equal(archive.read_chunk(1), [reader.read_record(), reader.read_record()][1])
+
+
+def test_newer_archives_are_refused(tmp_path):
+    paths = write_continuous(str(tmp_path / 'td_150'), 1, samples_per_file=100)
+    path = export_reader(DecimatedContinuousReader(paths[0]), str(tmp_path / 'td_150.phx'))
+    with open(path, 'rb') as stream:
+        data = stream.read()
+    assert data[:8] == data[-8:] == b'PHXARCv2'
+    # The same archive claiming a later version, under the version 1 magic
+    index = data[data.index(b'{"version"'):-16]
+    newer = index.replace(b'"version": 2', b'"version": 3')
+    with open(str(tmp_path / 'newer.phx'), 'wb') as stream:
+        stream.write(b'PHXARCv1' + data[8:-16 - len(index)] + newer + struct.pack('<Q', len(newer)) + b'PHXARCv1')
+    with pytest.raises(ValueError, match='version 3'):
+        ArchiveReader(str(tmp_path / 'newer.phx'))
@@ -0,0 +1,26 @@
+import os
+from PhoenixGeoPy.Reader.Synthetic import write_recording
+from PhoenixGeoPy.Survey.Catalog import Catalog
+
+
+def test_update_is_incremental_and_skips_sidecars(tmp_path):
+    rec_dir = write_recording(str(tmp_path / 'survey'), products=('bin', 'td_150'), num_files=2,
+                              native_frames_per_file=1200)
+    open(os.path.join(rec_dir, '0', '10128_60877DFD_0_00000001.bin.overview.npy'), 'wb').close()
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    assert catalog.update(str(tmp_path / 'survey')) == (20, 0)
+    assert catalog.update(str(tmp_path / 'survey')) == (0, 0)
+    assert len(catalog.find(extension='bin')) == 5
+    catalog.close()
+
+
+def test_update_keeps_rows_of_sibling_roots(tmp_path):
+    # '_' is a LIKE wildcard, s_1 must not be taken as a prefix of sx1
+    write_recording(str(tmp_path / 's_1'), num_files=1, native_frames_per_file=1200)
+    write_recording(str(tmp_path / 'sx1'), num_files=1, native_frames_per_file=1200)
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    catalog.update(str(tmp_path / 'sx1'))
+    catalog.update(str(tmp_path / 's_1'))
+    assert catalog.update(str(tmp_path / 's_1')) == (0, 0)
+    assert len(catalog.files()) == 10
+    catalog.close()
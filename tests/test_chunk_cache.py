@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.ChunkCache import ChunkCache
+from PhoenixGeoPy.Reader.Synthetic import write_native
+from PhoenixGeoPy.Reader.TimeSeries import NativeReader
+
+
+def _touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_lru_eviction_and_stats(tmp_path):
+    path = str(tmp_path / 'file')
+    with open(path, 'wb') as stream:
+        stream.write(b'data')
+    cache = ChunkCache(max_bytes=3 * 800)
+    loads = []
+
+    def loader(value):
+        def load():
+            loads.append(value)
+            return np.full(100, value, dtype=np.float64)
+        return load
+    for value in (0, 1, 2):
+        cache.get((path, value), loader(value))
+    chunk = cache.get((path, 0), loader(0))
+    assert loads == [0, 1, 2] and chunk[0] == 0
+    with pytest.raises(ValueError):
+        chunk[0] = 1
+    # Chunk 1 is now the least recently used
+    cache.get((path, 3), loader(3))
+    assert len(cache) == 3 and cache.bytes == 2400
+    cache.get((path, 1), loader(1))
+    assert loads == [0, 1, 2, 3, 1]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 5, 2)
+
+
+def test_changed_files_are_invalidated(tmp_path):
+    paths = write_native(str(tmp_path), 1, 1200)
+    cache = ChunkCache()
+    reader = NativeReader(paths[0])
+    reader.cache = cache
+    before = reader.read_frames_at(100, 50).copy()
+    assert np.array_equal(reader.read_frames_at(100, 50), before)
+    assert cache.stats()['hits'] == 1
+    # Rewritten in place, i.e. by a recording still running
+    write_native(str(tmp_path), 1, 1200, seed=1)
+    _touch(paths[0])
+    after = reader.read_frames_at(100, 50)
+    assert cache.stats()['invalidations'] == 1
+    assert not np.array_equal(after, before)
+    assert np.array_equal(after, NativeReader(paths[0]).read_frames(150)[2000:])
+    reader.close()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.Synthetic import write_continuous, write_native, write_segmented
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, DecimatedSegmentedReader, NativeReader
+
+
+def _check_chunks(reader, chunk_samples, expected, out):
+    chunks = []
+    for chunk in reader.iter_chunks(chunk_samples, out=out):
+        # Every chunk is a view of the caller's buffer
+        assert np.shares_memory(chunk, out)
+        chunks.append(chunk.copy())
+    assert [len(chunk) for chunk in chunks] == [chunk_samples] * (len(expected) // chunk_samples) + \
+        ([len(expected) % chunk_samples] if len(expected) % chunk_samples else [])
+    assert np.array_equal(np.concatenate(chunks), expected)
+    reader.close()
+
+
+def test_native_chunks(tmp_path):
+    paths = write_native(str(tmp_path), 2, 1000)
+    expected = NativeReader(paths[0], num_files=2).read_frames(2000)
+    _check_chunks(NativeReader(paths[0], num_files=2), 6000, expected, np.empty(6000))
+    # Without out, one buffer is allocated and reused
+    chunks = list(NativeReader(paths[0], num_files=2).iter_chunks(6000))
+    assert all(np.shares_memory(chunk, chunks[0]) for chunk in chunks)
+    with pytest.raises(ValueError):
+        next(NativeReader(paths[0]).iter_chunks(6010))
+
+
+def test_continuous_chunks(tmp_path):
+    paths = write_continuous(str(tmp_path), 2, samples_per_file=1000)
+    expected = DecimatedContinuousReader(paths[0], num_files=2).read_data(2000)
+    _check_chunks(DecimatedContinuousReader(paths[0], num_files=2), 300, expected, np.empty(300, dtype=np.float32))
+
+
+def test_segmented_chunks_pack_segments_back_to_back(tmp_path):
+    paths = write_segmented(str(tmp_path), 2, segments_per_file=3, samples_per_segment=250)
+    reader = DecimatedSegmentedReader(paths[0], num_files=2)
+    expected = np.concatenate([reader.read_record() for _ in range(6)])
+    reader.close()
+    _check_chunks(DecimatedSegmentedReader(paths[0], num_files=2), 400, expected, np.empty(400, dtype=np.float32))
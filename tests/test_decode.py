@@ -0,0 +1,72 @@
+import os
+import glob
+import shutil
+from struct import unpack, unpack_from
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.Headers import HEADER_SIZE
+from PhoenixGeoPy.Reader.TimeSeries import NativeReader, decode_frames
+
+
+def _native_files(sample_data):
+    return sorted(glob.glob(os.path.join(sample_data, '*', '*', '*.bin')))
+
+
+def _scalar_decode(data):
+    """Samples and footers of the frames in data, one at a time like the
+    original read_frames"""
+    samples, footers = [], []
+    for offset in range(0, len(data) - len(data) % 64, 64):
+        for sample in range(offset, offset + 60, 3):
+            samples.append(unpack(">i", data[sample:sample + 3] + b'\x00')[0])
+        footers.append(unpack_from("<I", data, offset + 60)[0])
+    return np.array(samples, dtype=np.int64), np.array(footers, dtype=np.uint32)
+
+
+def test_decode_frames_matches_scalar_decode(sample_data):
+    scratch = None
+    for path in _native_files(sample_data):
+        with open(path, 'rb') as stream:
+            data = stream.read()[HEADER_SIZE:]
+        expected, expected_footers = _scalar_decode(data)
+        # The scratch buffer of the previous file is reused, and is larger than needed for the last block
+        scratch = scratch if scratch is not None else np.zeros((len(data) // 64, 20, 4), dtype=np.uint8)
+        for start, stop in ((0, len(data)), (64 * 7, 64 * 100)):
+            samples, footers = decode_frames(data[start:stop], scratch)
+            assert np.array_equal(samples.reshape(-1), expected[start // 64 * 20:stop // 64 * 20])
+            assert np.array_equal(footers, expected_footers[start // 64:stop // 64])
+
+
+@pytest.mark.parametrize('out_dtype', [None, np.float64, np.float32])
+def test_read_frames_matches_scalar_decode(sample_data, out_dtype):
+    for path in _native_files(sample_data):
+        reader = NativeReader(path)
+        with open(path, 'rb') as stream:
+            expected = _scalar_decode(stream.read()[HEADER_SIZE:])[0] * reader._scale_factor
+        num_frames = len(expected) // 20
+        out = None if out_dtype is None else np.empty(num_frames * 20 + 40, dtype=out_dtype)
+        data = reader.read_frames(num_frames, out=out)
+        if out is not None:
+            assert np.shares_memory(data, out) and data.dtype == out_dtype
+        assert np.array_equal(data, expected.astype(out_dtype or np.float64))
+        assert len(reader.read_frames(1)) == 0
+        reader.close()
+
+
+def test_partial_last_frame(tmp_path, sample_data):
+    source = _native_files(sample_data)[0]
+    path = str(tmp_path / os.path.basename(source))
+    shutil.copy(source, path)
+    with open(path, 'rb') as stream:
+        expected = _scalar_decode(stream.read()[HEADER_SIZE:])[0]
+    # The last frame is cut short, as when the file is still being written
+    os.truncate(path, os.path.getsize(path) - 10)
+    num_frames = len(expected) // 20
+    reader = NativeReader(path)
+    assert len(reader.read_frames(num_frames)) == 0
+    reader.close()
+    reader = NativeReader(path)
+    out = np.empty(num_frames * 20)
+    data = reader.read_frames(num_frames, out=out, partial=True)
+    assert np.array_equal(data, expected[:-20] * reader._scale_factor)
+    reader.close()
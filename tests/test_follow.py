@@ -0,0 +1,21 @@
+from PhoenixGeoPy.Reader.Synthetic import write_continuous
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader
+
+
+def test_follow_blocking_returns_every_chunk(tmp_path):
+    paths = write_continuous(str(tmp_path), 2, samples_per_file=600)
+    reader = DecimatedContinuousReader(paths[0], num_files=2)
+    chunks = [len(chunk) for chunk in reader.follow_blocking(300, poll_interval=0.01, max_interval=0.02,
+                                                             timeout=0.02)]
+    assert chunks == [300, 300, 300, 300]
+    reader.close()
+
+
+def test_follow_steps_with_integer_intervals(tmp_path):
+    paths = write_continuous(str(tmp_path), 1, samples_per_file=600)
+    reader = DecimatedContinuousReader(paths[0], num_files=1)
+    steps = list(reader._follow_steps(300, None, 1, 2, 5))
+    assert [kind for kind, _ in steps] == ['data', 'data', 'wait', 'wait', 'wait']
+    assert [step for kind, step in steps if kind == 'wait'] == [1.0, 2.0, 2.0]
+    assert all(isinstance(step, float) for kind, step in steps if kind == 'wait')
+    reader.close()
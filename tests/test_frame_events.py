@@ -0,0 +1,47 @@
+import numpy as np
+from PhoenixGeoPy.Reader.Synthetic import write_native
+from PhoenixGeoPy.Reader.TimeSeries import detect_frame_events, NativeReader
+
+
+def _footers(counters, sat_codes=None):
+    footers = np.asarray(counters, dtype=np.uint32) & 0x0fffffff
+    if sat_codes is not None:
+        footers |= np.asarray(sat_codes, dtype=np.uint32) << 28
+    return footers
+
+
+def test_gaps_rollovers_and_saturations():
+    events, gaps = detect_frame_events(_footers([10, 11, 14, 15]), None, first_frame_index=100)
+    assert list(gaps) == [0, 0, 2, 0]
+    assert events.tolist() == [(102, 14, 2, 0)]
+    # Counters wrap at 28 bits
+    rollover = (1 << 28) - 2
+    events, gaps = detect_frame_events(_footers([rollover, rollover + 1, 0, 1]), rollover - 1)
+    assert not len(events) and not gaps.any()
+    events, gaps = detect_frame_events(_footers([(1 << 28) - 1, 1]), None)
+    assert events.tolist() == [(1, 1, 1, 0)]
+    # Against the frame before the block, and going backwards
+    events, gaps = detect_frame_events(_footers([10, 7]), 8)
+    assert list(gaps) == [1, -4]
+    # Saturations only when asked for
+    footers = _footers([20, 21, 22], sat_codes=[0, 3, 0])
+    assert not len(detect_frame_events(footers, None)[0])
+    events, _ = detect_frame_events(footers, None, report_hw_sat=True)
+    assert events.tolist() == [(1, 21, 0, 0x30)]
+
+
+def test_reader_events_and_callback(tmp_path):
+    paths = write_native(str(tmp_path), 2, 1000, first_frame=(1 << 28) - 1500, dropped=(700, 701, 1800),
+                         saturated=(5,))
+    calls = []
+    reader = NativeReader(paths[0], num_files=2, report_hw_sat=True,
+                          event_callback=lambda reader, events: calls.append(events.copy()))
+    reader.read_frames(1000)
+    first = reader.events
+    assert [(event['frame'], event['gap'], event['sat_count'] != 0) for event in first] == \
+        [(5, 0, True), (700, 2, False)]
+    reader.read_frames(1000)
+    # Frame 1801 of the recording, 1798th of the stream, is past the counter rollover
+    assert [(event['frame'], event['frame_count'], event['gap']) for event in reader.events] == [(1798, 301, 1)]
+    assert len(calls) == 2 and np.array_equal(calls[0], first)
+    reader.close()
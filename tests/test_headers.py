@@ -0,0 +1,58 @@
+import os
+import glob
+import numpy as np
+from PhoenixGeoPy.Reader.Headers import (CONFIG_ATTRIBUTES, HEADER_FIELDS, HEADER_SIZE, SUBHEADER_DTYPE,
+                                         SUBHEADER_SIZE, ChannelConfig, parse_header, parse_subheader, scan_headers,
+                                         update_header)
+
+# Raw fields that parse_header turns into other types
+_converted = {'inst_type': lambda raw: raw.decode('utf-8').strip(' ').strip('\x00'),
+              'inst_serial': lambda raw: raw.strip(b'\x00'),
+              'ch_hwv': lambda raw: raw.decode('utf-8').strip(' '),
+              'ch_ser': lambda raw: int(raw.decode('utf-8').strip('\x00'), 16),
+              'ch_fir': lambda raw: hex(raw),
+              'conf_fp': lambda raw: tuple(int(value) for value in raw)}
+
+
+def _series_files(sample_data):
+    return sorted(path for path in glob.glob(os.path.join(sample_data, '*', '*', '*_*.*'))
+                  if not path.endswith('.npz'))
+
+
+def test_scan_headers_matches_parse_header(tmp_path, sample_data):
+    paths = _series_files(sample_data)
+    with open(paths[0], 'rb') as stream:
+        header = stream.read(HEADER_SIZE)
+    # Saturation counts above 7 bits are stored in units of 16
+    saturated = str(tmp_path / '10128_60877DFD_0_00000001.bin')
+    with open(saturated, 'wb') as stream:
+        stream.write(update_header(header, saturated_frames=300))
+    short = str(tmp_path / '10128_60877DFD_0_00000002.bin')
+    with open(short, 'wb') as stream:
+        stream.write(header[:100])
+    paths += [saturated, short]
+    scanned = scan_headers(paths)
+    assert list(scanned.path) == paths[:-1]
+    for row in scanned:
+        with open(row['path'], 'rb') as stream:
+            info = parse_header(stream.read(HEADER_SIZE))
+        for name in HEADER_FIELDS:
+            assert _converted.get(name, lambda raw: raw)(row[name]) == info[name], (row['path'], name)
+        assert row['sample_rate'] == info['sample_rate']
+        assert row['frame_bytes'] == info['frame_size'] & 0x0ffffff
+        config = ChannelConfig(info['conf_fp'], info['ch_hwv'])
+        for name in [name for name in CONFIG_ATTRIBUTES if name in scanned.dtype.names]:
+            value = getattr(config, name)
+            assert np.isnan(row[name]) if value is None else row[name] == value, (row['path'], name)
+    assert scanned[-1]['saturated_frames'] == parse_header(update_header(header, saturated_frames=300))[
+        'saturated_frames'] == 304
+
+
+def test_subheader_dtype_matches_parse_subheader(sample_data):
+    path = glob.glob(os.path.join(sample_data, '*', '0', '*_00000001.td_24k'))[0]
+    with open(path, 'rb') as stream:
+        stream.seek(HEADER_SIZE)
+        data = stream.read(SUBHEADER_SIZE)
+    record = np.frombuffer(data, dtype=SUBHEADER_DTYPE)[0]
+    for name, value in parse_subheader(data).items():
+        assert record[name] == value
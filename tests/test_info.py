@@ -0,0 +1,24 @@
+import os
+import sys
+import subprocess
+from PhoenixGeoPy.Reader.Synthetic import write_continuous
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code, *args):
+    env = dict(os.environ, PYTHONPATH=_ROOT)
+    return subprocess.run([sys.executable, '-c', code] + list(args), env=env, cwd=_ROOT, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+def test_import_does_not_load_numpy():
+    _run("import sys, PhoenixGeoPy.Reader.Info; assert 'numpy' not in sys.modules, sorted(sys.modules)")
+
+
+def test_info_fields_without_numpy(tmp_path):
+    path = write_continuous(str(tmp_path), 1, samples_per_file=1500)[0]
+    out = _run("import sys; from PhoenixGeoPy.Reader.Info import main; status = main(sys.argv[1:]); "
+               "assert 'numpy' not in sys.modules; sys.exit(status)",
+               'info', path, '--field', 'sample_rate', '--field', 'samples', '--field', 'duration')
+    assert out.split() == ['150', '1500', '10']
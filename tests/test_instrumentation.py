@@ -0,0 +1,17 @@
+from PhoenixGeoPy.Reader.Synthetic import write_segmented
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedSegmentedReader
+
+
+def test_segments_counted_by_single_and_batched_reads(tmp_path):
+    paths = write_segmented(str(tmp_path), 2, segments_per_file=4, samples_per_segment=100)
+    reader = DecimatedSegmentedReader(paths[0], num_files=2)
+    metrics = reader.enable_metrics()
+    reader.read_record()
+    data, _, _ = reader.read_records(5)
+    assert data.shape == (5, 100)
+    assert metrics.snapshot()['segments_read'] == 6
+    reader.disable_metrics()
+    data, _, _ = reader.read_records(5)
+    assert data.shape == (2, 100)
+    assert metrics.snapshot()['segments_read'] == 6
+    reader.close()
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.ChunkCache import ChunkCache
+from PhoenixGeoPy.Reader.Synthetic import write_continuous, write_native
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, NativeReader
+
+
+def test_native_random_access_across_files(tmp_path):
+    paths = write_native(str(tmp_path), 3, 1000)
+    streamed = NativeReader(paths[0], num_files=3).read_frames(3000)
+    reader = NativeReader(paths[0], num_files=3)
+    mapped = reader.map_frames()
+    assert len(mapped) == reader.frame_count() == 3000
+    assert mapped.locate(999) == (0, 999) and mapped.locate(1000) == (1, 0) and mapped.locate(2999) == (2, 999)
+    with pytest.raises(IndexError):
+        mapped.locate(3000)
+    # Zero-copy within a file, a copy across files
+    assert np.shares_memory(mapped.records(10, 20), mapped.maps[0])
+    assert np.array_equal(mapped.records(990, 20), np.concatenate((mapped.maps[0][990:], mapped.maps[1][:10])))
+    assert np.array_equal(mapped.take([5, 1500, 2999]), np.array([mapped.maps[0][5], mapped.maps[1][500],
+                                                                  mapped.maps[2][999]]))
+    for cache in (None, ChunkCache()):
+        reader.cache = cache
+        assert np.array_equal(reader.read_frames_at(990, 30), streamed[990 * 20:1020 * 20])
+        assert np.array_equal(reader.read_frames_at(1995, 1010), streamed[1995 * 20:])
+        assert np.array_equal(reader.read_samples_at(19995, 30), streamed[19995:20025])
+    # Streamed reads carry on from a random position
+    reader.seek_frame(1998)
+    assert np.array_equal(reader.read_frames(4), streamed[1998 * 20:2002 * 20])
+    reader.close()
+
+
+def test_continuous_random_access_skips_empty_files(tmp_path):
+    paths = write_continuous(str(tmp_path), 3, samples_per_file=500)
+    streamed = DecimatedContinuousReader(paths[0], num_files=3).read_data(1500)
+    # The middle file holds only its header
+    os.truncate(paths[1], 128)
+    reader = DecimatedContinuousReader(paths[0], num_files=3)
+    expected = np.concatenate((streamed[:500], streamed[1000:]))
+    mapped = reader.map_samples()
+    assert mapped.positions == [0, 2] and reader.sample_count() == 1000
+    assert np.array_equal(reader.samples(490, 20), expected[490:510])
+    reader.seek_sample(495)
+    assert reader.seq == reader.first_seq
+    reader.seek_sample(505)
+    assert reader.seq == reader.first_seq + 2
+    assert np.array_equal(reader.read_data(10), expected[505:515])
+    reader.close()
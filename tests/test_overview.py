@@ -0,0 +1,62 @@
+import os
+import glob
+import numpy as np
+from PhoenixGeoPy.Reader.Synthetic import write_continuous
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, NativeReader
+
+
+def _native(sample_data):
+    return NativeReader(glob.glob(os.path.join(sample_data, '*', '0', '*.bin'))[0])
+
+
+def test_overview_is_kept_per_arguments(tmp_path, sample_data):
+    reader = _native(sample_data)
+    path = str(tmp_path / 'pyramid')
+    overview = reader.overview(overview_path=path)
+    assert reader.overview(overview_path=path) is overview
+    coarser = reader.overview(factor=10, overview_path=path + '10')
+    assert coarser.factor == 10 and coarser.block_samples(1) == 640
+    assert reader.overview(base_block=32, overview_path=path + '32').block_samples(0) == 32
+    assert reader.overview(overview_path=path).factor == 4
+    reader.close()
+
+
+def test_query_against_brute_force(tmp_path, sample_data):
+    reader = _native(sample_data)
+    overview = reader.overview(overview_path=str(tmp_path / 'pyramid'))
+    data = reader.read_samples_at(0, reader.frame_count() * 20)
+    assert overview.num_samples == len(data)
+    t0 = overview.start_time + 0.25
+    t1 = overview.start_time + 2
+    times, low, high, mean = overview.query(t0, t1, width=100)
+    # The coarsest level with at least 100 points over the range
+    block = overview.block_samples(1)
+    assert 100 <= len(times) < 100 * overview.factor + 2
+    starts = np.round((times - overview.start_time) * overview.sample_rate).astype(int)
+    assert np.all(np.diff(starts) == block)
+    for start, value_min, value_max, value_mean in zip(starts, low, high, mean):
+        blocked = data[start:start + block]
+        assert value_min == np.float32(blocked.min()) and value_max == np.float32(blocked.max())
+        assert np.isclose(value_mean, blocked.mean(), rtol=1e-5, atol=1e-6)
+    # Raw samples once level 0 is too coarse
+    times, low, high, mean = overview.query(t0, t0 + 0.01, width=1000)
+    assert np.array_equal(low, data[6000:6000 + 240])
+    reader.close()
+
+
+def test_stale_sidecar_is_rebuilt(tmp_path):
+    paths = write_continuous(str(tmp_path / 'td_150'), 2, samples_per_file=3000)
+    pyramid = str(tmp_path / 'pyramid')
+    before = DecimatedContinuousReader(paths[0], num_files=2).overview(base_block=10, overview_path=pyramid)
+    assert os.path.exists(pyramid + '.npy') and os.path.exists(pyramid + '.npz')
+    # The same sidecar is loaded while the files are unchanged
+    reloaded = DecimatedContinuousReader(paths[0], num_files=2).overview(base_block=10, overview_path=pyramid)
+    assert np.array_equal(reloaded.levels[0], before.levels[0])
+    write_continuous(str(tmp_path / 'td_150'), 2, samples_per_file=3000, seed=1)
+    stat = os.stat(paths[1])
+    os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    reader = DecimatedContinuousReader(paths[0], num_files=2)
+    after = reader.overview(base_block=10, overview_path=pyramid)
+    data = reader.samples(0, 6000)
+    assert not np.array_equal(after.levels[0], before.levels[0])
+    assert np.array_equal(after.levels[0]['max'], np.asarray(data).reshape(-1, 10).max(axis=1))
@@ -0,0 +1,36 @@
+import os
+import logging
+import numpy as np
+from PhoenixGeoPy.Reader.Synthetic import write_native
+from PhoenixGeoPy.Reader.TimeSeries import NativeReader
+
+
+def test_read_ahead_matches_iter_chunks_and_restores_prefetch(tmp_path):
+    paths = write_native(str(tmp_path), 3, 1000)
+    expected = np.concatenate([chunk.copy() for chunk in NativeReader(paths[0], num_files=3).iter_chunks(6000)])
+    reader = NativeReader(paths[0], num_files=3)
+    assert np.array_equal(np.concatenate([chunk.copy() for chunk in reader.read_ahead(6000)]), expected)
+    assert reader.prefetcher is None
+    # Left enabled when the caller had enabled it
+    reader = NativeReader(paths[0], num_files=3)
+    prefetcher = reader.enable_prefetch()
+    assert np.array_equal(np.concatenate([chunk.copy() for chunk in reader.read_ahead(6000)]), expected)
+    assert reader.prefetcher is prefetcher
+    reader.close()
+
+
+def test_discarded_prefetch_errors_are_dropped(tmp_path, caplog):
+    paths = write_native(str(tmp_path), 3, 1000)
+    # The third file cannot be opened
+    os.remove(paths[2])
+    os.mkdir(paths[2])
+    reader = NativeReader(paths[0], num_files=3)
+    prefetcher = reader.enable_prefetch()
+    prefetcher.prepare(2)
+    failed = prefetcher._pending[1]
+    assert failed.exception() is not None
+    with caplog.at_level(logging.DEBUG):
+        prefetcher.prepare(1)
+    assert len(reader.read_frames(2000)) == 40000
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    reader.close()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.Files import channel_files
+from PhoenixGeoPy.Reader.Recording import Recording, RecordingArray
+from PhoenixGeoPy.Reader.Synthetic import write_recording
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, NativeReader
+
+
+def _channels(rec_dir, extension, length):
+    reader_class = NativeReader if extension == 'bin' else DecimatedContinuousReader
+    rows = []
+    for _, path in channel_files(rec_dir, extension):
+        reader = reader_class(path, num_files=2)
+        rows.append(reader.read_frames(length // 20) if extension == 'bin' else reader.read_data(length))
+        reader.close()
+    return np.array(rows)
+
+
+@pytest.mark.parametrize('extension, block, length', [('bin', 1000, 2400 * 20), ('td_150', 50000, 2 * 54000)])
+def test_blocks_keep_the_tail_of_the_recording(tmp_path, extension, block, length):
+    rec_dir = write_recording(str(tmp_path), products=(extension,), num_files=2, native_frames_per_file=1200)
+    recording = Recording(rec_dir, extension, num_files=2)
+    blocks = []
+    while True:
+        data = recording.read_frames(block) if extension == 'bin' else recording.read_data(block)
+        if not data.shape[-1]:
+            break
+        blocks.append(data)
+    recording.close()
+    # The last block is short rather than dropped
+    assert blocks[-1].shape[-1] < blocks[0].shape[-1]
+    assert np.array_equal(np.concatenate(blocks, axis=1), _channels(rec_dir, extension, length))
+
+
+def test_array_slicing_matches_a_plain_read(tmp_path):
+    rec_dir = write_recording(str(tmp_path), products=('bin',), num_files=2, native_frames_per_file=600)
+    plain = _channels(rec_dir, 'bin', 1200 * 20)
+    rec = RecordingArray(rec_dir)
+    assert rec.shape == (5, 24000) and rec.channel_names == ['H2', 'E1', 'H1', 'H3', 'E2']
+    assert np.array_equal(np.asarray(rec), plain)
+    # Channels by tag, id string or position, samples by index across the file boundary
+    assert np.array_equal(rec['E1'].read(), plain[1])
+    assert np.array_equal(rec['3', 11990:12010].read(), plain[3, 11990:12010])
+    assert rec[1, 12345].read() == plain[1, 12345]
+    assert np.array_equal(rec[['E2', 'H2'], 100:200].read(), plain[[4, 0], 100:200])
+    # Strided, within and beyond a frame, and reversed
+    for step in (7, 150, -3):
+        assert np.array_equal(rec[1:3, ::step].read(), plain[1:3, ::step])
+    assert np.array_equal(rec[:, 5000:9000][::2, 10:400:25].read(), plain[:, 5000:9000][::2, 10:400:25])
+    # Epoch time bounds
+    t0 = rec.start_time + 0.25
+    assert np.array_equal(rec['H1', t0:t0 + 0.5].read(), plain[2, 6000:18000])
+    rec.close()
+
+
+def test_continuous_array_slicing(tmp_path):
+    rec_dir = write_recording(str(tmp_path), products=('td_150',), num_files=2, channel_tags=('E1', 'E2'))
+    plain = _channels(rec_dir, 'td_150', 2 * 54000)
+    rec = RecordingArray(rec_dir, 'td_150')
+    assert rec.dtype == np.float32 and rec.shape == plain.shape
+    assert np.array_equal(rec[:, 53990:54010].read(), plain[:, 53990:54010])
+    assert np.array_equal(rec['E2', ::1000].read(), plain[1, ::1000])
+    rec.close()
@@ -0,0 +1,44 @@
+import numpy as np
+from PhoenixGeoPy.Reader.Synthetic import write_recording
+from PhoenixGeoPy.Reader.TimeSeries import open_reader
+from PhoenixGeoPy.Survey.Scheduler import SurveyScheduler, survey_units
+
+
+def block_sum(unit, block):
+    return float(block.astype(np.float64).sum())
+
+
+def _expected(unit):
+    reader = open_reader(unit['reader'], unit['path'], unit['num_files'])
+    if unit['reader'] == 'NativeReader':
+        data = reader.read_samples_at(unit['start'], unit['count'])
+    else:
+        data = reader.samples(unit['start'], unit['count'])
+    reader.close()
+    return np.asarray(data, dtype=np.float32)
+
+
+def test_resume_skips_completed_units(tmp_path):
+    write_recording(str(tmp_path / 'survey'), products=('bin', 'td_150'), num_files=2, channel_tags=('H2', 'E1'),
+                    native_frames_per_file=1200)
+    units = survey_units(str(tmp_path / 'survey'), max_unit_bytes=40000)
+    state_path = str(tmp_path / 'state.jsonl')
+    blocks = {}
+    results = SurveyScheduler(units, processes=2, state_path=state_path).run(
+        function=block_sum, consume=lambda unit, block: blocks.__setitem__(unit['id'], block.copy()))
+    assert len(results) == len(units) == len(blocks)
+    for unit in units:
+        assert np.array_equal(blocks[unit['id']], _expected(unit))
+        assert results[unit['id']]['count'] == unit['count']
+
+    # A crash after three units, with the fourth line half written
+    with open(state_path) as state:
+        lines = state.readlines()
+    with open(state_path, 'w') as state:
+        state.writelines(lines[:3] + [lines[3][:10]])
+    scheduler = SurveyScheduler(units, processes=2, state_path=state_path)
+    assert len(scheduler.pending()) == len(units) - 3
+    resumed = []
+    results_again = scheduler.run(function=block_sum, consume=lambda unit, block: resumed.append(unit['id']))
+    assert len(resumed) == len(units) - 3
+    assert results_again == results
@@ -0,0 +1,54 @@
+import os
+import numpy as np
+from PhoenixGeoPy.Reader.SegmentIndex import SegmentIndex
+from PhoenixGeoPy.Reader.Synthetic import write_segmented
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedSegmentedReader
+
+
+def _streamed(path, num_files):
+    reader = DecimatedSegmentedReader(path, num_files=num_files)
+    records = []
+    while True:
+        data = reader.read_record()
+        if not len(data):
+            break
+        records.append((reader.subheader['timestamp'], data))
+    reader.close()
+    return records
+
+
+def test_index_matches_streamed_segments(tmp_path):
+    paths = write_segmented(str(tmp_path), 2, segments_per_file=3, samples_per_segment=100)
+    reader = DecimatedSegmentedReader(paths[0], num_files=2)
+    index = reader.segment_index()
+    assert os.path.exists(paths[0] + '.segidx.npz')
+    records = _streamed(paths[0], 2)
+    assert list(index.segments['timestamp']) == [timestamp for timestamp, _ in records]
+    assert list(index.segments['file']) == [0, 0, 0, 1, 1, 1]
+    for segment, (timestamp, data) in enumerate(records):
+        assert np.array_equal(reader.read_segment(segment), data)
+        assert reader.subheader['timestamp'] == timestamp
+    reader.close()
+
+
+def test_sidecar_is_loaded_until_stale(tmp_path, monkeypatch):
+    paths = write_segmented(str(tmp_path), 2, segments_per_file=3, samples_per_segment=100)
+    built = SegmentIndex(paths)
+    calls = []
+    original_build = SegmentIndex.build
+
+    def counting_build(index):
+        calls.append(index.paths)
+        original_build(index)
+    monkeypatch.setattr(SegmentIndex, 'build', counting_build)
+    loaded = SegmentIndex(paths)
+    assert not calls and np.array_equal(loaded.segments, built.segments)
+    # A sidecar of other files is not used
+    assert len(SegmentIndex(paths[:1], index_path=paths[0] + '.segidx.npz')) == 3 and len(calls) == 1
+    # Files rewritten with more segments
+    paths = write_segmented(str(tmp_path), 2, segments_per_file=5, samples_per_segment=100)
+    rebuilt = SegmentIndex(paths)
+    assert len(calls) == 2 and len(rebuilt) == 10
+    assert list(rebuilt.segments['file']) == [0] * 5 + [1] * 5
+    # Its sidecar was refreshed
+    assert len(SegmentIndex(paths)) == 10 and len(calls) == 2
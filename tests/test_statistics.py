@@ -0,0 +1,18 @@
+from PhoenixGeoPy.Processing.Statistics import recording_jobs, survey_reports
+from PhoenixGeoPy.Reader.Synthetic import write_recording
+
+
+def test_recording_jobs_by_channel_then_product(tmp_path):
+    rec_dir = write_recording(str(tmp_path), products=('bin', 'td_150'), num_files=2, channel_tags=('H2', 'E1'),
+                              native_frames_per_file=1200)
+    jobs = recording_jobs(rec_dir, products=('td_150', 'bin'))
+    assert [(job['ch_id'], job['tag'], job['extension'], job['num_files']) for job in jobs] == \
+        [(0, 'H2', 'td_150', 2), (0, 'H2', 'bin', 2), (1, 'E1', 'td_150', 2), (1, 'E1', 'bin', 2)]
+
+
+def test_survey_report_counts_and_recmeta(tmp_path):
+    write_recording(str(tmp_path), products=('bin',), num_files=2, channel_tags=('H2', 'E1'),
+                    native_frames_per_file=1200)
+    report, = survey_reports(str(tmp_path), products=('bin',), processes=1)
+    assert [channel['stats']['count'] for channel in report['channels']] == [48000, 48000]
+    assert report['channels'][1]['recmeta']['sampleRate'] == 24000
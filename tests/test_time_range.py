@@ -0,0 +1,44 @@
+import numpy as np
+from PhoenixGeoPy.Reader.Synthetic import write_continuous, write_native
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, NativeReader
+
+
+def test_native_window_across_missing_frames(tmp_path):
+    # Frames 500 to 509 of the recording are missing
+    paths = write_native(str(tmp_path), 2, 1000, dropped=range(500, 510))
+    streamed = NativeReader(paths[0], num_files=2).read_frames(2000)
+    reader = NativeReader(paths[0], num_files=2)
+    rate = float(reader.header_info['sample_rate'])
+    start = reader.header_info['rec_id'] + int(reader.absolute_frames(0, 1)[0]) * 20 / rate
+    t0, t1 = start + (490 * 20 + 5) / rate, start + 520 * 20 / rate
+    data, timestamps = reader.read_time_range(t0, t1)
+    # Frames 490 to 499, then 510 to 519 which are the 500th to 509th in the files
+    assert np.array_equal(data, streamed[490 * 20 + 5:510 * 20])
+    assert len(timestamps) == len(data) and timestamps[0] >= t0 and timestamps[-1] < t1
+    # Epoch times as floats are good to a microsecond
+    assert np.isclose(timestamps[195] - timestamps[194], 201 / rate, rtol=0, atol=1e-6)
+    assert reader.events.tolist() == [(500, 510, 10, 0)]
+    assert not len(reader.read_time_range(start + 501 * 20 / rate, start + 509 * 20 / rate)[0])
+    reader.close()
+
+    reader = NativeReader(paths[0], num_files=2, fill_missing='nan')
+    data, timestamps = reader.read_time_range(t0, t1)
+    assert len(data) == 30 * 20 - 5 and np.isnan(data[195:395]).all()
+    assert np.array_equal(data[395:], streamed[500 * 20:510 * 20])
+    assert np.allclose(np.diff(timestamps), 1 / rate, rtol=0, atol=1e-6)
+    reader.close()
+
+
+def test_continuous_window_across_files(tmp_path):
+    # 500 samples per 360 s fragment, so the files are far apart in time
+    paths = write_continuous(str(tmp_path), 2, samples_per_file=500)
+    streamed = DecimatedContinuousReader(paths[0], num_files=2).read_data(1000)
+    reader = DecimatedContinuousReader(paths[0], num_files=2)
+    starts = reader.file_start_times()
+    assert starts[1] - starts[0] == 360
+    data, timestamps = reader.read_time_range(starts[0] + 3, starts[1] + 1)
+    assert np.array_equal(data, np.concatenate((streamed[450:500], streamed[500:650])))
+    assert np.allclose(timestamps[:50], starts[0] + np.arange(450, 500) / 150.0)
+    assert np.allclose(timestamps[50:], starts[1] + np.arange(150) / 150.0)
+    assert not len(reader.read_time_range(starts[0] + 10, starts[0] + 20)[0])
+    reader.close()
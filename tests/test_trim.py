@@ -0,0 +1,95 @@
+import os
+import glob
+import errno
+import warnings
+import numpy as np
+import pytest
+from PhoenixGeoPy.Reader.Files import sequence_length
+from PhoenixGeoPy.Reader.Headers import HEADER_SIZE, parse_header
+from PhoenixGeoPy.Reader.Synthetic import write_continuous, write_native, write_segmented
+from PhoenixGeoPy.Reader.TimeSeries import DecimatedContinuousReader, DecimatedSegmentedReader, NativeReader
+from PhoenixGeoPy.Reader.Trim import copy_bytes, trim_sequence
+
+
+def _open(cls, path):
+    return cls(path, num_files=sequence_length(path))
+
+
+@pytest.mark.parametrize('renumber', [False, True])
+def test_continuous_cut_reads_back_by_time(tmp_path, caplog, renumber):
+    paths = write_continuous(str(tmp_path / 'in'), 3, samples_per_file=54000)
+    source = _open(DecimatedContinuousReader, paths[0])
+    start = source.file_start_times()[0]
+    t0, t1 = start + 400, start + 800
+    written = trim_sequence(paths[0], t0, t1, str(tmp_path / 'out'), renumber=renumber)
+    # Asking to renumber them is not ignored silently
+    assert ('not renumbered' in caplog.text) == renumber
+    # The cut starts with the file holding t0, which keeps its number
+    assert [os.path.basename(path) for path in written] == [os.path.basename(path) for path in paths[1:]]
+    trimmed = _open(DecimatedContinuousReader, written[0])
+    expected, expected_times = source.read_time_range(t0, t1)
+    data, times = trimmed.read_time_range(t0, t1)
+    assert len(data) == 400 * 150
+    assert np.array_equal(data, expected) and np.array_equal(times, expected_times)
+    assert os.path.getsize(written[-1]) == 128 + 80 * 150 * 4
+
+
+@pytest.mark.parametrize('renumber', [False, True])
+def test_native_cut_reads_back_by_time(tmp_path, renumber):
+    paths = write_native(str(tmp_path / 'in'), 3, 2400, first_frame=(1 << 28) - 3000)
+    source = _open(NativeReader, paths[0])
+    start = source.header_info['rec_id'] + source.absolute_frames(0, 1)[0] * 20 / 24000.0
+    # 2 s per file, the cut spans the second and third files
+    t0, t1 = start + 2.5, start + 5.25
+    written = trim_sequence(paths[0], t0, t1, str(tmp_path / 'out'), renumber=renumber)
+    assert len(written) == 2
+    assert written[0].endswith('_00000001.bin' if renumber else '_00000002.bin')
+    data, times = _open(NativeReader, written[0]).read_time_range(t0, t1)
+    expected, expected_times = source.read_time_range(t0, t1)
+    assert len(data) == 2.75 * 24000
+    assert np.array_equal(data, expected) and np.array_equal(times, expected_times)
+
+
+def test_segmented_cut_keeps_whole_segments(tmp_path):
+    paths = write_segmented(str(tmp_path / 'in'), 2, segments_per_file=4, samples_per_segment=200)
+    source = _open(DecimatedSegmentedReader, paths[0])
+    first = source.segment_index().segments['timestamp'][0]
+    t0, t1 = first + 45, first + 150
+    written = trim_sequence(paths[0], t0, t1, str(tmp_path / 'out'), renumber=True)
+    trimmed = _open(DecimatedSegmentedReader, written[0])
+    selected = list(source.segments_between(t0, t1))
+    assert 0 < len(selected) < len(source.segment_index())
+    assert len(trimmed.segment_index()) == len(selected)
+    for position, segment in enumerate(selected):
+        assert np.array_equal(trimmed.read_segment(position), source.read_segment(segment))
+
+
+def test_segmented_cut_header_fields_on_sample_data(tmp_path, sample_data):
+    path = sorted(glob.glob(os.path.join(sample_data, '*', '0', '*.td_24k')))[0]
+    source = _open(DecimatedSegmentedReader, path)
+    segments = source.segment_index().segments
+    # Segments 3 to 5, after the subheader counters stopped moving
+    t0, t1 = segments['timestamp'][3], segments['timestamp'][6]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        written = trim_sequence(path, t0, t1, str(tmp_path / 'out'))
+    with open(written[0], 'rb') as stream:
+        header = parse_header(stream.read(HEADER_SIZE))
+    payload = np.concatenate([source.segment_index().read(idx) for idx in (3, 4, 5)])
+    signal_scale = 2 * source.total_circuitry_gain
+    assert header['missing_frames'] == 0 and header['saturated_frames'] == 0
+    assert np.isfinite(header['min_signal']) and np.isfinite(header['max_signal'])
+    assert np.isclose(header['min_signal'], payload.min() * signal_scale)
+    assert np.isclose(header['max_signal'], payload.max() * signal_scale)
+
+
+def test_copy_bytes_raises_real_errors(tmp_path):
+    source = tmp_path / 'source'
+    source.write_bytes(bytes(range(256)) * 16)
+    with open(source, 'rb') as src, open(tmp_path / 'copy', 'wb') as dst:
+        copy_bytes(src.fileno(), dst.fileno(), 100, 1000)
+    assert (tmp_path / 'copy').read_bytes() == source.read_bytes()[100:1100]
+    with open(source, 'rb') as src, open(tmp_path / 'copy', 'rb') as read_only:
+        with pytest.raises(OSError) as error:
+            copy_bytes(src.fileno(), read_only.fileno(), 0, 1000)
+    assert error.value.errno == errno.EBADF